@@ -20,6 +20,8 @@ Starting point for routing EC2 requests.
 
 """
 
+import hashlib
+import socket
 import urlparse
 
 from eventlet.green import httplib
@@ -58,6 +60,15 @@ ec2_opts = [
     cfg.StrOpt('keystone_ec2_url',
                default='http://localhost:5000/v2.0/ec2tokens',
                help='URL to get token from ec2 request.'),
+    cfg.IntOpt('keystone_ec2_pool_size',
+               default=10,
+               help='Number of idle connections to keystone_ec2_url kept '
+                    'open for reuse, 0 opens a connection per request'),
+    cfg.IntOpt('keystone_ec2_cache_ttl',
+               default=5,
+               help='Number of seconds a successful keystone validation of '
+                    'an identically signed ec2 request is reused for, '
+                    '0 disables the cache'),
     cfg.BoolOpt('ec2_private_dns_show_ip',
                 default=False,
                 help='Return the IP address as private dns hostname in '
@@ -190,8 +201,68 @@ class Lockout(wsgi.Middleware):
         return res
 
 
+class KeystoneConnectionPool(object):
+    """Keeps idle HTTP(S) connections to a keystone endpoint for reuse."""
+
+    def __init__(self, url, size):
+        self.url = url
+        self.size = size
+        parsed = urlparse.urlparse(url)
+        self.scheme = parsed.scheme
+        self.netloc = parsed.netloc
+        self.path = parsed.path
+        self._idle = []
+
+    def _connect(self):
+        if self.scheme == "http":
+            return httplib.HTTPConnection(self.netloc)
+        return httplib.HTTPSConnection(self.netloc)
+
+    def post(self, body, headers):
+        """POST body to the endpoint, returning the response and its data."""
+        while self._idle:
+            conn = self._idle.pop()
+            try:
+                return self._post(conn, body, headers)
+            except (httplib.HTTPException, socket.error):
+                # NOTE: The server may close idle connections at any
+                # time, only a fresh connection failing is an error.
+                conn.close()
+        return self._post(self._connect(), body, headers)
+
+    def _post(self, conn, body, headers):
+        try:
+            conn.request('POST', self.path, body=body, headers=headers)
+            response = conn.getresponse()
+            data = response.read()
+        except Exception:
+            conn.close()
+            raise
+        if response.will_close or len(self._idle) >= self.size:
+            conn.close()
+        else:
+            self._idle.append(conn)
+        return response, data
+
+
 class EC2KeystoneAuth(wsgi.Middleware):
-    """Authenticate an EC2 request with keystone and convert to context."""
+    """Authenticate an EC2 request with keystone and convert to context.
+
+    Successful validations are remembered for keystone_ec2_cache_ttl
+    seconds, keyed by the complete signed credentials, so only an
+    identically signed request can reuse one.
+    """
+
+    def __init__(self, application):
+        self.mc = memorycache.get_client()
+        self._pool = None
+        super(EC2KeystoneAuth, self).__init__(application)
+
+    def _get_pool(self):
+        if self._pool is None or self._pool.url != CONF.keystone_ec2_url:
+            self._pool = KeystoneConnectionPool(CONF.keystone_ec2_url,
+                                                CONF.keystone_ec2_pool_size)
+        return self._pool
 
     @webob.dec.wsgify(RequestClass=wsgi.Request)
     def __call__(self, req):
@@ -225,22 +296,21 @@ class EC2KeystoneAuth(wsgi.Middleware):
         creds_json = jsonutils.dumps(creds)
         headers = {'Content-Type': 'application/json'}
 
-        o = urlparse.urlparse(CONF.keystone_ec2_url)
-        if o.scheme == "http":
-            conn = httplib.HTTPConnection(o.netloc)
-        else:
-            conn = httplib.HTTPSConnection(o.netloc)
-        conn.request('POST', o.path, body=creds_json, headers=headers)
-        response = conn.getresponse()
-        data = response.read()
-        if response.status != 200:
-            if response.status == 401:
-                msg = response.reason
-            else:
-                msg = _("Failure communicating with keystone")
-            return ec2_error(req, request_id, "Unauthorized", msg)
+        cache_key = None
+        data = None
+        if CONF.keystone_ec2_cache_ttl > 0:
+            cache_key = 'ec2auth-%s' % hashlib.sha1(creds_json).hexdigest()
+            data = self.mc.get(cache_key)
+        cached = data is not None
+        if not cached:
+            response, data = self._get_pool().post(creds_json, headers)
+            if response.status != 200:
+                if response.status == 401:
+                    msg = response.reason
+                else:
+                    msg = _("Failure communicating with keystone")
+                return ec2_error(req, request_id, "Unauthorized", msg)
         result = jsonutils.loads(data)
-        conn.close()
 
         try:
             token_id = result['access']['token']['id']
@@ -255,6 +325,9 @@ class EC2KeystoneAuth(wsgi.Middleware):
             msg = _("Failure communicating with keystone")
             return ec2_error(req, request_id, "Unauthorized", msg)
 
+        if cache_key and not cached:
+            self.mc.set(cache_key, data, time=CONF.keystone_ec2_cache_ttl)
+
         remote_address = req.remote_addr
         if CONF.use_forwarded_for:
             remote_address = req.headers.get('X-Forwarded-For',
@@ -43,6 +43,7 @@ from nova import network
 from nova.openstack.common import cfg
 from nova.openstack.common import log as logging
 from nova.openstack.common import timeutils
+from nova.openstack.common import uuidutils
 from nova import quota
 from nova import servicegroup
 from nova import utils
@@ -371,6 +372,11 @@ class CloudController(object):
         else:
             snapshots = self.volume_api.get_all_snapshots(context)
 
+        self._prefetch_ec2_ids(context,
+                               volume_ids=[snapshot['volume_id']
+                                           for snapshot in snapshots],
+                               snapshot_ids=[snapshot['id']
+                                             for snapshot in snapshots])
         formatted_snapshots = []
         for s in snapshots:
             formatted = self._format_snapshot(context, s)
@@ -795,9 +801,27 @@ class CloudController(object):
                 volumes.append(volume)
         else:
             volumes = self.volume_api.get_all(context)
+        self._prefetch_ec2_ids(context,
+                               volume_ids=[v['id'] for v in volumes],
+                               snapshot_ids=[v.get('snapshot_id')
+                                             for v in volumes])
         volumes = [self._format_volume(context, v) for v in volumes]
         return {'volumeSet': volumes}
 
+    def _prefetch_ec2_ids(self, context, volume_ids, snapshot_ids):
+        """Look up the ec2 ids of a whole listing with one query per kind.
+
+        id_to_ec2_vol_id and id_to_ec2_snap_id then find them in the id
+        mapping cache instead of querying once per volume or snapshot.
+        """
+        ctxt = context.elevated()
+        ec2utils.get_int_ids_from_volume_uuids(ctxt,
+                [volume_id for volume_id in volume_ids
+                 if uuidutils.is_uuid_like(volume_id)])
+        ec2utils.get_int_ids_from_snapshot_uuids(ctxt,
+                [snapshot_id for snapshot_id in snapshot_ids
+                 if uuidutils.is_uuid_like(snapshot_id)])
+
     def _format_volume(self, context, volume):
         instance_ec2_id = None
         instance_data = None
@@ -1015,7 +1039,7 @@ class CloudController(object):
         instances = self._enforce_valid_instance_ids(context, instance_id)
         return self._format_describe_instances(context,
                                                instance_id=instance_id,
-                                               instance_cache=instances)
+                                               instances_cache=instances)
 
     def describe_instances_v6(self, context, **kwargs):
         # Optional DescribeInstancesV6 argument
@@ -1023,7 +1047,7 @@ class CloudController(object):
         instances = self._enforce_valid_instance_ids(context, instance_id)
         return self._format_describe_instances(context,
                                                instance_id=instance_id,
-                                               instance_cache=instances,
+                                               instances_cache=instances,
                                                use_v6=True)
 
     def _format_describe_instances(self, context, **kwargs):
@@ -1054,12 +1078,18 @@ class CloudController(object):
         return {'instancesSet': instances_set}
 
     def _format_instance_bdm(self, context, instance_uuid, root_device_name,
-                             result):
-        """Format InstanceBlockDeviceMappingResponseItemType."""
+                             result, bdms=None, volumes=None):
+        """Format InstanceBlockDeviceMappingResponseItemType.
+
+        bdms and volumes may be prefetched by the caller, volumes being a
+        dict by id which need not hold every volume.
+        """
         root_device_type = 'instance-store'
         mapping = []
-        for bdm in db.block_device_mapping_get_all_by_instance(context,
-                                                               instance_uuid):
+        if bdms is None:
+            bdms = db.block_device_mapping_get_all_by_instance(context,
+                                                               instance_uuid)
+        for bdm in bdms:
             volume_id = bdm['volume_id']
             if (volume_id is None or bdm['no_device']):
                 continue
@@ -1069,7 +1099,9 @@ class CloudController(object):
                 assert not bdm['virtual_name']
                 root_device_type = 'ebs'
 
-            vol = self.volume_api.get(context, volume_id)
+            vol = (volumes or {}).get(volume_id)
+            if vol is None:
+                vol = self.volume_api.get(context, volume_id)
             LOG.debug(_("vol = %s\n"), vol)
             # TODO(yamahata): volume attach time
             ebs = {'volumeId': volume_id,
@@ -1140,18 +1172,46 @@ class CloudController(object):
             except exception.NotFound:
                 instances = []
 
+        if not context.is_admin:
+            instances = [instance for instance in instances
+                         if not pipelib.is_vpn_image(instance['image_ref'])]
+
+        # NOTE: Look up everything the page needs with one query per kind
+        # of data rather than a few queries per instance.
+        instance_uuids = [instance['uuid'] for instance in instances]
+        int_ids = ec2utils.get_int_ids_from_instance_uuids(
+                context.elevated(), instance_uuids)
+        glance_ids = [instance['image_ref'] for instance in instances]
+        for instance in instances:
+            glance_ids.extend(instance[key] for key in
+                              ('kernel_id', 'ramdisk_id') if instance[key])
+        image_ids = ec2utils.glance_ids_to_ids(context, glance_ids)
+        zones = ec2utils.get_availability_zones_by_hosts(context,
+                [instance['host'] for instance in instances])
+        instance_bdms = dict((instance_uuid, [])
+                             for instance_uuid in instance_uuids)
+        for bdm in db.block_device_mapping_get_all_by_instances(
+                context, instance_uuids):
+            instance_bdms[bdm['instance_uuid']].append(bdm)
+        volumes = {}
+        if any(bdm['volume_id'] for bdms in instance_bdms.itervalues()
+               for bdm in bdms):
+            volumes = dict((volume['id'], volume) for volume in
+                           self.volume_api.get_all(context))
+
         for instance in instances:
-            if not context.is_admin:
-                if pipelib.is_vpn_image(instance['image_ref']):
-                    continue
             i = {}
             instance_uuid = instance['uuid']
-            ec2_id = ec2utils.id_to_ec2_inst_id(instance_uuid)
+            ec2_id = ec2utils.id_to_ec2_id(int_ids[instance_uuid])
             i['instanceId'] = ec2_id
             image_uuid = instance['image_ref']
-            i['imageId'] = ec2utils.glance_id_to_ec2_id(context, image_uuid)
-            self._format_kernel_id(context, instance, i, 'kernelId')
-            self._format_ramdisk_id(context, instance, i, 'ramdiskId')
+            i['imageId'] = ec2utils.image_ec2_id(image_ids.get(image_uuid))
+            if instance['kernel_id']:
+                i['kernelId'] = ec2utils.image_ec2_id(
+                        image_ids[instance['kernel_id']], 'aki')
+            if instance['ramdisk_id']:
+                i['ramdiskId'] = ec2utils.image_ec2_id(
+                        image_ids[instance['ramdisk_id']], 'ari')
             i['instanceState'] = _state_description(
                 instance['vm_state'], instance['shutdown_terminate'])
 
@@ -1184,12 +1244,11 @@ class CloudController(object):
             i['launchTime'] = instance['created_at']
             i['amiLaunchIndex'] = instance['launch_index']
             self._format_instance_root_device_name(instance, i)
-            self._format_instance_bdm(context, instance['uuid'],
-                                      i['rootDeviceName'], i)
-            host = instance['host']
-            services = db.service_get_all_by_host(context.elevated(), host)
-            zone = ec2utils.get_availability_zone_by_host(services, host)
-            i['placement'] = {'availabilityZone': zone}
+            self._format_instance_bdm(context, instance_uuid,
+                                      i['rootDeviceName'], i,
+                                      bdms=instance_bdms[instance_uuid],
+                                      volumes=volumes)
+            i['placement'] = {'availabilityZone': zones[instance['host']]}
             if instance['reservation_id'] not in reservations:
                 r = {}
                 r['reservationId'] = instance['reservation_id']
@@ -16,6 +16,7 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import collections
 import re
 
 from nova import availability_zones
@@ -23,13 +24,133 @@ from nova import context
 from nova import db
 from nova import exception
 from nova.network import model as network_model
+from nova.openstack.common import cfg
 from nova.openstack.common import log as logging
 from nova.openstack.common import timeutils
 from nova.openstack.common import uuidutils
 
+ec2utils_opts = [
+    cfg.IntOpt('ec2_id_cache_size',
+               default=10000,
+               help='Number of uuid to EC2 id mappings of each kind '
+                    '(instance, image, volume and snapshot) kept in memory '
+                    'by the EC2 API, 0 disables the cache'),
+]
+
+CONF = cfg.CONF
+CONF.register_opts(ec2utils_opts)
+
 LOG = logging.getLogger(__name__)
 
 
+class IdMappingCache(object):
+    """Bounded, bidirectional in-memory map between uuids and int ids.
+
+    Rows of the id mapping tables are never changed once created, so
+    entries never go stale; the least recently used ones are dropped when
+    there are more than ec2_id_cache_size of them.  The uuid column is not
+    unique, so racing creates may map a uuid twice.  Only the lowest id of
+    a uuid, which every process reads back, is cached.
+    """
+
+    def __init__(self):
+        self._ids = collections.OrderedDict()
+        self._uuids = {}
+
+    def get_id(self, uuid):
+        int_id = self._ids.pop(uuid, None)
+        if int_id is not None:
+            self._ids[uuid] = int_id
+        return int_id
+
+    def get_uuid(self, int_id):
+        uuid = self._uuids.get(int_id)
+        if uuid is not None:
+            self.get_id(uuid)
+        return uuid
+
+    def add(self, uuid, int_id):
+        if CONF.ec2_id_cache_size <= 0:
+            return
+        self._ids.pop(uuid, None)
+        self._ids[uuid] = int_id
+        self._uuids[int_id] = uuid
+        while len(self._ids) > CONF.ec2_id_cache_size:
+            _uuid, old_id = self._ids.popitem(last=False)
+            self._uuids.pop(old_id, None)
+
+    def clear(self):
+        self._ids.clear()
+        self._uuids.clear()
+
+
+_ID_CACHES = {
+    'instance': IdMappingCache(),
+    'image': IdMappingCache(),
+    'volume': IdMappingCache(),
+    'snapshot': IdMappingCache(),
+}
+
+
+def reset_id_caches():
+    """Forget every cached id mapping."""
+    for cache in _ID_CACHES.values():
+        cache.clear()
+
+
+def _get_int_id(context, kind, uuid, get_id, create):
+    if uuid is None:
+        return
+    cache = _ID_CACHES[kind]
+    int_id = cache.get_id(uuid)
+    if int_id is None:
+        try:
+            int_id = get_id(context, uuid)
+        except exception.NotFound:
+            create(context, uuid)
+            int_id = get_id(context, uuid)
+        cache.add(uuid, int_id)
+    return int_id
+
+
+def _get_int_ids(context, kind, uuids, get_ids, create):
+    cache = _ID_CACHES[kind]
+    int_ids = {}
+    missing = set()
+    for uuid in uuids:
+        if not uuid or uuid in int_ids:
+            continue
+        int_id = cache.get_id(uuid)
+        if int_id is None:
+            missing.add(uuid)
+        else:
+            int_ids[uuid] = int_id
+    if missing:
+        found = get_ids(context, list(missing))
+        created = [uuid for uuid in missing if uuid not in found]
+        for uuid in created:
+            create(context, uuid)
+        if created:
+            found.update(get_ids(context, created))
+        for uuid in missing:
+            cache.add(uuid, found[uuid])
+            int_ids[uuid] = found[uuid]
+    return int_ids
+
+
+def _get_uuid(context, kind, int_id, get_uuid):
+    try:
+        int_id = int(int_id)
+    except (TypeError, ValueError):
+        return get_uuid(context, int_id)
+    cache = _ID_CACHES[kind]
+    uuid = cache.get_uuid(int_id)
+    if uuid is None:
+        uuid = get_uuid(context, int_id)
+        cache.add(uuid, int_id)
+    return uuid
+
+
 def image_type(image_type):
     """Converts to a three letter image type.
 
@@ -49,17 +170,30 @@ def image_type(image_type):
 
 def id_to_glance_id(context, image_id):
     """Convert an internal (db) id to a glance id."""
-    return db.s3_image_get(context, image_id)['uuid']
+    return _get_uuid(context, 'image', image_id,
+                     lambda ctxt, int_id: db.s3_image_get(ctxt,
+                                                          int_id)['uuid'])
 
 
 def glance_id_to_id(context, glance_id):
     """Convert a glance id to an internal (db) id."""
-    if glance_id is None:
-        return
-    try:
-        return db.s3_image_get_by_uuid(context, glance_id)['id']
-    except exception.NotFound:
-        return db.s3_image_create(context, glance_id)['id']
+    return _get_int_id(context, 'image', glance_id,
+                       lambda ctxt, uuid: db.s3_image_get_by_uuid(ctxt,
+                                                                  uuid)['id'],
+                       db.s3_image_create)
+
+
+def _s3_image_ids_by_uuids(context, glance_ids):
+    ids = {}
+    for s3_image in db.s3_image_get_all_by_uuids(context, glance_ids):
+        ids.setdefault(s3_image['uuid'], s3_image['id'])
+    return ids
+
+
+def glance_ids_to_ids(context, glance_ids):
+    """Convert a list of glance ids to a dict of internal (db) ids."""
+    return _get_int_ids(context, 'image', glance_ids,
+                        _s3_image_ids_by_uuids, db.s3_image_create)
 
 
 def ec2_id_to_glance_id(context, ec2_id):
@@ -121,6 +255,18 @@ def get_availability_zone_by_host(services, host):
     return 'unknown zone'
 
 
+def get_availability_zones_by_hosts(context, hosts):
+    """Return a dict of the availability zone of each of the hosts."""
+    hosts = set(hosts)
+    services = db.service_get_all(context.elevated(read_deleted='no'))
+    known_hosts = hosts.intersection(service['host'] for service in services)
+    zones = availability_zones.get_host_availability_zones(context,
+                                                           known_hosts)
+    for host in hosts - known_hosts:
+        zones[host] = 'unknown zone'
+    return zones
+
+
 def id_to_ec2_id(instance_id, template='i-%08x'):
     """Convert an instance ID (int) to an ec2 ID (i-[base 16 number])."""
     return template % int(instance_id)
@@ -145,7 +291,8 @@ def ec2_inst_id_to_uuid(context, ec2_id):
 
 
 def get_instance_uuid_from_int_id(context, int_id):
-    return db.get_instance_uuid_by_ec2_id(context, int_id)
+    return _get_uuid(context, 'instance', int_id,
+                     db.get_instance_uuid_by_ec2_id)
 
 
 def id_to_ec2_snap_id(snapshot_id):
@@ -211,25 +358,30 @@ def is_ec2_timestamp_expired(request, expires=None):
 
 
 def get_int_id_from_instance_uuid(context, instance_uuid):
-    if instance_uuid is None:
-        return
-    try:
-        return db.get_ec2_instance_id_by_uuid(context, instance_uuid)
-    except exception.NotFound:
-        return db.ec2_instance_create(context, instance_uuid)['id']
+    return _get_int_id(context, 'instance', instance_uuid,
+                       db.get_ec2_instance_id_by_uuid, db.ec2_instance_create)
+
+
+def get_int_ids_from_instance_uuids(context, instance_uuids):
+    """Return a dict of the ec2 int ids of a list of instance uuids."""
+    return _get_int_ids(context, 'instance', instance_uuids,
+                        db.get_ec2_instance_ids_by_uuids,
+                        db.ec2_instance_create)
 
 
 def get_int_id_from_volume_uuid(context, volume_uuid):
-    if volume_uuid is None:
-        return
-    try:
-        return db.get_ec2_volume_id_by_uuid(context, volume_uuid)
-    except exception.NotFound:
-        return db.ec2_volume_create(context, volume_uuid)['id']
+    return _get_int_id(context, 'volume', volume_uuid,
+                       db.get_ec2_volume_id_by_uuid, db.ec2_volume_create)
+
+
+def get_int_ids_from_volume_uuids(context, volume_uuids):
+    """Return a dict of the ec2 int ids of a list of volume uuids."""
+    return _get_int_ids(context, 'volume', volume_uuids,
+                        db.get_ec2_volume_ids_by_uuids, db.ec2_volume_create)
 
 
 def get_volume_uuid_from_int_id(context, int_id):
-    return db.get_volume_uuid_by_ec2_id(context, int_id)
+    return _get_uuid(context, 'volume', int_id, db.get_volume_uuid_by_ec2_id)
 
 
 def ec2_snap_id_to_uuid(ec2_id):
@@ -242,16 +394,20 @@ def ec2_snap_id_to_uuid(ec2_id):
 
 
 def get_int_id_from_snapshot_uuid(context, snapshot_uuid):
-    if snapshot_uuid is None:
-        return
-    try:
-        return db.get_ec2_snapshot_id_by_uuid(context, snapshot_uuid)
-    except exception.NotFound:
-        return db.ec2_snapshot_create(context, snapshot_uuid)['id']
+    return _get_int_id(context, 'snapshot', snapshot_uuid,
+                       db.get_ec2_snapshot_id_by_uuid, db.ec2_snapshot_create)
+
+
+def get_int_ids_from_snapshot_uuids(context, snapshot_uuids):
+    """Return a dict of the ec2 int ids of a list of snapshot uuids."""
+    return _get_int_ids(context, 'snapshot', snapshot_uuids,
+                        db.get_ec2_snapshot_ids_by_uuids,
+                        db.ec2_snapshot_create)
 
 
 def get_snapshot_uuid_from_int_id(context, int_id):
-    return db.get_snapshot_uuid_by_ec2_id(context, int_id)
+    return _get_uuid(context, 'snapshot', int_id,
+                     db.get_snapshot_uuid_by_ec2_id)
 
 
 _c2u = re.compile('(((?<=[a-z])[A-Z])|([A-Z](?![A-Z]|$)))')
@@ -40,9 +40,18 @@ class ExtendedServerAttributesController(wsgi.Controller):
         except TypeError:
             return
 
-    def _extend_server(self, context, server, instance):
+    def _get_hypervisor_hostnames(self, context, hosts):
+        hostnames = {}
+        for compute_node in db.compute_node_get_by_hosts(context, hosts):
+            host = compute_node['service']['host']
+            # NOTE: Match compute_node_get_by_host, which only looks at
+            # the first node of a host.
+            hostnames.setdefault(host, compute_node['hypervisor_hostname'])
+        return hostnames
+
+    def _extend_server(self, server, instance, hypervisor_hostname):
         key = "%s:hypervisor_hostname" % Extended_server_attributes.alias
-        server[key] = self._get_hypervisor_hostname(context, instance)
+        server[key] = hypervisor_hostname
 
         for attr in ['host', 'name']:
             if attr == 'name':
@@ -62,7 +71,8 @@ class ExtendedServerAttributesController(wsgi.Controller):
             db_instance = req.get_db_instance(server['id'])
             # server['id'] is guaranteed to be in the cache due to
             # the core API adding it in its 'show' method.
-            self._extend_server(context, server, db_instance)
+            hostname = self._get_hypervisor_hostname(context, db_instance)
+            self._extend_server(server, db_instance, hostname)
 
     @wsgi.extends
     def detail(self, req, resp_obj):
@@ -72,11 +82,18 @@ class ExtendedServerAttributesController(wsgi.Controller):
             resp_obj.attach(xml=ExtendedServerAttributesTemplate())
 
             servers = list(resp_obj.obj['servers'])
-            for server in servers:
-                db_instance = req.get_db_instance(server['id'])
-                # server['id'] is guaranteed to be in the cache due to
-                # the core API adding it in its 'detail' method.
-                self._extend_server(context, server, db_instance)
+            # server['id'] is guaranteed to be in the cache due to
+            # the core API adding it in its 'detail' method.
+            db_instances = [req.get_db_instance(server['id'])
+                            for server in servers]
+            hosts = [instance['host'] for instance in db_instances
+                     if instance['host']]
+            hostnames = req.prefetch_db_items(
+                'hypervisor_hostnames', hosts,
+                lambda hosts: self._get_hypervisor_hostnames(context, hosts))
+            for server, db_instance in zip(servers, db_instances):
+                self._extend_server(server, db_instance,
+                                    hostnames.get(db_instance['host']))
 
 
 class Extended_server_attributes(extensions.ExtensionDescriptor):
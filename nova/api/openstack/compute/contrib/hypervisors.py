@@ -164,15 +164,17 @@ class HypervisorsController(object):
     def index(self, req):
         context = req.environ['nova.context']
         authorize(context)
+        compute_nodes = db.compute_node_get_all(context, use_slave=True)
         return dict(hypervisors=[self._view_hypervisor(hyp, False)
-                                 for hyp in db.compute_node_get_all(context)])
+                                 for hyp in compute_nodes])
 
     @wsgi.serializers(xml=HypervisorDetailTemplate)
     def detail(self, req):
         context = req.environ['nova.context']
         authorize(context)
+        compute_nodes = db.compute_node_get_all(context, use_slave=True)
         return dict(hypervisors=[self._view_hypervisor(hyp, True)
-                                 for hyp in db.compute_node_get_all(context)])
+                                 for hyp in compute_nodes])
 
     @wsgi.serializers(xml=HypervisorTemplate)
     def show(self, req, id):
@@ -19,6 +19,7 @@ Module dedicated functions/classes dealing with rate limiting requests.
 
 import collections
 import copy
+import hashlib
 import httplib
 import math
 import re
@@ -30,6 +31,7 @@ import webob.exc
 from nova.api.openstack.compute.views import limits as limits_views
 from nova.api.openstack import wsgi
 from nova.api.openstack import xmlutil
+from nova.common import memorycache
 from nova.openstack.common import importutils
 from nova.openstack.common import jsonutils
 from nova import quota
@@ -216,6 +218,68 @@ DEFAULT_LIMITS = [
 ]
 
 
+# Regular expressions which cannot share a pattern with others, because of
+# numbered back references or inline flags.
+_UNCOMBINABLE_RE = re.compile(r'\\\d|\(\?[iLmsux]')
+
+
+class LimitMatcher(object):
+    """
+    Finds the limits relevant to a request.  The regular expressions of all
+    the limits of a verb are combined into a single pre-compiled pattern,
+    so that one match tells which of them apply.
+    """
+
+    def __init__(self, limits):
+        """
+        Initialize a new `LimitMatcher`.
+
+        @param limits: List of `Limit` objects
+        """
+        indexes = collections.defaultdict(list)
+        for index, limit in enumerate(limits):
+            indexes[limit.verb].append(index)
+
+        self._verbs = {}
+        for verb, verb_indexes in indexes.items():
+            regexes = [limits[index].regex for index in verb_indexes]
+            self._verbs[verb] = (verb_indexes, regexes,
+                                 self._combine(regexes))
+
+    @staticmethod
+    def _combine(regexes):
+        if any(_UNCOMBINABLE_RE.search(regex) for regex in regexes):
+            return None
+
+        # Every limit gets an optional lookahead group anchored at the
+        # start of the url, which captures if its regex matches there.
+        pattern = ''.join('(?:(?=(?P<_limit%d>%s)))?' % (i, regex)
+                          for i, regex in enumerate(regexes))
+        try:
+            return re.compile(pattern)
+        except re.error:
+            return None
+
+    def match(self, verb, url):
+        """
+        Return the indexes of the limits relevant to the given request.
+        """
+        try:
+            indexes, regexes, pattern = self._verbs[verb]
+        except KeyError:
+            return []
+
+        if pattern is None:
+            return [index for index, regex in zip(indexes, regexes)
+                    if re.match(regex, url)]
+
+        # NOTE: The regexes of the limits may have capturing groups of
+        # their own, so look their groups up by name rather than position.
+        groups = pattern.match(url).groupdict()
+        return [index for i, index in enumerate(indexes)
+                if groups['_limit%d' % i] is not None]
+
+
 class RateLimitingMiddleware(base_wsgi.Middleware):
     """
     Rate-limits requests passing through this middleware. All limit information
@@ -291,12 +355,16 @@ class Limiter(object):
         """
         self.limits = copy.deepcopy(limits)
         self.levels = collections.defaultdict(lambda: copy.deepcopy(limits))
+        self.matcher = LimitMatcher(self.limits)
+        self.user_matchers = {}
 
         # Pick up any per-user limit information
         for key, value in kwargs.items():
             if key.startswith('user:'):
                 username = key[5:]
                 self.levels[username] = self.parse_limits(value)
+                self.user_matchers[username] = LimitMatcher(
+                        self.levels[username])
 
     def get_limits(self, username=None):
         """
@@ -312,7 +380,10 @@ class Limiter(object):
         """
         delays = []
 
-        for limit in self.levels[username]:
+        levels = self.levels[username]
+        matcher = self.user_matchers.get(username, self.matcher)
+        for index in matcher.match(verb, url):
+            limit = levels[index]
             delay = limit(verb, url)
             if delay:
                 delays.append((delay, limit.error_message))
@@ -384,6 +455,132 @@ class Limiter(object):
         return result
 
 
+class CacheLimiter(Limiter):
+    """
+    Rate-limit checking class which keeps the limit state in memcached, so
+    that all API workers share the same limits.  Without memcached_servers
+    the state is kept in process, like `Limiter` does.
+
+    Each limit of each user is a bucket holding the time at which it will
+    be empty again, in microseconds.  Requests add to it with an atomic
+    increment, so checking a request costs one cache operation per limit
+    it matches.
+    """
+
+    def __init__(self, limits, **kwargs):
+        """
+        Initialize the new `CacheLimiter`.
+
+        @param limits: List of `Limit` objects
+        """
+        self.limits = copy.deepcopy(limits)
+        self.matcher = LimitMatcher(self.limits)
+        self.user_limits = {}
+        self.user_matchers = {}
+
+        # Pick up any per-user limit information
+        for key, value in kwargs.items():
+            if key.startswith('user:'):
+                username = key[5:]
+                self.user_limits[username] = self.parse_limits(value)
+                self.user_matchers[username] = LimitMatcher(
+                        self.user_limits[username])
+
+        self.cache = memorycache.get_client()
+
+    def _get_time(self):
+        """Retrieve the current time. Broken out for testability."""
+        return time.time()
+
+    def _get_user_limits(self, username):
+        if username in self.user_limits:
+            return self.user_limits[username], self.user_matchers[username]
+        return self.limits, self.matcher
+
+    @staticmethod
+    def _cache_key(username, limit):
+        ident = u'\n'.join(unicode(field) for field in
+                            (username, limit.verb, limit.regex, limit.value,
+                             limit.unit))
+        return 'ratelimit-%s' % hashlib.md5(ident.encode('utf-8')).hexdigest()
+
+    def _consume(self, username, limit, now):
+        """
+        Count a request against a limit.
+
+        @return: Delay in seconds if the limit is exceeded, None otherwise
+        """
+        key = self._cache_key(username, limit)
+        # NOTE: Round down, so that value requests always fit a limit.
+        cost = int(limit.request_value * 1000000)
+        capacity = limit.capacity * 1000000
+
+        empty_at = self.cache.incr(key, cost)
+        if empty_at is None:
+            if self.cache.add(key, str(now + cost)):
+                return None
+            empty_at = self.cache.incr(key, cost)
+            if empty_at is None:
+                return None
+        empty_at = int(empty_at)
+
+        if empty_at - cost < now:
+            # NOTE: The bucket had drained, start over from now.  Two
+            # workers racing here only lose one request between them.
+            empty_at = now + cost
+            self.cache.set(key, str(empty_at))
+
+        delay = empty_at - now - capacity
+        if delay > 0:
+            self.cache.decr(key, cost)
+            return float(delay) / 1000000
+
+    def get_limits(self, username=None):
+        """
+        Return the limits for a given user.
+        """
+        limits, _matcher = self._get_user_limits(username)
+        keys = [self._cache_key(username, limit) for limit in limits]
+        values = self.cache.get_multi(keys)
+        now = self._get_time()
+
+        result = []
+        for limit, key in zip(limits, keys):
+            display = limit.display()
+            water_level = 0.0
+            if values.get(key) is not None:
+                water_level = max(int(values[key]) / 1000000.0 - now, 0.0)
+            capacity = float(limit.capacity)
+            display['remaining'] = int(math.floor(
+                    (capacity - water_level) / capacity * limit.value))
+            excess = water_level + limit.request_value - capacity
+            display['resetTime'] = int(now + max(excess, 0))
+            result.append(display)
+        return result
+
+    def check_for_delay(self, verb, url, username=None):
+        """
+        Check the given verb/user/user triplet for limit.
+
+        @return: Tuple of delay (in seconds) and error message (or None, None)
+        """
+        limits, matcher = self._get_user_limits(username)
+        now = int(self._get_time() * 1000000)
+
+        delays = []
+        for index in matcher.match(verb, url):
+            limit = limits[index]
+            delay = self._consume(username, limit, now)
+            if delay:
+                delays.append((delay, limit.error_message))
+
+        if delays:
+            delays.sort()
+            return delays[0]
+
+        return None, None
+
+
 class WsgiLimiter(object):
     """
     Rate-limit checking from a WSGI application. Uses an in-memory `Limiter`.
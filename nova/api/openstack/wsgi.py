@@ -99,6 +99,27 @@ class Request(webob.Request):
         """
         return self.get_db_items(key).get(item_key)
 
+    def prefetch_db_items(self, key, item_keys, fetch):
+        """
+        Allow an API extension to load the objects it needs for a whole
+        page of results at once instead of looking them up per item.
+
+        fetch is called at most once, with the list of item keys not
+        cached yet, and returns a dict mapping those keys to objects.
+        Keys it leaves out are cached as None so they are not fetched
+        again within the same API request.
+        """
+        db_items = self._extension_data['db_items'].setdefault(key, {})
+        missing = []
+        for item_key in item_keys:
+            if item_key not in db_items and item_key not in missing:
+                missing.append(item_key)
+        if missing:
+            fetched = fetch(missing)
+            for item_key in missing:
+                db_items[item_key] = fetched.get(item_key)
+        return db_items
+
     def cache_db_instances(self, instances):
         self.cache_db_items('instances', instances, 'uuid')
 
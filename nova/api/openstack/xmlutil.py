@@ -27,6 +27,10 @@ XMLNS_V11 = 'http://docs.openstack.org/compute/api/v1.1'
 XMLNS_COMMON_V10 = 'http://docs.openstack.org/common/api/v1.0'
 XMLNS_ATOM = 'http://www.w3.org/2005/Atom'
 
+# Maximum number of compiled (master + slaves) template trees to keep
+_COMPILED_CACHE_SIZE = 256
+_compiled_cache = {}
+
 
 def validate_schema(xml, schema_name):
     if isinstance(xml, str):
@@ -219,6 +223,7 @@ class TemplateElement(object):
 
         self._children.append(elem)
         self._childmap[elem.tag] = elem
+        _template_changed()
 
     def extend(self, elems):
         """Append children to the element."""
@@ -240,6 +245,7 @@ class TemplateElement(object):
         # Update the children
         self._children.extend(elemlist)
         self._childmap.update(elemmap)
+        _template_changed()
 
     def insert(self, idx, elem):
         """Insert a child element at the given index."""
@@ -253,6 +259,7 @@ class TemplateElement(object):
 
         self._children.insert(idx, elem)
         self._childmap[elem.tag] = elem
+        _template_changed()
 
     def remove(self, elem):
         """Remove a child element."""
@@ -266,6 +273,7 @@ class TemplateElement(object):
 
         self._children.remove(elem)
         del self._childmap[elem.tag]
+        _template_changed()
 
     def get(self, key):
         """Get an attribute.
@@ -296,6 +304,7 @@ class TemplateElement(object):
             value = Selector(value)
 
         self.attrib[key] = value
+        _template_changed()
 
     def keys(self):
         """Return the attribute names."""
@@ -453,9 +462,11 @@ class TemplateElement(object):
             value = Selector(value)
 
         self._text = value
+        _template_changed()
 
     def _text_del(self):
         self._text = None
+        _template_changed()
 
     text = property(_text_get, _text_set, _text_del)
 
@@ -512,6 +523,211 @@ def SubTemplateElement(parent, tag, attrib=None, selector=None,
     return elem
 
 
+def _template_changed():
+    """Forget compiled templates after a template element changed."""
+
+    _compiled_cache.clear()
+
+
+def _compile_selector(selector, do_raise=False):
+    """Return a function of an object selecting a datum from it.
+
+    The function selects the same datum as selector(obj, True) if
+    do_raise is set, or selector(obj) otherwise.  Plain Selector
+    instances indexing an object with a single key, by far the most
+    common kind, are turned into a direct lookup; any other selector is
+    called as is.
+    """
+
+    if (type(selector) is not Selector or len(selector.chain) > 1 or
+            (selector.chain and callable(selector.chain[0]))):
+        if do_raise:
+            return lambda obj: selector(obj, True)
+        return selector
+
+    if not selector.chain:
+        return lambda obj: obj
+
+    key = selector.chain[0]
+
+    def select(obj):
+        try:
+            return obj[key]
+        except (KeyError, IndexError):
+            if do_raise:
+                raise KeyError(key)
+            return None
+
+    return select
+
+
+def _overrides(elem, name):
+    """Determine whether a template element overrides a render method."""
+
+    method = getattr(type(elem), name)
+    return method.im_func is not getattr(TemplateElement, name).im_func
+
+
+class CompiledNode(object):
+    """A template node with its slave patches and children pre-merged.
+
+    Rendering a master template with slaves attached requires matching
+    up the children of every sibling element by tag, and applying the
+    text and attributes of every sibling to each rendered element.  A
+    compiled node records the matched children and a flat list of the
+    text and attribute selectors, so that they only have to be worked
+    out once for every combination of master and slave templates.
+    """
+
+    __slots__ = ('siblings', 'children', 'generic', 'tag', 'selector',
+                 'subselector', 'will_render', 'text', 'attrib')
+
+    def __init__(self, siblings):
+        """Compile a list of sibling template elements.
+
+        :param siblings: The TemplateElement instances to render
+                         together; the first one is rendered and the
+                         others are applied to it as patches.
+        """
+
+        self.siblings = siblings
+        self.children = []
+
+        seen = set()
+        for idx, sibling in enumerate(siblings):
+            for child in sibling:
+                # Have we handled this child already?
+                if child.tag in seen:
+                    continue
+                seen.add(child.tag)
+
+                # Determine the child's siblings
+                nieces = [child]
+                for sib in siblings[idx + 1:]:
+                    if child.tag in sib:
+                        nieces.append(sib[child.tag])
+
+                self.children.append(CompiledNode(nieces))
+
+        # Elements with their own rendering code are rendered by it
+        master = siblings[0]
+        self.generic = (_overrides(master, 'render') or
+                        _overrides(master, '_render') or
+                        any(_overrides(sib, 'apply') for sib in siblings))
+        if self.generic:
+            return
+
+        self.tag = master.tag
+        self.selector = _compile_selector(master.selector)
+        self.subselector = None
+        if master.subselector is not None:
+            self.subselector = _compile_selector(master.subselector)
+        self.will_render = master.will_render
+
+        # The text of the last sibling setting one wins; attributes are
+        # set in the order the siblings would apply them
+        self.text = None
+        for sibling in siblings:
+            if sibling.text is not None:
+                self.text = _compile_selector(sibling.text)
+        self.attrib = [(key, _compile_selector(value, True))
+                       for sibling in siblings
+                       for key, value in sibling.attrib.items()]
+
+    def render(self, parent, obj, nsmap=None):
+        """Render an object against the compiled node.
+
+        Returns the first etree.Element instance rendered, or None.
+        """
+
+        if self.generic:
+            elems = self.siblings[0].render(parent, obj, self.siblings[1:],
+                                            nsmap)
+        else:
+            elems = self._render(parent, obj, nsmap)
+
+        # Now, recurse to all child elements for every data element
+        for child in self.children:
+            for elem, datum in elems:
+                child.render(elem, datum)
+
+        if elems:
+            return elems[0][0]
+
+    def _render(self, parent, obj, nsmap):
+        """Render the data selected from an object.
+
+        Behaves like TemplateElement.render() with the other siblings
+        passed as patches.
+        """
+
+        data = None if obj is None else self.selector(obj)
+
+        # Check if we should render at all
+        if not self.will_render(data):
+            return []
+        elif data is None:
+            return [(self._element(parent, None, nsmap), None)]
+
+        # Make the data into a list if it isn't already
+        if not isinstance(data, list):
+            data = [data]
+        elif parent is None:
+            raise ValueError(_('root element selecting a list'))
+
+        subselector = self.subselector
+        elems = []
+        for datum in data:
+            if subselector is not None:
+                datum = subselector(datum)
+            elems.append((self._element(parent, datum, nsmap), datum))
+        return elems
+
+    def _element(self, parent, datum, nsmap):
+        """Build the etree.Element instance for a single datum."""
+
+        tagname = self.tag(datum) if callable(self.tag) else self.tag
+        if parent is not None:
+            elem = etree.SubElement(parent, tagname, nsmap=nsmap)
+        else:
+            elem = etree.Element(tagname, nsmap=nsmap)
+
+        # If the datum is None, do nothing else
+        if datum is None:
+            return elem
+
+        if self.text is not None:
+            elem.text = unicode(self.text(datum))
+        for key, select in self.attrib:
+            try:
+                elem.set(key, unicode(select(datum)))
+            except KeyError:
+                # Attribute has no value, so don't include it
+                pass
+
+        return elem
+
+
+def compile_siblings(siblings):
+    """Return the CompiledNode for a list of sibling template elements.
+
+    Compiled nodes are cached, keyed on the identity of the sibling
+    elements, until any template element is changed.
+    """
+
+    key = tuple(siblings)
+    try:
+        return _compiled_cache[key]
+    except KeyError:
+        pass
+
+    compiled = CompiledNode(list(siblings))
+    if len(_compiled_cache) >= _COMPILED_CACHE_SIZE:
+        _compiled_cache.clear()
+    _compiled_cache[key] = compiled
+    return compiled
+
+
 class Template(object):
     """Represent a template."""
 
@@ -531,9 +747,9 @@ class Template(object):
     def _serialize(self, parent, obj, siblings, nsmap=None):
         """Internal serialization.
 
-        Recursive routine to build a tree of etree.Element instances
-        from an object based on the template.  Returns the first
-        etree.Element instance rendered, or None.
+        Builds a tree of etree.Element instances from an object based
+        on the template.  Returns the first etree.Element instance
+        rendered, or None.
 
         :param parent: The parent etree.Element instance.  Can be
                        None.
@@ -545,32 +761,7 @@ class Template(object):
                       rendered.
         """
 
-        # First step, render the element
-        elems = siblings[0].render(parent, obj, siblings[1:], nsmap)
-
-        # Now, recurse to all child elements
-        seen = set()
-        for idx, sibling in enumerate(siblings):
-            for child in sibling:
-                # Have we handled this child already?
-                if child.tag in seen:
-                    continue
-                seen.add(child.tag)
-
-                # Determine the child's siblings
-                nieces = [child]
-                for sib in siblings[idx + 1:]:
-                    if child.tag in sib:
-                        nieces.append(sib[child.tag])
-
-                # Now we recurse for every data element
-                for elem, datum in elems:
-                    self._serialize(elem, datum, nieces)
-
-        # Return the first element; at the top level, this will be the
-        # root element
-        if elems:
-            return elems[0][0]
+        return compile_siblings(siblings).render(parent, obj, nsmap)
 
     def serialize(self, obj, *args, **kwargs):
         """Serialize an object.
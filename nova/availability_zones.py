@@ -15,6 +15,8 @@
 
 """Availability zone helper functions."""
 
+import collections
+
 from nova import db
 from nova.openstack.common import cfg
 from nova.openstack.common import jsonutils
@@ -60,3 +62,26 @@ def get_host_availability_zone(context, host):
         return list(metadata['availability_zone'])[0]
     else:
         return CONF.default_availability_zone
+
+
+def get_host_availability_zones(context, hosts):
+    """Return a dict of the availability zone of each of the given hosts.
+
+    Equivalent to calling get_host_availability_zone() for every host, with
+    a single aggregate query.
+    """
+    zones = collections.defaultdict(set)
+    for aggregate in db.aggregate_get_all(context.elevated()):
+        zone = aggregate.metadetails.get('availability_zone')
+        if zone is None:
+            continue
+        for host in aggregate.hosts:
+            zones[host].add(zone)
+
+    result = {}
+    for host in hosts:
+        if zones.get(host):
+            result[host] = list(zones[host])[0]
+        else:
+            result[host] = CONF.default_availability_zone
+    return result
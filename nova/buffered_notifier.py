@@ -0,0 +1,338 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2013 OpenStack LLC.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Notification driver sending through other drivers in the background.
+
+Notifications are put on a bounded in-process queue and the caller carries
+on. A single greenthread takes them off the queue in batches and hands them
+to the buffered_notification_drivers, so that a slow message broker holds
+up that greenthread only, and the rpc notifier keeps reusing one pooled
+connection. When the queue is full, buffered_notification_overflow decides
+whether the caller waits for room, the oldest queued notification is
+dropped, or the notification is appended to a journal file, which is sent
+once the queue has drained. Spilled notifications may be sent out of order.
+
+Every process spills to its own journal, buffered_notification_journal
+suffixed with its pid. The journals left behind by processes that are gone
+are sent by the next process that starts sending notifications. The
+notifications still queued when the process exits are spilled, or sent
+when there is no journal.
+"""
+
+import atexit
+import errno
+import glob
+import os
+import time
+
+import eventlet
+from eventlet import queue
+
+from nova.openstack.common import cfg
+from nova.openstack.common import importutils
+from nova.openstack.common import jsonutils
+from nova.openstack.common import log as logging
+
+LOG = logging.getLogger(__name__)
+
+buffered_notifier_opts = [
+    cfg.MultiStrOpt('buffered_notification_drivers',
+                    default=[],
+                    help='Drivers the buffered notifier sends notifications '
+                         'through'),
+    cfg.IntOpt('buffered_notification_queue_size',
+               default=1000,
+               help='Maximum number of notifications waiting to be sent'),
+    cfg.IntOpt('buffered_notification_batch_size',
+               default=50,
+               help='Maximum number of notifications sent in one go'),
+    cfg.StrOpt('buffered_notification_overflow',
+               default='block',
+               help='What to do with a notification when the queue is '
+                    'full: block, to wait for room, drop_oldest, to drop '
+                    'the oldest queued notification, or spill, to append '
+                    'it to buffered_notification_journal'),
+    cfg.StrOpt('buffered_notification_journal',
+               default=None,
+               help='File notifications are spilled to when the queue is '
+                    'full, required by the spill overflow policy. Every '
+                    'process appends its pid to the file name'),
+    cfg.IntOpt('buffered_notification_report_interval',
+               default=600,
+               help='Number of seconds between logging the queue depth, '
+                    'counts and latency of buffered notifications, 0 to '
+                    'never log them'),
+]
+
+CONF = cfg.CONF
+CONF.register_opts(buffered_notifier_opts)
+
+OVERFLOW_POLICIES = ('block', 'drop_oldest', 'spill')
+
+_REPLAY_SUFFIX = '.replay'
+
+
+class _JournaledContext(dict):
+    """The context of a notification read back from the journal."""
+
+    def to_dict(self):
+        return dict(self)
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except OSError as e:
+        return e.errno != errno.ESRCH
+    return True
+
+
+class BufferedNotifier(object):
+    """Queues notifications for a background greenthread to send."""
+
+    def __init__(self, drivers, queue_size, batch_size, overflow='block',
+                 journal=None, report_interval=0):
+        if overflow not in OVERFLOW_POLICIES:
+            raise ValueError(_('Unknown notification overflow policy %s')
+                             % overflow)
+        if overflow == 'spill' and not journal:
+            LOG.error(_('buffered_notification_journal is not set, '
+                        'blocking instead of spilling notifications'))
+            overflow = 'block'
+        self.drivers = drivers
+        self.batch_size = batch_size
+        self.overflow = overflow
+        self.journal = journal
+        self.report_interval = report_interval
+        self._queue = queue.LightQueue(queue_size)
+        self._worker = None
+        self._reported_at = time.time()
+        self.metrics = {'queued': 0, 'sent': 0, 'errors': 0, 'dropped': 0,
+                        'spilled': 0, 'batches': 0, 'max_depth': 0,
+                        'latency': 0.0, 'max_latency': 0.0}
+
+    def depth(self):
+        """Number of notifications waiting to be sent."""
+        return self._queue.qsize()
+
+    def notify(self, context, message):
+        item = (context, message, time.time())
+        if self._worker is None:
+            self._worker = eventlet.spawn(self._run)
+        if self.overflow == 'block':
+            self._queue.put(item)
+        else:
+            try:
+                self._queue.put_nowait(item)
+            except queue.Full:
+                self._overflow(item)
+        self.metrics['queued'] += 1
+        self.metrics['max_depth'] = max(self.metrics['max_depth'],
+                                        self.depth())
+
+    def _overflow(self, item):
+        if self.overflow == 'drop_oldest':
+            dropped = self._queue.get_nowait()
+            self.metrics['dropped'] += 1
+            LOG.warn(_('Notification queue full, dropped %s'),
+                     dropped[1].get('message_id'))
+            self._queue.put_nowait(item)
+        else:
+            self._spill([item])
+
+    def _journal_path(self, pid=None):
+        # NOTE: The pid is looked up on every use, services fork their
+        # workers after the notifier module is loaded.
+        return '%s.%d' % (self.journal, pid or os.getpid())
+
+    def _spill(self, items):
+        with open(self._journal_path(), 'a') as journal:
+            for context, message, _queued_at in items:
+                if hasattr(context, 'to_dict'):
+                    context = context.to_dict()
+                journal.write(jsonutils.dumps({'context': context,
+                                               'message': message}) + '\n')
+        self.metrics['spilled'] += len(items)
+
+    def _orphaned_journals(self):
+        """The journals of processes that are gone."""
+        paths = []
+        for path in glob.glob(self.journal + '.*'):
+            pid = path[len(self.journal) + 1:]
+            if pid.endswith(_REPLAY_SUFFIX):
+                pid = pid[:-len(_REPLAY_SUFFIX)]
+            if pid.isdigit() and not _pid_alive(int(pid)):
+                paths.append(path)
+        return paths
+
+    def _read_journal(self, path):
+        """Take the notifications spilled to a journal, oldest first."""
+        # NOTE: Renaming claims the journal, another process replaying
+        # the same orphaned journal loses the race and skips it.
+        replay = self._journal_path() + _REPLAY_SUFFIX
+        try:
+            os.rename(path, replay)
+        except OSError as e:
+            if e.errno != errno.ENOENT:
+                raise
+            return []
+        items = []
+        now = time.time()
+        with open(replay) as journal:
+            for line in journal:
+                try:
+                    entry = jsonutils.loads(line)
+                except ValueError:
+                    LOG.error(_('Skipping corrupt notification journal '
+                                'entry: %s'), line)
+                    continue
+                context = entry['context']
+                if context is not None:
+                    context = _JournaledContext(context)
+                items.append((context, entry['message'], now))
+        os.unlink(replay)
+        return items
+
+    def _replay(self, paths):
+        for path in paths:
+            try:
+                items = self._read_journal(path)
+            except (IOError, OSError):
+                LOG.exception(_('Failed to read notification journal %s'),
+                              path)
+                continue
+            self.publish(items)
+
+    def _next_batch(self):
+        batch = [self._queue.get()]
+        while len(batch) < self.batch_size:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _report(self):
+        now = time.time()
+        if (not self.report_interval or
+            now - self._reported_at < self.report_interval):
+            return
+        self._reported_at = now
+        metrics = dict(self.metrics, depth=self.depth())
+        metrics['average_latency'] = (metrics['latency'] /
+                                      max(metrics['sent'], 1))
+        LOG.info(_('Buffered notifications: %(depth)d queued, %(sent)d '
+                   'sent, %(errors)d errors, %(dropped)d dropped, '
+                   '%(spilled)d spilled, latency %(average_latency).3fs '
+                   'average, %(max_latency).3fs max') % metrics)
+
+    def _run(self):
+        try:
+            if self.journal:
+                self._replay(self._orphaned_journals())
+            while True:
+                try:
+                    self.publish(self._next_batch())
+                    if self.journal and self._queue.empty():
+                        self._replay([self._journal_path()])
+                    self._report()
+                except Exception:
+                    LOG.exception(_('Failed to send buffered '
+                                    'notifications'))
+        finally:
+            self._worker = None
+
+    def stop(self):
+        """Spill the notifications still queued, or send them when there
+        is no journal."""
+        items = []
+        while True:
+            try:
+                items.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        if not items:
+            return
+        if self.journal:
+            try:
+                self._spill(items)
+                return
+            except (IOError, OSError):
+                LOG.exception(_('Failed to spill notifications to %s'),
+                              self._journal_path())
+        self.publish(items)
+
+    def publish(self, items):
+        """Send notifications through every driver, in batches."""
+        for i in xrange(0, len(items), self.batch_size):
+            batch = items[i:i + self.batch_size]
+            for context, message, queued_at in batch:
+                for driver in self.drivers:
+                    try:
+                        driver.notify(context, message)
+                    except Exception as e:
+                        self.metrics['errors'] += 1
+                        LOG.exception(_("Problem '%(e)s' attempting to "
+                                        "send to notification system. "
+                                        "Payload=%(payload)s")
+                                      % dict(e=e, payload=message))
+                latency = time.time() - queued_at
+                self.metrics['latency'] += latency
+                self.metrics['max_latency'] = max(
+                    self.metrics['max_latency'], latency)
+            self.metrics['sent'] += len(batch)
+            self.metrics['batches'] += 1
+
+
+_NOTIFIER = None
+
+
+def _load_drivers():
+    drivers = []
+    for name in CONF.buffered_notification_drivers:
+        try:
+            drivers.append(importutils.import_module(name))
+        except ImportError:
+            LOG.exception(_("Failed to load notifier %s. "
+                            "These notifications will not be sent.") % name)
+    return drivers
+
+
+def get_notifier():
+    """Return the BufferedNotifier shared by all callers."""
+    global _NOTIFIER
+    if _NOTIFIER is None:
+        _NOTIFIER = BufferedNotifier(
+                _load_drivers(),
+                CONF.buffered_notification_queue_size,
+                CONF.buffered_notification_batch_size,
+                CONF.buffered_notification_overflow,
+                CONF.buffered_notification_journal,
+                CONF.buffered_notification_report_interval)
+        atexit.register(_NOTIFIER.stop)
+    return _NOTIFIER
+
+
+def notify(context, message):
+    """Queues a notification for the buffered_notification_drivers."""
+    get_notifier().notify(context, message)
+
+
+def _reset_notifier():
+    """Used by unit tests to reset the shared notifier."""
+    global _NOTIFIER
+    _NOTIFIER = None
@@ -0,0 +1,81 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2013 OpenStack LLC.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Encoding of messages sent between cells.
+
+Messages are sent as plain JSON, which every cell can decode.  When
+compress_messages is set, messages larger than message_compress_threshold
+are sent as
+
+    ~<codec name>/<codec version>:<flags>:<base64 encoded data>
+
+where the codec is always json/1 and the only flag is 'z' for data
+compressed with zlib.  Cells of this release decode both forms, so
+compression can be turned on once every nova-cells service of the
+neighbor cells has been upgraded.
+"""
+
+import base64
+import zlib
+
+from nova import exception
+from nova.openstack.common import cfg
+from nova.openstack.common import jsonutils
+
+cell_codec_opts = [
+    cfg.BoolOpt('compress_messages',
+                default=False,
+                help='Compress messages to neighbor cells larger than '
+                     'message_compress_threshold. Only set this once every '
+                     'nova-cells service of the neighbor cells can decode '
+                     'compressed messages, older services drop them'),
+    cfg.IntOpt('message_compress_threshold',
+               default=1024,
+               help='Size in bytes above which messages to neighbor cells '
+                    'are compressed, when compress_messages is set'),
+]
+
+CONF = cfg.CONF
+CONF.register_opts(cell_codec_opts, group='cells')
+
+_ENVELOPE = '~'
+_CODEC_ID = 'json/1'
+_COMPRESSED = 'z'
+
+
+def encode(obj):
+    """Encode obj for a neighbor cell."""
+    data = jsonutils.dumps(obj)
+    if (not CONF.cells.compress_messages or
+        len(data) <= CONF.cells.message_compress_threshold):
+        return data
+    return '%s%s:%s:%s' % (_ENVELOPE, _CODEC_ID, _COMPRESSED,
+                           base64.b64encode(zlib.compress(data)))
+
+
+def decode(data):
+    """Decode a message encoded by encode() in any cell."""
+    if not data.startswith(_ENVELOPE):
+        return jsonutils.loads(data)
+    codec_id, flags, data = str(data[len(_ENVELOPE):]).split(':', 2)
+    if codec_id != _CODEC_ID:
+        raise exception.CellMessageCodecNotSupported(codec=codec_id)
+    data = base64.b64decode(data)
+    if _COMPRESSED in flags:
+        data = zlib.decompress(data)
+    return jsonutils.loads(data)
@@ -40,7 +40,12 @@ cell_manager_opts = [
                         "or deleted to continue to update cells"),
         cfg.IntOpt("instance_update_num_instances",
                 default=1,
-                help="Number of instances to update per periodic task run")
+                help="Number of instances to update per periodic task run"),
+        cfg.IntOpt("instance_sync_rate",
+                default=0,
+                help="Number of instances per second to update in parent "
+                        "cells. When set, this replaces "
+                        "instance_update_num_instances"),
 ]
 
 
@@ -48,6 +53,7 @@ LOG = logging.getLogger(__name__)
 
 CONF = cfg.CONF
 CONF.register_opts(cell_manager_opts, group='cells')
+CONF.import_opt('instance_sync_batch_size', 'nova.cells.opts', group='cells')
 
 
 class CellsManager(manager.Manager):
@@ -79,6 +85,8 @@ class CellsManager(manager.Manager):
                 CONF.cells.driver)
         self.driver = cells_driver_cls()
         self.instances_to_heal = iter([])
+        self._last_heal_time = timeutils.utcnow_ts()
+        self._heal_allowance = 0
 
     def post_start_hook(self):
         """Have the driver start its consumers for inter-cell communication.
@@ -106,16 +114,33 @@ class CellsManager(manager.Manager):
         self.msg_runner.tell_parents_our_capabilities(ctxt)
         self.msg_runner.tell_parents_our_capacities(ctxt)
 
+    def _num_instances_to_heal(self):
+        """Return the number of instances to sync on this run of
+        _heal_instances.
+        """
+        rate = CONF.cells.instance_sync_rate
+        if rate <= 0:
+            return CONF.cells.instance_update_num_instances
+        now = timeutils.utcnow_ts()
+        self._heal_allowance += (now - self._last_heal_time) * rate
+        self._last_heal_time = now
+        num_instances = int(self._heal_allowance)
+        self._heal_allowance -= num_instances
+        return num_instances
+
     @manager.periodic_task
     def _heal_instances(self, ctxt):
         """Periodic task to send updates for a number of instances to
         parent cells.
 
         On every run of the periodic task, we will attempt to sync
-        'CONF.cells.instance_update_num_instances' number of instances.
-        When we get the list of instances, we shuffle them so that multiple
-        nova-cells services aren't attempting to sync the same instances
-        in lockstep.
+        'CONF.cells.instance_update_num_instances' number of instances,
+        or if 'CONF.cells.instance_sync_rate' is set, as many instances
+        as that rate allows since the previous run.  Instances are read
+        from the DB and sent to parent cells in batches of up to
+        'CONF.cells.instance_sync_batch_size'.  When we get the list of
+        instances, we shuffle them so that multiple nova-cells services
+        aren't attempting to sync the same instances in lockstep.
 
         If CONF.cells.instance_update_at_threshold is set, only attempt
         to sync instances that have been updated recently.  The CONF
@@ -123,6 +148,7 @@ class CellsManager(manager.Manager):
         can be.  Ie, a threshold of 3600 means to only update instances
         that have modified in the last hour.
         """
+        num_instances = self._num_instances_to_heal()
 
         if not self.state_manager.get_parent_cells():
             # No need to sync up if we have no parents.
@@ -153,29 +179,28 @@ class CellsManager(manager.Manager):
 
         rd_context = ctxt.elevated(read_deleted='yes')
 
-        for i in xrange(CONF.cells.instance_update_num_instances):
-            while True:
-                # Yield to other greenthreads
-                time.sleep(0)
+        while num_instances > 0:
+            batch_size = min(num_instances,
+                             CONF.cells.instance_sync_batch_size)
+            instance_uuids = []
+            while len(instance_uuids) < batch_size:
                 instance_uuid = _next_instance()
                 if not instance_uuid:
-                    return
-                try:
-                    instance = self.db.instance_get_by_uuid(rd_context,
-                            instance_uuid)
-                except exception.InstanceNotFound:
-                    continue
-                self._sync_instance(ctxt, instance)
-                break
-
-    def _sync_instance(self, ctxt, instance):
-        """Broadcast an instance_update or instance_destroy message up to
-        parent cells.
-        """
-        if instance['deleted']:
-            self.instance_destroy_at_top(ctxt, instance)
-        else:
-            self.instance_update_at_top(ctxt, instance)
+                    break
+                instance_uuids.append(instance_uuid)
+            if not instance_uuids:
+                return
+            # Yield to other greenthreads
+            time.sleep(0)
+            # Instances that vanished since we listed them are skipped.
+            instances = self.db.instance_get_all_by_filters(rd_context,
+                    {'uuid': instance_uuids}, 'deleted', 'asc')
+            if instances:
+                self.msg_runner.instances_sync_at_top(ctxt, instances)
+                num_instances -= len(instances)
+            if len(instance_uuids) < batch_size:
+                # Went through the whole list.
+                return
 
     def schedule_run_instance(self, ctxt, host_sched_kwargs):
         """Pick a cell (possibly ourselves) to build new instance(s)
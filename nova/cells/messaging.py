@@ -26,6 +26,7 @@ import sys
 
 from eventlet import queue
 
+from nova.cells import codec as cells_codec
 from nova.cells import state as cells_state
 from nova.cells import utils as cells_utils
 from nova import compute
@@ -54,6 +55,7 @@ cell_messaging_opts = [
 CONF = cfg.CONF
 CONF.import_opt('name', 'nova.cells.opts', group='cells')
 CONF.import_opt('call_timeout', 'nova.cells.opts', group='cells')
+CONF.import_opt('instance_sync_batch_size', 'nova.cells.opts', group='cells')
 CONF.register_opts(cell_messaging_opts, group='cells')
 
 LOG = logging.getLogger(__name__)
@@ -302,6 +304,14 @@ class _BaseMessage(object):
         _dict['ctxt'] = _dict['ctxt'].to_dict()
         return jsonutils.dumps(_dict)
 
+    def encode(self):
+        """Encode a message for sending to a sibling cell, compressed if
+        configured.
+        """
+        _dict = self._to_dict()
+        _dict['ctxt'] = _dict['ctxt'].to_dict()
+        return cells_codec.encode(_dict)
+
     def source_is_us(self):
         """Did this cell create this message?"""
         return self.routing_path == self.our_path_part
@@ -687,12 +697,10 @@ class _BroadcastMessageMethods(_BaseMessageMethods):
         """Are we the API level?"""
         return not self.state_manager.get_parent_cells()
 
-    def instance_update_at_top(self, message, instance, **kwargs):
-        """Update an instance in the DB if we're a top level cell."""
-        if not self._at_the_top():
-            return
-        instance_uuid = instance['uuid']
-
+    def _prepare_instance_for_top(self, message, instance):
+        """Turn an instance from a child cell into the values to update
+        the instance with in a top level cell.
+        """
         # Remove things that we can't update in the top level cells.
         # 'metadata' is only updated in the API cell, so don't overwrite
         # it based on what child cells say.  Make sure to update
@@ -716,6 +724,15 @@ class _BroadcastMessageMethods(_BaseMessageMethods):
             sys_metadata = dict([(md['key'], md['value'])
                     for md in instance['system_metadata']])
             instance['system_metadata'] = sys_metadata
+        return instance, info_cache
+
+    def instance_update_at_top(self, message, instance, **kwargs):
+        """Update an instance in the DB if we're a top level cell."""
+        if not self._at_the_top():
+            return
+        instance_uuid = instance['uuid']
+        instance, info_cache = self._prepare_instance_for_top(message,
+                                                              instance)
 
         LOG.debug(_("Got update for instance %(instance_uuid)s: "
                 "%(instance)s") % locals())
@@ -748,6 +765,29 @@ class _BroadcastMessageMethods(_BaseMessageMethods):
         except exception.InstanceNotFound:
             pass
 
+    def instances_sync_at_top(self, message, instances, **kwargs):
+        """Update and destroy a batch of instances in the DB if we're a
+        top level cell.
+        """
+        if not self._at_the_top():
+            return
+        values_list = []
+        for instance in instances:
+            if instance['deleted']:
+                self.instance_destroy_at_top(message, instance)
+                continue
+            instance, info_cache = self._prepare_instance_for_top(message,
+                                                                  instance)
+            if info_cache:
+                instance['info_cache'] = info_cache
+            values_list.append(instance)
+        LOG.debug(_("Got sync of %(count)d instances, %(updated)d updated"),
+                  {'count': len(instances), 'updated': len(values_list)})
+        if values_list:
+            # It's possible due to some weird condition that an instance
+            # was already set as deleted, deleted instances are updated too.
+            self.db.instance_update_or_create_bulk(message.ctxt, values_list)
+
     def instance_delete_everywhere(self, message, instance, delete_type,
                                    **kwargs):
         """Call compute API delete() or soft_delete() in every cell.
@@ -780,12 +820,6 @@ class _BroadcastMessageMethods(_BaseMessageMethods):
             return
         self.db.bw_usage_update(message.ctxt, **bw_update_info)
 
-    def _sync_instance(self, ctxt, instance):
-        if instance['deleted']:
-            self.msg_runner.instance_destroy_at_top(ctxt, instance)
-        else:
-            self.msg_runner.instance_update_at_top(ctxt, instance)
-
     def sync_instances(self, message, project_id, updated_since, deleted,
                        **kwargs):
         projid_str = project_id is None and "<all>" or project_id
@@ -797,8 +831,9 @@ class _BroadcastMessageMethods(_BaseMessageMethods):
         instances = cells_utils.get_instances_to_sync(message.ctxt,
                 updated_since=updated_since, project_id=project_id,
                 deleted=deleted)
-        for instance in instances:
-            self._sync_instance(message.ctxt, instance)
+        for batch in cells_utils.batches(instances,
+                                         CONF.cells.instance_sync_batch_size):
+            self.msg_runner.instances_sync_at_top(message.ctxt, batch)
 
 
 _CELL_MESSAGE_TYPE_TO_MESSAGE_CLS = {'targeted': _TargetedMessage,
@@ -821,7 +856,7 @@ class MessageRunner(object):
     Public methods in this class are typically called by the CellsManager
     to create a new message and process it with the exception of
     'message_from_json' which should be used by CellsDrivers to convert
-    a JSONified message it has received back into the appropriate Message
+    an encoded message it has received back into the appropriate Message
     class.
 
     Private methods are used internally when we need to keep some
@@ -899,11 +934,11 @@ class MessageRunner(object):
                                 response_uuid, **kwargs)
 
     def message_from_json(self, json_message):
-        """Turns a message in JSON format into an appropriate Message
-        instance.  This is called when cells receive a message from
-        another cell.
+        """Turns an encoded message into an appropriate Message instance.
+        This is called when cells receive a message from another cell.
+        The message may be plain JSON or compressed.
         """
-        message_dict = jsonutils.loads(json_message)
+        message_dict = cells_codec.decode(json_message)
         message_type = message_dict.pop('message_type')
         # Need to convert context back.
         ctxt = message_dict['ctxt']
@@ -999,6 +1034,13 @@ class MessageRunner(object):
                                     run_locally=False)
         message.process()
 
+    def instances_sync_at_top(self, ctxt, instances):
+        """Update or destroy a batch of instances at the top level cell."""
+        message = _BroadcastMessage(self, ctxt, 'instances_sync_at_top',
+                                    dict(instances=instances), 'up',
+                                    run_locally=False)
+        message.process()
+
     def instance_delete_everywhere(self, ctxt, instance, delete_type):
         """This is used by API cell when it didn't know what cell
         an instance was in, but the instance was requested to be
@@ -39,6 +39,11 @@ cells_opts = [
     cfg.IntOpt('call_timeout',
                 default=60,
                 help='Seconds to wait for response from a call to a cell.'),
+    cfg.IntOpt('instance_sync_batch_size',
+                default=100,
+                help='Maximum number of instances read from the database '
+                     'and sent to parent cells in one message when '
+                     'syncing instances'),
 ]
 
 cfg.CONF.register_opts(cells_opts, group='cells')
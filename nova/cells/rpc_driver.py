@@ -123,14 +123,15 @@ class InterCellRPCAPI(rpc_proxy.RpcProxy):
         return server_params
 
     def send_message_to_cell(self, cell_state, message):
-        """Send a message to another cell by JSON-ifying the message and
+        """Send a message to another cell by encoding the message and
         making an RPC cast to 'process_message'.  If the message says to
         fanout, do it.  The topic that is used will be
         'CONF.rpc_driver_queue_base.<message_type>'.
         """
         ctxt = message.ctxt
-        json_message = message.to_json()
-        rpc_message = self.make_msg('process_message', message=json_message)
+        encoded_message = message.encode()
+        rpc_message = self.make_msg('process_message',
+                                    message=encoded_message)
         topic_base = CONF.cells.rpc_driver_queue_base
         topic = '%s.%s' % (topic_base, message.message_type)
         server_params = self._get_server_params_for_cell(cell_state)
@@ -158,8 +159,8 @@ class InterCellRPCDispatcher(object):
 
     def process_message(self, _ctxt, message):
         """We received a message from another cell.  Use the MessageRunner
-        to turn this from JSON back into an instance of the correct
-        Message class.  Then process it!
+        to decode this back into an instance of the correct Message class.
+        Then process it!
         """
         message = self.msg_runner.message_from_json(message)
         message.process()
@@ -16,6 +16,7 @@
 """
 CellState Manager
 """
+import collections
 import copy
 import datetime
 import functools
@@ -42,6 +43,10 @@ CONF.import_opt('name', 'nova.cells.opts', group='cells')
 #CONF.import_opt('capabilities', 'nova.cells.opts', group='cells')
 CONF.register_opts(cell_state_manager_opts, group='cells')
 
+# NOTE: Compute nodes changed this long before the previous capacity
+# update are read again, in case their transaction committed late.
+_CAPACITY_CHANGES_OVERLAP = datetime.timedelta(seconds=5)
+
 
 class CellState(object):
     """Holds information for a particular cell."""
@@ -116,6 +121,10 @@ class CellStateManager(base.Base):
         self.parent_cells = {}
         self.child_cells = {}
         self.last_cell_db_check = datetime.datetime.min
+        # Free resources of our compute nodes, by compute node id, kept
+        # up to date from the nodes changed since the last update.
+        self._compute_nodes = {}
+        self._compute_nodes_checked_at = None
         self._cell_db_sync()
         my_cell_capabs = {}
         for cap in CONF.cells.capabilities:
@@ -195,55 +204,58 @@ class CellStateManager(base.Base):
         available per instance_type.
         """
 
-        compute_hosts = {}
-
-        def _get_compute_hosts():
-            compute_nodes = self.db.compute_node_get_all(context)
-            for compute in compute_nodes:
-                service = compute['service']
-                if not service or service['disabled']:
-                    continue
-                host = service['host']
-                compute_hosts[host] = {
-                        'free_ram_mb': compute['free_ram_mb'],
-                        'free_disk_mb': compute['free_disk_gb'] * 1024}
-
-        _get_compute_hosts()
-        if not compute_hosts:
+        self._update_compute_nodes(context)
+        disabled = set(service['id'] for service in
+                       self.db.service_get_all(context, disabled=True))
+
+        # Hosts with the same free resources are counted once, so the
+        # units for an instance_type are computed per distinct amount.
+        ram_mb_free_counts = collections.defaultdict(int)
+        disk_mb_free_counts = collections.defaultdict(int)
+        for compute_values in self._compute_nodes.itervalues():
+            if compute_values['service_id'] in disabled:
+                continue
+            ram_mb_free_counts[compute_values['free_ram_mb']] += 1
+            disk_mb_free_counts[compute_values['free_disk_mb']] += 1
+
+        if not ram_mb_free_counts:
             self.my_cell_state.update_capacities({})
             return
 
+        def _free_units(free_counts, per_inst):
+            if not per_inst:
+                return 0
+            return sum(count * max(0, int(tot / per_inst))
+                       for tot, count in free_counts.iteritems())
+
+        # instance_types of the same size each add their units, as if
+        # computed per instance_type.
+        ram_units = {}
+        disk_units = {}
         ram_mb_free_units = {}
         disk_mb_free_units = {}
-        total_ram_mb_free = 0
-        total_disk_mb_free = 0
 
-        def _free_units(tot, per_inst):
-            if per_inst:
-                return max(0, int(tot / per_inst))
-            else:
-                return 0
-
-        def _update_from_values(values, instance_type):
+        for instance_type in self.db.instance_type_get_all(context):
             memory_mb = instance_type['memory_mb']
             disk_mb = (instance_type['root_gb'] +
                     instance_type['ephemeral_gb']) * 1024
-            ram_mb_free_units.setdefault(str(memory_mb), 0)
-            disk_mb_free_units.setdefault(str(disk_mb), 0)
-            ram_free_units = _free_units(compute_values['free_ram_mb'],
-                    memory_mb)
-            disk_free_units = _free_units(compute_values['free_disk_mb'],
-                    disk_mb)
-            ram_mb_free_units[str(memory_mb)] += ram_free_units
-            disk_mb_free_units[str(disk_mb)] += disk_free_units
-
-        instance_types = self.db.instance_type_get_all(context)
-
-        for compute_values in compute_hosts.values():
-            total_ram_mb_free += compute_values['free_ram_mb']
-            total_disk_mb_free += compute_values['free_disk_mb']
-            for instance_type in instance_types:
-                _update_from_values(compute_values, instance_type)
+            if memory_mb not in ram_units:
+                ram_units[memory_mb] = _free_units(ram_mb_free_counts,
+                                                   memory_mb)
+            if disk_mb not in disk_units:
+                disk_units[disk_mb] = _free_units(disk_mb_free_counts,
+                                                  disk_mb)
+            ram_mb_free_units[str(memory_mb)] = (
+                    ram_mb_free_units.get(str(memory_mb), 0) +
+                    ram_units[memory_mb])
+            disk_mb_free_units[str(disk_mb)] = (
+                    disk_mb_free_units.get(str(disk_mb), 0) +
+                    disk_units[disk_mb])
+
+        total_ram_mb_free = sum(tot * count for tot, count
+                                in ram_mb_free_counts.iteritems())
+        total_disk_mb_free = sum(tot * count for tot, count
+                                 in disk_mb_free_counts.iteritems())
 
         capacities = {'ram_free': {'total_mb': total_ram_mb_free,
                                    'units_by_mb': ram_mb_free_units},
@@ -251,6 +263,34 @@ class CellStateManager(base.Base):
                                     'units_by_mb': disk_mb_free_units}}
         self.my_cell_state.update_capacities(capacities)
 
+    def _update_compute_nodes(self, context):
+        """Update the free resources we keep for our compute nodes.
+
+        Only the compute nodes created, updated or deleted since the
+        previous call are read from the DB, all of them the first time.
+        """
+        now = timeutils.utcnow()
+        if self._compute_nodes_checked_at is None:
+            self._compute_nodes = {}
+            compute_nodes = self.db.compute_node_get_all(context,
+                                                         use_slave=True)
+        else:
+            updated_since = (self._compute_nodes_checked_at -
+                             _CAPACITY_CHANGES_OVERLAP)
+            compute_nodes = self.db.compute_node_get_all(context,
+                    use_slave=False, updated_since=updated_since)
+        self._compute_nodes_checked_at = now
+
+        for compute in compute_nodes:
+            service = compute['service']
+            if compute['deleted'] or not service:
+                self._compute_nodes.pop(compute['id'], None)
+                continue
+            self._compute_nodes[compute['id']] = {
+                    'service_id': service['id'],
+                    'free_ram_mb': compute['free_ram_mb'],
+                    'free_disk_mb': compute['free_disk_gb'] * 1024}
+
     @lockutils.synchronized('cell-db-sync', 'nova-')
     def _cell_db_sync(self):
         """Update status for all cells if it's time.  Most calls to
@@ -46,3 +46,17 @@ def get_instances_to_sync(context, updated_since=None, project_id=None,
             yield instance['uuid']
         else:
             yield instance
+
+
+def batches(iterable, batch_size):
+    """Return a generator that will return lists of up to batch_size
+    items of iterable.
+    """
+    batch = []
+    for item in iterable:
+        batch.append(item)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
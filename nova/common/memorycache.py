@@ -47,18 +47,40 @@ class Client(object):
     def __init__(self, *args, **kwargs):
         """Ignores the passed in args."""
         self.cache = {}
+        self.last_expunge = None
+
+    def _expunge(self, now):
+        """Drops expired keys, at most once a second."""
+        if now == self.last_expunge:
+            return
+        self.last_expunge = now
+        for k in self.cache.keys():
+            (timeout, _value) = self.cache[k]
+            if timeout and now >= timeout:
+                del self.cache[k]
 
     def get(self, key):
         """Retrieves the value for a key or None.
 
-        this expunges expired keys during each get"""
+        this expunges expired keys during the first get of each second"""
 
-        for k in self.cache.keys():
-            (timeout, _value) = self.cache[k]
-            if timeout and timeutils.utcnow_ts() >= timeout:
-                del self.cache[k]
+        now = timeutils.utcnow_ts()
+        self._expunge(now)
 
-        return self.cache.get(key, (0, None))[1]
+        (timeout, value) = self.cache.get(key, (0, None))
+        if timeout and now >= timeout:
+            del self.cache[key]
+            return None
+        return value
+
+    def get_multi(self, keys):
+        """Retrieves a dict of the values of the keys which are set."""
+        values = {}
+        for key in keys:
+            value = self.get(key)
+            if value is not None:
+                values[key] = value
+        return values
 
     def set(self, key, value, time=0, min_compress_len=0):
         """Sets the value for a key."""
@@ -82,3 +104,12 @@ class Client(object):
         new_value = int(value) + delta
         self.cache[key] = (self.cache[key][0], str(new_value))
         return new_value
+
+    def decr(self, key, delta=1):
+        """Decrements the value for a key, not going below 0."""
+        value = self.get(key)
+        if value is None:
+            return None
+        new_value = max(int(value) - delta, 0)
+        self.cache[key] = (self.cache[key][0], str(new_value))
+        return new_value
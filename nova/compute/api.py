@@ -2245,7 +2245,8 @@ class API(base.Base):
             check_policy(context, 'get_instance_faults', instance)
 
         uuids = [instance['uuid'] for instance in instances]
-        return self.db.instance_fault_get_by_instance_uuids(context, uuids)
+        return self.db.instance_fault_get_by_instance_uuids(context, uuids,
+                                                            use_slave=True)
 
     def get_instance_bdms(self, context, instance):
         """Get all bdm tables for specified instance."""
@@ -94,6 +94,12 @@ compute_opts = [
     cfg.BoolOpt('instance_usage_audit',
                default=False,
                help="Generate periodic compute.instance.exists notifications"),
+    cfg.IntOpt('instance_usage_audit_page_size',
+               default=100,
+               help='Number of instances the instance usage audit reads '
+                    'and sends exists notifications for at a time. The '
+                    'audit resumes after the last complete page when '
+                    'restarted'),
     cfg.IntOpt('live_migration_retry_count',
                default=30,
                help="Number of 1 second retries needed in live_migration"),
@@ -3085,47 +3091,89 @@ class ComputeManager(manager.SchedulerDependentManager):
 
     @manager.periodic_task
     def _instance_usage_audit(self, context):
-        if CONF.instance_usage_audit:
-            if not compute_utils.has_audit_been_run(context, self.host):
-                begin, end = utils.last_completed_audit_period()
-                capi = self.conductor_api
-                instances = capi.instance_get_active_by_window_joined(
-                    context, begin, end, host=self.host)
-                num_instances = len(instances)
-                errors = 0
-                successes = 0
-                LOG.info(_("Running instance usage audit for"
-                           " host %(host)s from %(begin_time)s to "
-                           "%(end_time)s. %(number_instances)s"
-                           " instances.") % dict(host=self.host,
-                               begin_time=begin,
-                               end_time=end,
-                               number_instances=num_instances))
-                start_time = time.time()
-                compute_utils.start_instance_usage_audit(context,
-                                              begin, end,
-                                              self.host, num_instances)
-                for instance in instances:
-                    try:
-                        compute_utils.notify_usage_exists(
-                            context, instance,
-                            ignore_missing_network_data=False)
-                        successes += 1
-                    except Exception:
-                        LOG.exception(_('Failed to generate usage '
-                                        'audit for instance '
-                                        'on host %s') % self.host,
-                                      instance=instance)
-                        errors += 1
-                compute_utils.finish_instance_usage_audit(context,
-                                              begin, end,
-                                              self.host, errors,
-                                              "Instance usage audit ran "
-                                              "for host %s, %s instances "
-                                              "in %s seconds." % (
-                                              self.host,
-                                              num_instances,
-                                              time.time() - start_time))
+        if not CONF.instance_usage_audit:
+            return
+        begin, end = utils.last_completed_audit_period()
+        task_log = compute_utils.get_instance_usage_audit(context, begin, end,
+                                                          self.host)
+        if task_log is None:
+            marker = None
+            num_instances = errors = 0
+            compute_utils.start_instance_usage_audit(context, begin, end,
+                                                     self.host, 0)
+        elif task_log['state'] == 'RUNNING':
+            # NOTE: We were stopped in the middle of the audit, carry on
+            # after the last page we finished.
+            marker = task_log['marker'] and int(task_log['marker'])
+            num_instances = task_log['task_items']
+            errors = task_log['errors']
+        else:
+            return
+
+        LOG.info(_("Running instance usage audit for host %(host)s from "
+                   "%(begin_time)s to %(end_time)s, %(number_instances)s "
+                   "instances already audited.") %
+                 dict(host=self.host, begin_time=begin, end_time=end,
+                      number_instances=num_instances))
+        start_time = time.time()
+        page_size = CONF.instance_usage_audit_page_size
+        while True:
+            instances = self.conductor_api.instance_get_active_by_window(
+                context, begin, end, host=self.host,
+                columns_to_join=['info_cache', 'instance_type',
+                                 'system_metadata'],
+                marker=marker, limit=page_size)
+            if not instances:
+                break
+            errors += self._notify_usage_exists_for_page(context, instances,
+                                                         begin)
+            num_instances += len(instances)
+            marker = instances[-1]['id']
+            compute_utils.checkpoint_instance_usage_audit(context, begin,
+                                                          end, self.host,
+                                                          str(marker),
+                                                          num_instances,
+                                                          errors)
+            if len(instances) < page_size:
+                break
+            # Let other work on this host run between pages.
+            greenthread.sleep(0)
+
+        compute_utils.finish_instance_usage_audit(context,
+                                      begin, end,
+                                      self.host, errors,
+                                      "Instance usage audit ran "
+                                      "for host %s, %s instances "
+                                      "in %s seconds." % (
+                                      self.host,
+                                      num_instances,
+                                      time.time() - start_time))
+
+    def _notify_usage_exists_for_page(self, context, instances, begin):
+        """Send the exists notifications of a page of instances, with the
+        bandwidth usage of all of them read at once.  Returns the number of
+        instances that failed.
+        """
+        uuids = [instance['uuid'] for instance in instances]
+        bw_usages = dict((uuid, []) for uuid in uuids)
+        for bw_usage in self.conductor_api.bw_usage_get_by_uuids(context,
+                                                                 uuids,
+                                                                 begin):
+            bw_usages[bw_usage['uuid']].append(bw_usage)
+        errors = 0
+        for instance in instances:
+            try:
+                compute_utils.notify_usage_exists(
+                    context, instance,
+                    ignore_missing_network_data=False,
+                    bw_usages=bw_usages[instance['uuid']])
+            except Exception:
+                LOG.exception(_('Failed to generate usage '
+                                'audit for instance '
+                                'on host %s') % self.host,
+                              instance=instance)
+                errors += 1
+        return errors
 
     @manager.periodic_task
     def _poll_bandwidth_usage(self, context):
@@ -3147,27 +3195,43 @@ class ComputeManager(manager.SchedulerDependentManager):
                 # they just don't get the info in the usage events.
                 return
 
+            if not bw_counters:
+                return
+
+            instance_uuids = list(set(bw_ctr['uuid']
+                                      for bw_ctr in bw_counters))
+            usages = self.conductor_api.bw_usage_get_by_uuids(
+                context, instance_uuids, start_time)
+            usages = dict(((usage['uuid'], usage['mac']), usage)
+                          for usage in usages)
+            missing = [bw_ctr['uuid'] for bw_ctr in bw_counters
+                       if (bw_ctr['uuid'], bw_ctr['mac_address'])
+                       not in usages]
+            prev_usages = {}
+            if missing:
+                # NOTE: Only the first poll of an audit period needs the
+                # counters left over from the previous period.
+                prev_usages = self.conductor_api.bw_usage_get_by_uuids(
+                    context, list(set(missing)), prev_time)
+                prev_usages = dict(((usage['uuid'], usage['mac']), usage)
+                                   for usage in prev_usages)
+
             refreshed = timeutils.utcnow()
+            updates = []
             for bw_ctr in bw_counters:
-                # Allow switching of greenthreads between queries.
-                greenthread.sleep(0)
                 bw_in = 0
                 bw_out = 0
                 last_ctr_in = None
                 last_ctr_out = None
-                usage = self.conductor_api.bw_usage_get(context,
-                                                        bw_ctr['uuid'],
-                                                        start_time,
-                                                        bw_ctr['mac_address'])
+                key = (bw_ctr['uuid'], bw_ctr['mac_address'])
+                usage = usages.get(key)
                 if usage:
                     bw_in = usage['bw_in']
                     bw_out = usage['bw_out']
                     last_ctr_in = usage['last_ctr_in']
                     last_ctr_out = usage['last_ctr_out']
                 else:
-                    usage = self.conductor_api.bw_usage_get(
-                        context, bw_ctr['uuid'], prev_time,
-                        bw_ctr['mac_address'])
+                    usage = prev_usages.get(key)
                     if usage:
                         last_ctr_in = usage['last_ctr_in']
                         last_ctr_out = usage['last_ctr_out']
@@ -3186,15 +3250,16 @@ class ComputeManager(manager.SchedulerDependentManager):
                     else:
                         bw_out += (bw_ctr['bw_out'] - last_ctr_out)
 
-                self.conductor_api.bw_usage_update(context,
-                                                   bw_ctr['uuid'],
-                                                   bw_ctr['mac_address'],
-                                                   start_time,
-                                                   bw_in,
-                                                   bw_out,
-                                                   bw_ctr['bw_in'],
-                                                   bw_ctr['bw_out'],
-                                                   last_refreshed=refreshed)
+                updates.append(dict(uuid=bw_ctr['uuid'],
+                                    mac=bw_ctr['mac_address'],
+                                    bw_in=bw_in,
+                                    bw_out=bw_out,
+                                    last_ctr_in=bw_ctr['bw_in'],
+                                    last_ctr_out=bw_ctr['bw_out']))
+
+            self.conductor_api.bw_usage_update_bulk(context, start_time,
+                                                    updates,
+                                                    last_refreshed=refreshed)
 
     def _get_host_volume_bdms(self, context, host):
         """Return all block device mappings on a compute host."""
@@ -3210,16 +3275,16 @@ class ComputeManager(manager.SchedulerDependentManager):
 
     def _update_volume_usage_cache(self, context, vol_usages, refreshed):
         """Updates the volume usage cache table with a list of stats."""
-        for usage in vol_usages:
-            # Allow switching of greenthreads between queries.
-            greenthread.sleep(0)
-            self.conductor_api.vol_usage_update(context, usage['volume'],
-                                                usage['rd_req'],
-                                                usage['rd_bytes'],
-                                                usage['wr_req'],
-                                                usage['wr_bytes'],
-                                                usage['instance'],
-                                                last_refreshed=refreshed)
+        updates = [dict(volume=usage['volume'],
+                        instance_uuid=usage['instance']['uuid'],
+                        rd_req=usage['rd_req'],
+                        rd_bytes=usage['rd_bytes'],
+                        wr_req=usage['wr_req'],
+                        wr_bytes=usage['wr_bytes'])
+                   for usage in vol_usages]
+        if updates:
+            self.conductor_api.vol_usage_update_bulk(context, updates,
+                                                     last_refreshed=refreshed)
 
     def _send_volume_usage_notifications(self, context, start_time):
         """Queries vol usage cache table and sends a vol usage notification."""
@@ -3303,8 +3368,8 @@ class ComputeManager(manager.SchedulerDependentManager):
             LOG.warn(_("Found %(num_db_instances)s in the database and "
                        "%(num_vm_instances)s on the hypervisor.") % locals())
 
+        vm_power_states = {}
         for db_instance in db_instances:
-            db_power_state = db_instance['power_state']
             if db_instance['task_state'] is not None:
                 LOG.info(_("During sync_power_state the instance has a "
                            "pending task. Skip."), instance=db_instance)
@@ -3315,12 +3380,28 @@ class ComputeManager(manager.SchedulerDependentManager):
                 vm_power_state = vm_instance['state']
             except exception.InstanceNotFound:
                 vm_power_state = power_state.SHUTDOWN
-            # Note(maoy): the above get_info call might take a long time,
-            # for example, because of a broken libvirt driver.
-            # We re-query the DB to get the latest instance info to minimize
-            # (not eliminate) race condition.
-            u = self.conductor_api.instance_get_by_uuid(context,
-                                                        db_instance['uuid'])
+            vm_power_states[db_instance['uuid']] = vm_power_state
+
+        if not vm_power_states:
+            return
+
+        # Note(maoy): the above get_info calls might take a long time,
+        # for example, because of a broken libvirt driver.
+        # We re-query the DB to get the latest instance info to minimize
+        # (not eliminate) race condition.
+        refreshed = self.conductor_api.instance_get_all_by_uuids(
+            context, vm_power_states.keys())
+        refreshed = dict((inst['uuid'], inst) for inst in refreshed)
+
+        for db_instance in db_instances:
+            if db_instance['uuid'] not in vm_power_states:
+                continue
+            vm_power_state = vm_power_states[db_instance['uuid']]
+            u = refreshed.get(db_instance['uuid'])
+            if u is None:
+                LOG.info(_("During sync_power_state the instance was "
+                           "deleted. Skip."), instance=db_instance)
+                continue
             db_power_state = u["power_state"]
             vm_state = u['vm_state']
             if self.host != u['host']:
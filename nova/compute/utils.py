@@ -29,7 +29,6 @@ from nova import notifications
 from nova.openstack.common import cfg
 from nova.openstack.common import log
 from nova.openstack.common.notifier import api as notifier_api
-from nova import utils
 from nova.virt import driver
 
 CONF = cfg.CONF
@@ -136,7 +135,8 @@ def _get_unused_letters(used_letters):
 
 def notify_usage_exists(context, instance_ref, current_period=False,
                         ignore_missing_network_data=True,
-                        system_metadata=None, extra_usage_info=None):
+                        system_metadata=None, extra_usage_info=None,
+                        bw_usages=None):
     """Generates 'exists' notification for an instance for usage auditing
     purposes.
 
@@ -151,12 +151,14 @@ def notify_usage_exists(context, instance_ref, current_period=False,
         potential custom modifications.
     :param extra_usage_info: Dictionary containing extra values to add or
         override in the notification if not None.
+    :param bw_usages: bandwidth usage DB entries of the instance for the
+        audit period, read from the DB if None.
     """
 
     audit_start, audit_end = notifications.audit_period_bounds(current_period)
 
     bw = notifications.bandwidth_usage(instance_ref, audit_start,
-            ignore_missing_network_data)
+            ignore_missing_network_data, bw_usages)
 
     if system_metadata is None:
         system_metadata = metadata_to_dict(instance_ref['system_metadata'])
@@ -211,14 +213,11 @@ def get_nw_info_for_instance(instance):
     return network_model.NetworkInfo.hydrate(cached_nwinfo)
 
 
-def has_audit_been_run(context, host, timestamp=None):
-    begin, end = utils.last_completed_audit_period(before=timestamp)
-    task_log = db.task_log_get(context, "instance_usage_audit",
-                               begin, end, host)
-    if task_log:
-        return True
-    else:
-        return False
+def get_instance_usage_audit(context, begin, end, host):
+    """Return the task log of the audit of the period on host, None if the
+    audit was not started.
+    """
+    return db.task_log_get(context, "instance_usage_audit", begin, end, host)
 
 
 def start_instance_usage_audit(context, begin, end, host, num_instances):
@@ -226,6 +225,12 @@ def start_instance_usage_audit(context, begin, end, host, num_instances):
                            num_instances, "Instance usage audit started...")
 
 
+def checkpoint_instance_usage_audit(context, begin, end, host, marker,
+                                    num_instances, errors):
+    db.task_log_checkpoint_task(context, "instance_usage_audit", begin, end,
+                                host, marker, num_instances, errors)
+
+
 def finish_instance_usage_audit(context, begin, end, host, errors, message):
     db.task_log_end_task(context, "instance_usage_audit", begin, end, host,
                          errors, message)
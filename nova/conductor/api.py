@@ -88,6 +88,10 @@ class LocalAPI(object):
     def instance_get_by_uuid(self, context, instance_uuid):
         return self._manager.instance_get_by_uuid(context, instance_uuid)
 
+    def instance_get_all_by_uuids(self, context, instance_uuids):
+        return self._manager.instance_get_all_by_uuids(context,
+                                                       instance_uuids)
+
     def instance_destroy(self, context, instance):
         return self._manager.instance_destroy(context, instance)
 
@@ -113,9 +117,12 @@ class LocalAPI(object):
                                                                 timeout)
 
     def instance_get_active_by_window(self, context, begin, end=None,
-                                       project_id=None, host=None):
+                                       project_id=None, host=None,
+                                       columns_to_join=None, marker=None,
+                                       limit=None):
         return self._manager.instance_get_active_by_window(
-            context, begin, end, project_id, host)
+            context, begin, end, project_id, host,
+            columns_to_join=columns_to_join, marker=marker, limit=limit)
 
     def instance_info_cache_update(self, context, instance, values):
         return self._manager.instance_info_cache_update(context,
@@ -181,6 +188,15 @@ class LocalAPI(object):
                                              last_ctr_in, last_ctr_out,
                                              last_refreshed)
 
+    def bw_usage_get_by_uuids(self, context, uuids, start_period):
+        return self._manager.bw_usage_get_by_uuids(context, uuids,
+                                                   start_period)
+
+    def bw_usage_update_bulk(self, context, start_period, usages,
+                             last_refreshed=None):
+        return self._manager.bw_usage_update_bulk(context, start_period,
+                                                  usages, last_refreshed)
+
     def get_backdoor_port(self, context, host):
         raise exc.InvalidRequest
 
@@ -244,6 +260,12 @@ class LocalAPI(object):
                                               instance, last_refreshed,
                                               update_totals)
 
+    def vol_usage_update_bulk(self, context, vol_usages, last_refreshed=None,
+                              update_totals=False):
+        return self._manager.vol_usage_update_bulk(context, vol_usages,
+                                                   last_refreshed,
+                                                   update_totals)
+
     def service_get_all(self, context):
         return self._manager.service_get_all_by(context)
 
@@ -342,6 +364,10 @@ class API(object):
         return self.conductor_rpcapi.instance_get_by_uuid(context,
                                                           instance_uuid)
 
+    def instance_get_all_by_uuids(self, context, instance_uuids):
+        return self.conductor_rpcapi.instance_get_all_by_uuids(context,
+                                                               instance_uuids)
+
     def instance_get_all(self, context):
         return self.conductor_rpcapi.instance_get_all(context)
 
@@ -365,9 +391,12 @@ class API(object):
             context, timeout)
 
     def instance_get_active_by_window(self, context, begin, end=None,
-                                      project_id=None, host=None):
+                                      project_id=None, host=None,
+                                      columns_to_join=None, marker=None,
+                                      limit=None):
         return self.conductor_rpcapi.instance_get_active_by_window(
-            context, begin, end, project_id, host)
+            context, begin, end, project_id, host,
+            columns_to_join=columns_to_join, marker=marker, limit=limit)
 
     def instance_info_cache_update(self, context, instance, values):
         return self.conductor_rpcapi.instance_info_cache_update(context,
@@ -441,6 +470,17 @@ class API(object):
             bw_in, bw_out, last_ctr_in, last_ctr_out,
             last_refreshed)
 
+    def bw_usage_get_by_uuids(self, context, uuids, start_period):
+        return self.conductor_rpcapi.bw_usage_get_by_uuids(context, uuids,
+                                                           start_period)
+
+    def bw_usage_update_bulk(self, context, start_period, usages,
+                             last_refreshed=None):
+        return self.conductor_rpcapi.bw_usage_update_bulk(context,
+                                                          start_period,
+                                                          usages,
+                                                          last_refreshed)
+
     #NOTE(mtreinish): This doesn't work on multiple conductors without any
     # topic calculation in conductor_rpcapi. So the host param isn't used
     # currently.
@@ -510,6 +550,13 @@ class API(object):
                                                       instance, last_refreshed,
                                                       update_totals)
 
+    def vol_usage_update_bulk(self, context, vol_usages, last_refreshed=None,
+                              update_totals=False):
+        return self.conductor_rpcapi.vol_usage_update_bulk(context,
+                                                           vol_usages,
+                                                           last_refreshed,
+                                                           update_totals)
+
     def service_get_all(self, context):
         return self.conductor_rpcapi.service_get_all_by(context)
 
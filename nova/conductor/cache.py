@@ -0,0 +1,162 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2013 OpenStack LLC.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""In-memory cache for slowly-changing conductor lookups."""
+
+import collections
+import copy
+import functools
+
+from nova.openstack.common import cfg
+from nova.openstack.common import timeutils
+
+cache_opts = [
+    cfg.ListOpt('cached_methods',
+                default=['instance_type_get:600',
+                         'agent_build_get_by_triple:600'],
+                help='Conductor read methods whose results are cached in '
+                     'memory, as method[:ttl] entries. Entries without a '
+                     'ttl use cache_ttl, a ttl of 0 disables caching. '
+                     'Results of '
+                     'security_group_rule_get_by_security_group and '
+                     'provider_fw_rule_get_all are only refreshed by ttl, '
+                     'so only add them if firewall updates may lag by that '
+                     'long. aggregate_get_by_host is only invalidated by '
+                     'aggregate writes made through this conductor, other '
+                     'changes are only seen once its ttl runs out'),
+    cfg.IntOpt('cache_ttl',
+               default=60,
+               help='Default number of seconds a cached conductor result '
+                    'is served before it is read from the database again'),
+    cfg.IntOpt('cache_size',
+               default=1000,
+               help='Maximum number of results cached per conductor '
+                    'method, the ones expiring first are dropped to make '
+                    'room'),
+]
+
+CONF = cfg.CONF
+CONF.register_opts(cache_opts, 'conductor')
+
+
+class ConductorCache(object):
+    """Per-method TTL cache of primitive conductor results.
+
+    Each conductor process keeps its own cache; write methods handled by
+    the same process invalidate it explicitly, anything else expires by ttl.
+    """
+
+    def __init__(self):
+        self._ttls = {}
+        for entry in CONF.conductor.cached_methods:
+            method, _sep, ttl = entry.partition(':')
+            method = method.strip()
+            ttl = int(ttl) if ttl else CONF.conductor.cache_ttl
+            if method and ttl > 0:
+                self._ttls[method] = ttl
+        # NOTE: Every result of a method is kept for the same ttl, so the
+        # entries are in the order they expire.
+        self._entries = dict((method, collections.OrderedDict())
+                             for method in self._ttls)
+        self.hits = dict((method, 0) for method in self._ttls)
+        self.misses = dict((method, 0) for method in self._ttls)
+
+    def is_enabled(self, method):
+        return method in self._ttls
+
+    def get(self, method, key):
+        """Return (True, value) for a fresh entry, (False, None) otherwise."""
+        entries = self._entries[method]
+        entry = entries.get(key)
+        if entry is not None:
+            expires, value = entry
+            if timeutils.utcnow_ts() < expires:
+                self.hits[method] += 1
+                return True, copy.deepcopy(value)
+            del entries[key]
+        self.misses[method] += 1
+        return False, None
+
+    def set(self, method, key, value):
+        now = timeutils.utcnow_ts()
+        entries = self._entries[method]
+        entries.pop(key, None)
+        while entries:
+            oldest = next(entries.itervalues())
+            if (oldest[0] > now and
+                len(entries) < CONF.conductor.cache_size):
+                break
+            entries.popitem(last=False)
+        entries[key] = (now + self._ttls[method], copy.deepcopy(value))
+
+    def invalidate(self, method):
+        """Drop every cached result of a method."""
+        if method in self._entries:
+            self._entries[method].clear()
+
+    def stats(self):
+        return dict((method, {'hits': self.hits[method],
+                              'misses': self.misses[method],
+                              'entries': len(self._entries[method])})
+                    for method in self._ttls)
+
+
+def _context_key(context):
+    # NOTE: Visibility of flavors and friends depends on who is asking.
+    return (context.is_admin, context.project_id, context.read_deleted)
+
+
+def cached(key_func):
+    """Decorator for ConductorManager read methods.
+
+    key_func is called with the method's arguments (minus self and context)
+    and returns a hashable key identifying the result.
+    """
+    def outer(f):
+        @functools.wraps(f)
+        def wrapper(self, context, *args, **kwargs):
+            cache = self.cache
+            method = f.__name__
+            if not cache.is_enabled(method):
+                return f(self, context, *args, **kwargs)
+            key = (_context_key(context), key_func(*args, **kwargs))
+            found, value = cache.get(method, key)
+            if found:
+                return value
+            value = f(self, context, *args, **kwargs)
+            cache.set(method, key, value)
+            return value
+        return wrapper
+    return outer
+
+
+def invalidates(*methods):
+    """Decorator for ConductorManager write methods.
+
+    Drops the cached results of the given read methods once the write
+    has completed.
+    """
+    def outer(f):
+        @functools.wraps(f)
+        def wrapper(self, *args, **kwargs):
+            try:
+                return f(self, *args, **kwargs)
+            finally:
+                for method in methods:
+                    self.cache.invalidate(method)
+        return wrapper
+    return outer
@@ -14,6 +14,7 @@
 
 """Handles database requests from other nova services."""
 
+from nova.conductor import cache
 from nova import exception
 from nova import manager
 from nova import notifications
@@ -43,11 +44,12 @@ datetime_fields = ['launched_at', 'terminated_at']
 class ConductorManager(manager.SchedulerDependentManager):
     """Mission: TBD."""
 
-    RPC_API_VERSION = '1.34'
+    RPC_API_VERSION = '1.36'
 
     def __init__(self, *args, **kwargs):
         super(ConductorManager, self).__init__(service_name='conductor',
                                                *args, **kwargs)
+        self.cache = cache.ConductorCache()
 
     def ping(self, context, arg):
         return jsonutils.to_primitive({'service': 'conductor', 'arg': arg})
@@ -80,6 +82,19 @@ class ConductorManager(manager.SchedulerDependentManager):
         return jsonutils.to_primitive(
             self.db.instance_get_by_uuid(context, instance_uuid))
 
+    def instance_get_all_by_uuids(self, context, instance_uuids):
+        if not instance_uuids:
+            return []
+        result = self.db.instance_get_all_by_filters(
+            context, {'uuid': instance_uuids}, 'created_at', 'desc',
+            use_slave=False)
+        # NOTE: instance_get_by_uuid() honors read_deleted, but the filters
+        # query returns deleted rows unless asked not to. Keep the bulk
+        # variant consistent with the single lookup.
+        if context.read_deleted == 'no':
+            result = [inst for inst in result if not inst['deleted']]
+        return jsonutils.to_primitive(result)
+
     def instance_get_all(self, context):
         return jsonutils.to_primitive(self.db.instance_get_all(context))
 
@@ -125,6 +140,7 @@ class ConductorManager(manager.SchedulerDependentManager):
         return jsonutils.to_primitive(migration_ref)
 
     @rpc_common.client_exceptions(exception.AggregateHostExists)
+    @cache.invalidates('aggregate_get_by_host')
     def aggregate_host_add(self, context, aggregate, host):
         host_ref = self.db.aggregate_host_add(context.elevated(),
                 aggregate['id'], host)
@@ -132,6 +148,7 @@ class ConductorManager(manager.SchedulerDependentManager):
         return jsonutils.to_primitive(host_ref)
 
     @rpc_common.client_exceptions(exception.AggregateHostNotFound)
+    @cache.invalidates('aggregate_get_by_host')
     def aggregate_host_delete(self, context, aggregate, host):
         self.db.aggregate_host_delete(context.elevated(),
                 aggregate['id'], host)
@@ -141,11 +158,13 @@ class ConductorManager(manager.SchedulerDependentManager):
         aggregate = self.db.aggregate_get(context.elevated(), aggregate_id)
         return jsonutils.to_primitive(aggregate)
 
+    @cache.cached(lambda host, key=None: (host, key))
     def aggregate_get_by_host(self, context, host, key=None):
         aggregates = self.db.aggregate_get_by_host(context.elevated(),
                                                    host, key)
         return jsonutils.to_primitive(aggregates)
 
+    @cache.invalidates('aggregate_get_by_host')
     def aggregate_metadata_add(self, context, aggregate, metadata,
                                set_delete=False):
         new_metadata = self.db.aggregate_metadata_add(context.elevated(),
@@ -154,6 +173,7 @@ class ConductorManager(manager.SchedulerDependentManager):
         return jsonutils.to_primitive(new_metadata)
 
     @rpc_common.client_exceptions(exception.AggregateMetadataNotFound)
+    @cache.invalidates('aggregate_get_by_host')
     def aggregate_metadata_delete(self, context, aggregate, key):
         self.db.aggregate_metadata_delete(context.elevated(),
                                           aggregate['id'], key)
@@ -166,9 +186,28 @@ class ConductorManager(manager.SchedulerDependentManager):
             self.db.bw_usage_update(context, uuid, mac, start_period,
                                     bw_in, bw_out, last_ctr_in, last_ctr_out,
                                     last_refreshed)
-        usage = self.db.bw_usage_get(context, uuid, start_period, mac)
+        # NOTE: A replica may not have seen the update yet.
+        usage = self.db.bw_usage_get(context, uuid, start_period, mac,
+                                     use_slave=False)
         return jsonutils.to_primitive(usage)
 
+    def bw_usage_get_by_uuids(self, context, uuids, start_period):
+        # NOTE: The usages are updated from what is read here, a replica
+        # may not have seen the last update yet.
+        usages = self.db.bw_usage_get_by_uuids(context, uuids, start_period,
+                                               use_slave=False)
+        return jsonutils.to_primitive(usages)
+
+    def bw_usage_update_bulk(self, context, start_period, usages,
+                             last_refreshed=None):
+        """Update cached bandwidth usage for many (uuid, mac) pairs.
+
+        :param usages: list of dicts with uuid, mac, bw_in, bw_out,
+                       last_ctr_in and last_ctr_out keys
+        """
+        self.db.bw_usage_update_bulk(context, start_period, usages,
+                                     last_refreshed)
+
     def get_backdoor_port(self, context):
         return self.backdoor_port
 
@@ -177,15 +216,19 @@ class ConductorManager(manager.SchedulerDependentManager):
                                                        instance['id'])
         return jsonutils.to_primitive(group)
 
+    @cache.cached(lambda secgroup: secgroup['id'])
     def security_group_rule_get_by_security_group(self, context, secgroup):
         rule = self.db.security_group_rule_get_by_security_group(
             context, secgroup['id'])
         return jsonutils.to_primitive(rule)
 
+    @cache.cached(lambda: None)
     def provider_fw_rule_get_all(self, context):
         rules = self.db.provider_fw_rule_get_all(context)
         return jsonutils.to_primitive(rules)
 
+    @cache.cached(lambda hypervisor, os, architecture: (hypervisor, os,
+                                                        architecture))
     def agent_build_get_by_triple(self, context, hypervisor, os, architecture):
         info = self.db.agent_build_get_by_triple(context, hypervisor, os,
                                                  architecture)
@@ -233,11 +276,12 @@ class ConductorManager(manager.SchedulerDependentManager):
         return jsonutils.to_primitive(result)
 
     def instance_get_active_by_window(self, context, begin, end=None,
-                                      project_id=None, host=None):
+                                      project_id=None, host=None,
+                                      columns_to_join=None, marker=None,
+                                      limit=None):
         result = self.db.instance_get_active_by_window_joined(context,
-                                                              begin, end,
-                                                              project_id,
-                                                              host)
+                begin, end, project_id, host, use_slave=True,
+                columns_to_join=columns_to_join, marker=marker, limit=limit)
         return jsonutils.to_primitive(result)
 
     def instance_destroy(self, context, instance):
@@ -250,6 +294,7 @@ class ConductorManager(manager.SchedulerDependentManager):
         self.db.instance_info_cache_update(context, instance['uuid'],
                                            values)
 
+    @cache.cached(lambda instance_type_id: instance_type_id)
     def instance_type_get(self, context, instance_type_id):
         result = self.db.instance_type_get(context, instance_type_id)
         return jsonutils.to_primitive(result)
@@ -265,6 +310,20 @@ class ConductorManager(manager.SchedulerDependentManager):
                                  wr_bytes, instance['uuid'], last_refreshed,
                                  update_totals)
 
+    def vol_usage_update_bulk(self, context, vol_usages, last_refreshed=None,
+                              update_totals=False):
+        """Update cached volume usage for many volumes.
+
+        :param vol_usages: list of dicts with volume, instance_uuid,
+                           rd_req, rd_bytes, wr_req and wr_bytes keys
+        """
+        for usage in vol_usages:
+            self.db.vol_usage_update(context, usage['volume'],
+                                     usage['rd_req'], usage['rd_bytes'],
+                                     usage['wr_req'], usage['wr_bytes'],
+                                     usage['instance_uuid'], last_refreshed,
+                                     update_totals)
+
     @rpc_common.client_exceptions(exception.HostBinaryNotFound)
     def service_get_all_by(self, context, topic=None, host=None, binary=None):
         if not any((topic, host, binary)):
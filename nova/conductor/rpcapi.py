@@ -67,6 +67,10 @@ class ConductorAPI(nova.openstack.common.rpc.proxy.RpcProxy):
     1.32 - Added optional node to instance_get_all_by_host
     1.33 - Added compute_node_create and compute_node_update
     1.34 - Added service_update
+    1.35 - Added instance_get_all_by_uuids, bw_usage_get_by_uuids,
+           bw_usage_update_bulk and vol_usage_update_bulk
+    1.36 - Added columns_to_join, marker and limit to
+           instance_get_active_by_window
     """
 
     BASE_RPC_API_VERSION = '1.0'
@@ -98,6 +102,11 @@ class ConductorAPI(nova.openstack.common.rpc.proxy.RpcProxy):
                             instance_uuid=instance_uuid)
         return self.call(context, msg, version='1.2')
 
+    def instance_get_all_by_uuids(self, context, instance_uuids):
+        msg = self.make_msg('instance_get_all_by_uuids',
+                            instance_uuids=instance_uuids)
+        return self.call(context, msg, version='1.35')
+
     def migration_get(self, context, migration_id):
         msg = self.make_msg('migration_get', migration_id=migration_id)
         return self.call(context, msg, version='1.4')
@@ -173,6 +182,18 @@ class ConductorAPI(nova.openstack.common.rpc.proxy.RpcProxy):
                             last_refreshed=last_refreshed)
         return self.call(context, msg, version='1.5')
 
+    def bw_usage_get_by_uuids(self, context, uuids, start_period):
+        msg = self.make_msg('bw_usage_get_by_uuids', uuids=uuids,
+                            start_period=start_period)
+        return self.call(context, msg, version='1.35')
+
+    def bw_usage_update_bulk(self, context, start_period, usages,
+                             last_refreshed=None):
+        msg = self.make_msg('bw_usage_update_bulk',
+                            start_period=start_period, usages=usages,
+                            last_refreshed=last_refreshed)
+        return self.call(context, msg, version='1.35')
+
     def get_backdoor_port(self, context):
         msg = self.make_msg('get_backdoor_port')
         return self.call(context, msg, version='1.6')
@@ -235,11 +256,14 @@ class ConductorAPI(nova.openstack.common.rpc.proxy.RpcProxy):
         return self.call(context, msg, version='1.15')
 
     def instance_get_active_by_window(self, context, begin, end=None,
-                                      project_id=None, host=None):
+                                      project_id=None, host=None,
+                                      columns_to_join=None, marker=None,
+                                      limit=None):
         msg = self.make_msg('instance_get_active_by_window',
                             begin=begin, end=end, project_id=project_id,
-                            host=host)
-        return self.call(context, msg, version='1.15')
+                            host=host, columns_to_join=columns_to_join,
+                            marker=marker, limit=limit)
+        return self.call(context, msg, version='1.36')
 
     def instance_destroy(self, context, instance):
         instance_p = jsonutils.to_primitive(instance)
@@ -272,6 +296,13 @@ class ConductorAPI(nova.openstack.common.rpc.proxy.RpcProxy):
                             update_totals=update_totals)
         return self.call(context, msg, version='1.19')
 
+    def vol_usage_update_bulk(self, context, vol_usages, last_refreshed=None,
+                              update_totals=False):
+        msg = self.make_msg('vol_usage_update_bulk', vol_usages=vol_usages,
+                            last_refreshed=last_refreshed,
+                            update_totals=update_totals)
+        return self.call(context, msg, version='1.35')
+
     def service_get_all_by(self, context, topic=None, host=None, binary=None):
         msg = self.make_msg('service_get_all_by', topic=topic, host=host,
                             binary=binary)
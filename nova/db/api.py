@@ -195,9 +195,15 @@ def compute_node_get(context, compute_id):
     return IMPL.compute_node_get(context, compute_id)
 
 
-def compute_node_get_all(context):
-    """Get all computeNodes."""
-    return IMPL.compute_node_get_all(context)
+def compute_node_get_all(context, use_slave=False, updated_since=None):
+    """Get all computeNodes.
+
+    Reads from the slave database, if configured, when use_slave is True.
+    If updated_since is given, only the computeNodes created, updated or
+    deleted after that time are returned, deleted ones included.
+    """
+    return IMPL.compute_node_get_all(context, use_slave=use_slave,
+                                     updated_since=updated_since)
 
 
 def compute_node_search_by_hypervisor(context, hypervisor_match):
@@ -222,6 +228,11 @@ def compute_node_get_by_host(context, host):
     return IMPL.compute_node_get_by_host(context, host)
 
 
+def compute_node_get_by_hosts(context, hosts):
+    """Get computeNodes for a list of service hosts."""
+    return IMPL.compute_node_get_by_hosts(context, hosts)
+
+
 def compute_node_statistics(context):
     return IMPL.compute_node_statistics(context)
 
@@ -614,11 +625,16 @@ def instance_get_all(context, columns_to_join=None):
 
 
 def instance_get_all_by_filters(context, filters, sort_key='created_at',
-                                sort_dir='desc', limit=None, marker=None):
-    """Get all instances that match all filters."""
+                                sort_dir='desc', limit=None, marker=None,
+                                use_slave=False):
+    """Get all instances that match all filters.
+
+    Reads from the slave database, if configured, when use_slave is True.
+    """
     return IMPL.instance_get_all_by_filters(context, filters, sort_key,
                                             sort_dir, limit=limit,
-                                            marker=marker)
+                                            marker=marker,
+                                            use_slave=use_slave)
 
 
 def instance_get_active_by_window(context, begin, end=None, project_id=None,
@@ -633,14 +649,22 @@ def instance_get_active_by_window(context, begin, end=None, project_id=None,
 
 
 def instance_get_active_by_window_joined(context, begin, end=None,
-                                         project_id=None, host=None):
+                                         project_id=None, host=None,
+                                         use_slave=False, columns_to_join=None,
+                                         marker=None, limit=None):
     """Get instances and joins active during a certain time window.
 
     Specifying a project_id will filter for a certain project.
     Specifying a host will filter for instances on a given compute host.
+    Reads from the slave database, if configured, when use_slave is True.
+    With a limit, returns at most limit instances in id order, after the
+    instance with id marker if given.
     """
     return IMPL.instance_get_active_by_window_joined(context, begin, end,
-                                              project_id, host)
+                                              project_id, host,
+                                              use_slave=use_slave,
+                                              columns_to_join=columns_to_join,
+                                              marker=marker, limit=limit)
 
 
 def instance_get_all_by_project(context, project_id):
@@ -707,6 +731,15 @@ def instance_update(context, instance_uuid, values, update_cells=True):
     return rv
 
 
+def instance_update_or_create_bulk(context, values_list):
+    """Update instances by uuid, creating the ones that do not exist.
+
+    Used to apply instance updates from child cells, so the cells are
+    not notified.
+    """
+    return IMPL.instance_update_or_create_bulk(context, values_list)
+
+
 def instance_update_and_get_original(context, instance_uuid, values):
     """Set the given properties on an instance and update it. Return
     a shallow copy of the original instance reference, as well as the
@@ -1065,6 +1098,11 @@ def get_ec2_volume_id_by_uuid(context, volume_id):
     return IMPL.get_ec2_volume_id_by_uuid(context, volume_id)
 
 
+def get_ec2_volume_ids_by_uuids(context, volume_uuids):
+    """Get a dict of ec2 ids by uuid from volume_id_mappings table."""
+    return IMPL.get_ec2_volume_ids_by_uuids(context, volume_uuids)
+
+
 def get_volume_uuid_by_ec2_id(context, ec2_id):
     return IMPL.get_volume_uuid_by_ec2_id(context, ec2_id)
 
@@ -1081,6 +1119,11 @@ def get_ec2_snapshot_id_by_uuid(context, snapshot_id):
     return IMPL.get_ec2_snapshot_id_by_uuid(context, snapshot_id)
 
 
+def get_ec2_snapshot_ids_by_uuids(context, snapshot_uuids):
+    """Get a dict of ec2 ids by uuid from snapshot_id_mappings table."""
+    return IMPL.get_ec2_snapshot_ids_by_uuids(context, snapshot_uuids)
+
+
 def ec2_snapshot_create(context, snapshot_id, forced_id=None):
     return IMPL.ec2_snapshot_create(context, snapshot_id, forced_id)
 
@@ -1110,6 +1153,12 @@ def block_device_mapping_get_all_by_instance(context, instance_uuid):
                                                          instance_uuid)
 
 
+def block_device_mapping_get_all_by_instances(context, instance_uuids):
+    """Get all block device mapping belonging to a list of instances."""
+    return IMPL.block_device_mapping_get_all_by_instances(context,
+                                                          instance_uuids)
+
+
 def block_device_mapping_destroy(context, bdm_id):
     """Destroy the block device mapping."""
     return IMPL.block_device_mapping_destroy(context, bdm_id)
@@ -1451,14 +1500,22 @@ def agent_build_update(context, agent_build_id, values):
 ####################
 
 
-def bw_usage_get(context, uuid, start_period, mac):
-    """Return bw usage for instance and mac in a given audit period."""
-    return IMPL.bw_usage_get(context, uuid, start_period, mac)
+def bw_usage_get(context, uuid, start_period, mac, use_slave=False):
+    """Return bw usage for instance and mac in a given audit period.
+
+    Reads from the slave database, if configured, when use_slave is True.
+    """
+    return IMPL.bw_usage_get(context, uuid, start_period, mac,
+                             use_slave=use_slave)
+
 
+def bw_usage_get_by_uuids(context, uuids, start_period, use_slave=False):
+    """Return bw usages for instance(s) in a given audit period.
 
-def bw_usage_get_by_uuids(context, uuids, start_period):
-    """Return bw usages for instance(s) in a given audit period."""
-    return IMPL.bw_usage_get_by_uuids(context, uuids, start_period)
+    Reads from the slave database, if configured, when use_slave is True.
+    """
+    return IMPL.bw_usage_get_by_uuids(context, uuids, start_period,
+                                      use_slave=use_slave)
 
 
 def bw_usage_update(context, uuid, mac, start_period, bw_in, bw_out,
@@ -1479,6 +1536,29 @@ def bw_usage_update(context, uuid, mac, start_period, bw_in, bw_out,
     return rv
 
 
+def bw_usage_update_bulk(context, start_period, usages, last_refreshed=None,
+                         update_cells=True):
+    """Update cached bandwidth usage for many instance networks in one
+    transaction.  Creates new records if needed.
+
+    :param usages: list of dicts with uuid, mac, bw_in, bw_out,
+                   last_ctr_in and last_ctr_out keys
+    """
+    IMPL.bw_usage_update_bulk(context, start_period, usages,
+                              last_refreshed=last_refreshed)
+    if update_cells:
+        try:
+            cells_api = cells_rpcapi.CellsAPI()
+            for usage in usages:
+                cells_api.bw_usage_update_at_top(context,
+                        usage['uuid'], usage['mac'], start_period,
+                        usage['bw_in'], usage['bw_out'],
+                        usage['last_ctr_in'], usage['last_ctr_out'],
+                        last_refreshed)
+        except Exception:
+            LOG.exception(_("Failed to notify cells of bw_usage update"))
+
+
 ####################
 
 
@@ -1531,6 +1611,11 @@ def s3_image_get_by_uuid(context, image_uuid):
     return IMPL.s3_image_get_by_uuid(context, image_uuid)
 
 
+def s3_image_get_all_by_uuids(context, image_uuids):
+    """Find the local s3 images represented by a list of uuids."""
+    return IMPL.s3_image_get_all_by_uuids(context, image_uuids)
+
+
 def s3_image_create(context, image_uuid):
     """Create local s3 image represented by provided uuid."""
     return IMPL.s3_image_create(context, image_uuid)
@@ -1633,9 +1718,14 @@ def instance_fault_create(context, values, update_cells=True):
     return rv
 
 
-def instance_fault_get_by_instance_uuids(context, instance_uuids):
-    """Get all instance faults for the provided instance_uuids."""
-    return IMPL.instance_fault_get_by_instance_uuids(context, instance_uuids)
+def instance_fault_get_by_instance_uuids(context, instance_uuids,
+                                         use_slave=False):
+    """Get all instance faults for the provided instance_uuids.
+
+    Reads from the slave database, if configured, when use_slave is True.
+    """
+    return IMPL.instance_fault_get_by_instance_uuids(context, instance_uuids,
+                                                     use_slave=use_slave)
 
 
 ####################
@@ -1687,6 +1777,11 @@ def get_ec2_instance_id_by_uuid(context, instance_id):
     return IMPL.get_ec2_instance_id_by_uuid(context, instance_id)
 
 
+def get_ec2_instance_ids_by_uuids(context, instance_uuids):
+    """Get a dict of ec2 ids by uuid from instance_id_mappings table."""
+    return IMPL.get_ec2_instance_ids_by_uuids(context, instance_uuids)
+
+
 def get_instance_uuid_by_ec2_id(context, ec2_id):
     """Get uuid through ec2 id from instance_id_mappings table."""
     return IMPL.get_instance_uuid_by_ec2_id(context, ec2_id)
@@ -1705,16 +1800,14 @@ def task_log_end_task(context, task_name,
                         period_ending,
                         host,
                         errors,
-                        message=None,
-                        session=None):
+                        message=None):
     """Mark a task as complete for a given host/time period."""
     return IMPL.task_log_end_task(context, task_name,
                                   period_beginning,
                                   period_ending,
                                   host,
                                   errors,
-                                  message,
-                                  session)
+                                  message)
 
 
 def task_log_begin_task(context, task_name,
@@ -1722,25 +1815,42 @@ def task_log_begin_task(context, task_name,
                         period_ending,
                         host,
                         task_items=None,
-                        message=None,
-                        session=None):
+                        message=None):
     """Mark a task as started for a given host/time period."""
     return IMPL.task_log_begin_task(context, task_name,
                                     period_beginning,
                                     period_ending,
                                     host,
                                     task_items,
-                                    message,
-                                    session)
+                                    message)
+
+
+def task_log_checkpoint_task(context, task_name,
+                             period_beginning,
+                             period_ending,
+                             host,
+                             marker,
+                             task_items,
+                             errors):
+    """Record how far a running task got for a given host/time period,
+    for it to resume from there if interrupted.
+    """
+    return IMPL.task_log_checkpoint_task(context, task_name,
+                                         period_beginning,
+                                         period_ending,
+                                         host,
+                                         marker,
+                                         task_items,
+                                         errors)
 
 
 def task_log_get_all(context, task_name, period_beginning,
-                 period_ending, host=None, state=None, session=None):
+                 period_ending, host=None, state=None):
     return IMPL.task_log_get_all(context, task_name, period_beginning,
-                 period_ending, host, state, session)
+                 period_ending, host, state)
 
 
 def task_log_get(context, task_name, period_beginning,
-                 period_ending, host, state=None, session=None):
+                 period_ending, host, state=None):
     return IMPL.task_log_get(context, task_name, period_beginning,
-                 period_ending, host, state, session)
+                 period_ending, host, state)
@@ -26,6 +26,7 @@ import functools
 import uuid
 
 from sqlalchemy import and_
+from sqlalchemy import bindparam
 from sqlalchemy.exc import IntegrityError
 from sqlalchemy import or_
 from sqlalchemy.orm import joinedload
@@ -172,8 +173,11 @@ def model_query(context, model, *args, **kwargs):
     :param project_only: if present and context is user-type, then restrict
             query to match the context's project_id. If set to 'allow_none',
             restriction includes project_id = None.
+    :param use_slave: if True and no session is given, read from the slave
+            database when one is configured.
     """
-    session = kwargs.get('session') or get_session()
+    session = kwargs.get('session') or get_session(
+            slave_session=kwargs.get('use_slave', False))
     read_deleted = kwargs.get('read_deleted') or context.read_deleted
     project_only = kwargs.get('project_only', False)
 
@@ -471,10 +475,22 @@ def _compute_node_get(context, compute_id, session=None):
 
 
 @require_admin_context
-def compute_node_get_all(context):
-    return model_query(context, models.ComputeNode).\
+def compute_node_get_all(context, use_slave=False, updated_since=None):
+    if updated_since is None:
+        return model_query(context, models.ComputeNode,
+                           use_slave=use_slave).\
+                options(joinedload('service')).\
+                options(joinedload('stats')).\
+                all()
+
+    updated_since = timeutils.normalize_time(updated_since)
+    return model_query(context, models.ComputeNode, use_slave=use_slave,
+                       read_deleted="yes").\
             options(joinedload('service')).\
             options(joinedload('stats')).\
+            filter(or_(models.ComputeNode.created_at > updated_since,
+                       models.ComputeNode.updated_at > updated_since,
+                       models.ComputeNode.deleted_at > updated_since)).\
             all()
 
 
@@ -571,6 +587,18 @@ def compute_node_get_by_host(context, host):
     return result
 
 
+def compute_node_get_by_hosts(context, hosts):
+    """Get the capacity entries of several hosts in one query."""
+    if not hosts:
+        return []
+    return model_query(context, models.ComputeNode).\
+            join('service').\
+            options(joinedload('service')).\
+            filter(models.Service.host.in_(hosts)).\
+            filter_by(deleted=False).\
+            all()
+
+
 def compute_node_statistics(context):
     """Compute statistics over all compute nodes."""
     result = model_query(context,
@@ -1562,7 +1590,8 @@ def instance_get_all(context, columns_to_join=None):
 
 @require_context
 def instance_get_all_by_filters(context, filters, sort_key, sort_dir,
-                                limit=None, marker=None, session=None):
+                                limit=None, marker=None, session=None,
+                                use_slave=False):
     """Return instances that match all filters.  Deleted instances
     will be returned by default, unless there's a filter that says
     otherwise"""
@@ -1570,7 +1599,7 @@ def instance_get_all_by_filters(context, filters, sort_key, sort_dir,
     sort_fn = {'desc': desc, 'asc': asc}
 
     if not session:
-        session = get_session()
+        session = get_session(slave_session=use_slave)
 
     query_prefix = session.query(models.Instance).\
             options(joinedload('info_cache')).\
@@ -1686,16 +1715,19 @@ def instance_get_active_by_window(context, begin, end=None,
 
 @require_admin_context
 def instance_get_active_by_window_joined(context, begin, end=None,
-                                         project_id=None, host=None):
+                                         project_id=None, host=None,
+                                         use_slave=False, columns_to_join=None,
+                                         marker=None, limit=None):
     """Return instances and joins that were active during window."""
-    session = get_session()
+    if columns_to_join is None:
+        columns_to_join = ['info_cache', 'security_groups',
+                           'metadata', 'instance_type']
+    session = get_session(slave_session=use_slave)
     query = session.query(models.Instance)
 
-    query = query.options(joinedload('info_cache')).\
-                  options(joinedload('security_groups')).\
-                  options(joinedload('metadata')).\
-                  options(joinedload('instance_type')).\
-                  filter(or_(models.Instance.terminated_at == None,
+    for column in columns_to_join:
+        query = query.options(joinedload(column))
+    query = query.filter(or_(models.Instance.terminated_at == None,
                              models.Instance.terminated_at > begin))
     if end:
         query = query.filter(models.Instance.launched_at < end)
@@ -1703,6 +1735,13 @@ def instance_get_active_by_window_joined(context, begin, end=None,
         query = query.filter_by(project_id=project_id)
     if host:
         query = query.filter_by(host=host)
+    if limit is not None:
+        # NOTE: Pages are in id order, marker is the id of the last
+        # instance of the previous page.
+        query = query.order_by(models.Instance.id)
+        if marker is not None:
+            query = query.filter(models.Instance.id > marker)
+        query = query.limit(limit)
 
     return query.all()
 
@@ -1913,6 +1952,69 @@ def _instance_update(context, instance_uuid, values, copy_old_instance=False):
     return (old_instance_ref, instance_ref)
 
 
+@require_context
+def instance_update_or_create_bulk(context, values_list):
+    """Update instances by uuid, creating the ones that do not exist.
+
+    The existing instances, deleted or not, are loaded with one query and
+    updated in a single transaction.  'system_metadata' values are dicts
+    replacing the current system metadata, 'info_cache' values update the
+    info cache unless it was deleted.
+    """
+    uuids = [values['uuid'] for values in values_list]
+    missing = []
+    session = get_session()
+    with session.begin():
+        query = model_query(context, models.Instance, session=session,
+                            read_deleted="yes").\
+                options(joinedload('info_cache')).\
+                options(joinedload('system_metadata')).\
+                filter(models.Instance.uuid.in_(uuids))
+        instance_refs = dict((instance_ref['uuid'], instance_ref)
+                             for instance_ref in query.all())
+
+        for values in values_list:
+            instance_ref = instance_refs.get(values['uuid'])
+            if instance_ref is None:
+                missing.append(values)
+                continue
+            values = values.copy()
+
+            if ("hostname" in values and
+                    values["hostname"].lower() !=
+                    (instance_ref["hostname"] or '').lower()):
+                _validate_unique_server_name(context, session,
+                                             values['hostname'])
+
+            system_metadata = values.pop('system_metadata', None)
+            if system_metadata is not None:
+                # NOTE: Replaces the loaded system metadata, as
+                # instance_system_metadata_update(..., delete=True) does,
+                # without querying it again.
+                system_metadata = dict(system_metadata)
+                for meta_ref in instance_ref['system_metadata']:
+                    if meta_ref['key'] in system_metadata:
+                        meta_ref['value'] = system_metadata.pop(
+                                meta_ref['key'])
+                    else:
+                        meta_ref.soft_delete(session=session)
+                for key, value in system_metadata.iteritems():
+                    meta_ref = models.InstanceSystemMetadata()
+                    meta_ref.update({'key': key, 'value': value,
+                                     'instance_uuid': instance_ref['uuid']})
+                    session.add(meta_ref)
+
+            info_cache = values.pop('info_cache', None)
+            if (info_cache is not None and instance_ref['info_cache'] and
+                    not instance_ref['info_cache']['deleted']):
+                instance_ref['info_cache'].update(info_cache)
+
+            instance_ref.update(values)
+
+    for values in missing:
+        instance_create(context, values)
+
+
 def instance_add_security_group(context, instance_uuid, security_group_id):
     """Associate the given security group with the given instance."""
     sec_group_ref = models.SecurityGroupInstanceAssociation()
@@ -2882,6 +2984,7 @@ def ec2_volume_create(context, volume_uuid, id=None):
 def get_ec2_volume_id_by_uuid(context, volume_id, session=None):
     result = _ec2_volume_get_query(context, session=session).\
                     filter_by(uuid=volume_id).\
+                    order_by(models.VolumeIdMapping.id).\
                     first()
 
     if not result:
@@ -2890,6 +2993,21 @@ def get_ec2_volume_id_by_uuid(context, volume_id, session=None):
     return result['id']
 
 
+@require_context
+def get_ec2_volume_ids_by_uuids(context, volume_uuids):
+    if not volume_uuids:
+        return {}
+    result = _ec2_volume_get_query(context).\
+                    filter(models.VolumeIdMapping.uuid.in_(volume_uuids)).\
+                    order_by(models.VolumeIdMapping.id).\
+                    all()
+
+    ec2_ids = {}
+    for mapping in result:
+        ec2_ids.setdefault(mapping['uuid'], mapping['id'])
+    return ec2_ids
+
+
 @require_context
 def get_volume_uuid_by_ec2_id(context, ec2_id, session=None):
     result = _ec2_volume_get_query(context, session=session).\
@@ -2919,6 +3037,7 @@ def ec2_snapshot_create(context, snapshot_uuid, id=None):
 def get_ec2_snapshot_id_by_uuid(context, snapshot_id, session=None):
     result = _ec2_snapshot_get_query(context, session=session).\
                     filter_by(uuid=snapshot_id).\
+                    order_by(models.SnapshotIdMapping.id).\
                     first()
 
     if not result:
@@ -2927,6 +3046,21 @@ def get_ec2_snapshot_id_by_uuid(context, snapshot_id, session=None):
     return result['id']
 
 
+@require_context
+def get_ec2_snapshot_ids_by_uuids(context, snapshot_uuids):
+    if not snapshot_uuids:
+        return {}
+    result = _ec2_snapshot_get_query(context).\
+                    filter(models.SnapshotIdMapping.uuid.in_(snapshot_uuids)).\
+                    order_by(models.SnapshotIdMapping.id).\
+                    all()
+
+    ec2_ids = {}
+    for mapping in result:
+        ec2_ids.setdefault(mapping['uuid'], mapping['id'])
+    return ec2_ids
+
+
 @require_context
 def get_snapshot_uuid_by_ec2_id(context, ec2_id, session=None):
     result = _ec2_snapshot_get_query(context, session=session).\
@@ -3000,6 +3134,16 @@ def block_device_mapping_get_all_by_instance(context, instance_uuid):
                  all()
 
 
+@require_context
+def block_device_mapping_get_all_by_instances(context, instance_uuids):
+    if not instance_uuids:
+        return []
+    return _block_device_mapping_get_query(context).\
+                 filter(models.BlockDeviceMapping.instance_uuid.in_(
+                        instance_uuids)).\
+                 all()
+
+
 @require_context
 def block_device_mapping_destroy(context, bdm_id):
     session = get_session()
@@ -3974,8 +4118,9 @@ def agent_build_update(context, agent_build_id, values):
 ####################
 
 @require_context
-def bw_usage_get(context, uuid, start_period, mac):
-    return model_query(context, models.BandwidthUsage, read_deleted="yes").\
+def bw_usage_get(context, uuid, start_period, mac, use_slave=False):
+    return model_query(context, models.BandwidthUsage, read_deleted="yes",
+                       use_slave=use_slave).\
                       filter_by(start_period=start_period).\
                       filter_by(uuid=uuid).\
                       filter_by(mac=mac).\
@@ -3983,8 +4128,9 @@ def bw_usage_get(context, uuid, start_period, mac):
 
 
 @require_context
-def bw_usage_get_by_uuids(context, uuids, start_period):
-    return model_query(context, models.BandwidthUsage, read_deleted="yes").\
+def bw_usage_get_by_uuids(context, uuids, start_period, use_slave=False):
+    return model_query(context, models.BandwidthUsage, read_deleted="yes",
+                       use_slave=use_slave).\
                    filter(models.BandwidthUsage.uuid.in_(uuids)).\
                    filter_by(start_period=start_period).\
                    all()
@@ -4030,6 +4176,54 @@ def bw_usage_update(context, uuid, mac, start_period, bw_in, bw_out,
         bwusage.save(session=session)
 
 
+@require_context
+def bw_usage_update_bulk(context, start_period, usages, last_refreshed=None):
+    if last_refreshed is None:
+        last_refreshed = timeutils.utcnow()
+
+    # NOTE: The rows of all usages are written with one executemany UPDATE
+    # and one executemany INSERT, the ORM would send a statement per row.
+    table = models.BandwidthUsage.__table__
+    session = get_session()
+    with session.begin():
+        uuids = list(set(usage['uuid'] for usage in usages))
+        existing = model_query(context, models.BandwidthUsage.uuid,
+                               models.BandwidthUsage.mac,
+                               session=session, read_deleted="yes").\
+                        filter(models.BandwidthUsage.uuid.in_(uuids)).\
+                        filter_by(start_period=start_period).\
+                        all()
+        existing = set((row.uuid, row.mac) for row in existing)
+
+        updates = []
+        inserts = []
+        for usage in usages:
+            values = {'last_refreshed': last_refreshed,
+                      'bw_in': usage['bw_in'],
+                      'bw_out': usage['bw_out'],
+                      'last_ctr_in': usage['last_ctr_in'],
+                      'last_ctr_out': usage['last_ctr_out']}
+            key = (usage['uuid'], usage['mac'])
+            if key in existing:
+                values.update(b_uuid=usage['uuid'], b_mac=usage['mac'])
+                updates.append(values)
+            else:
+                values.update(start_period=start_period,
+                              uuid=usage['uuid'], mac=usage['mac'])
+                inserts.append(values)
+                existing.add(key)
+
+        if updates:
+            session.execute(table.update().
+                    where(and_(table.c.start_period == start_period,
+                               table.c.uuid == bindparam('b_uuid'),
+                               table.c.mac == bindparam('b_mac'))).
+                    values(updated_at=timeutils.utcnow()),
+                    updates)
+        if inserts:
+            session.execute(table.insert(), inserts)
+
+
 ####################
 
 
@@ -4220,6 +4414,7 @@ def s3_image_get_by_uuid(context, image_uuid):
     """Find local s3 image represented by the provided uuid."""
     result = model_query(context, models.S3Image, read_deleted="yes").\
                  filter_by(uuid=image_uuid).\
+                 order_by(models.S3Image.id).\
                  first()
 
     if not result:
@@ -4228,6 +4423,16 @@ def s3_image_get_by_uuid(context, image_uuid):
     return result
 
 
+def s3_image_get_all_by_uuids(context, image_uuids):
+    """Find the local s3 images represented by the provided uuids."""
+    if not image_uuids:
+        return []
+    return model_query(context, models.S3Image, read_deleted="yes").\
+                 filter(models.S3Image.uuid.in_(image_uuids)).\
+                 order_by(models.S3Image.id).\
+                 all()
+
+
 def s3_image_create(context, image_uuid):
     """Create local s3 image represented by provided uuid."""
     try:
@@ -4540,9 +4745,11 @@ def instance_fault_create(context, values):
     return dict(fault_ref.iteritems())
 
 
-def instance_fault_get_by_instance_uuids(context, instance_uuids):
+def instance_fault_get_by_instance_uuids(context, instance_uuids,
+                                         use_slave=False):
     """Get all instance faults for the provided instance_uuids."""
-    rows = model_query(context, models.InstanceFault, read_deleted='no').\
+    rows = model_query(context, models.InstanceFault, read_deleted='no',
+                       use_slave=use_slave).\
                        filter(models.InstanceFault.instance_uuid.in_(
                            instance_uuids)).\
                        order_by(desc("created_at"), desc("id")).\
@@ -4699,6 +4906,7 @@ def get_ec2_instance_id_by_uuid(context, instance_id, session=None):
     result = _ec2_instance_get_query(context,
                                      session=session).\
                     filter_by(uuid=instance_id).\
+                    order_by(models.InstanceIdMapping.id).\
                     first()
 
     if not result:
@@ -4707,6 +4915,21 @@ def get_ec2_instance_id_by_uuid(context, instance_id, session=None):
     return result['id']
 
 
+@require_context
+def get_ec2_instance_ids_by_uuids(context, instance_uuids):
+    if not instance_uuids:
+        return {}
+    result = _ec2_instance_get_query(context).\
+                    filter(models.InstanceIdMapping.uuid.in_(instance_uuids)).\
+                    order_by(models.InstanceIdMapping.id).\
+                    all()
+
+    ec2_ids = {}
+    for mapping in result:
+        ec2_ids.setdefault(mapping['uuid'], mapping['id'])
+    return ec2_ids
+
+
 @require_context
 def get_instance_uuid_by_ec2_id(context, ec2_id, session=None):
     result = _ec2_instance_get_query(context,
@@ -4731,10 +4954,12 @@ def _ec2_instance_get_query(context, session=None):
 @require_admin_context
 def _task_log_get_query(context, task_name, period_beginning,
                         period_ending, host=None, state=None, session=None):
+    # NOTE: The periods are string columns, given datetimes are compared
+    # the way they are stored.
     query = model_query(context, models.TaskLog, session=session).\
                      filter_by(task_name=task_name).\
-                     filter_by(period_beginning=period_beginning).\
-                     filter_by(period_ending=period_ending)
+                     filter_by(period_beginning=str(period_beginning)).\
+                     filter_by(period_ending=str(period_ending))
     if host is not None:
         query = query.filter_by(host=host)
     if state is not None:
@@ -4745,15 +4970,15 @@ def _task_log_get_query(context, task_name, period_beginning,
 @require_admin_context
 def task_log_get(context, task_name, period_beginning, period_ending, host,
                  state=None):
-    return _task_log_get_query(task_name, period_beginning, period_ending,
-                               host, state).first()
+    return _task_log_get_query(context, task_name, period_beginning,
+                               period_ending, host, state).first()
 
 
 @require_admin_context
 def task_log_get_all(context, task_name, period_beginning, period_ending,
                      host=None, state=None):
-    return _task_log_get_query(task_name, period_beginning, period_ending,
-                               host, state).all()
+    return _task_log_get_query(context, task_name, period_beginning,
+                               period_ending, host, state).all()
 
 
 @require_admin_context
@@ -4771,8 +4996,8 @@ def task_log_begin_task(context, task_name, period_beginning, period_ending,
             raise exception.TaskAlreadyRunning(task_name=task_name, host=host)
         task = models.TaskLog()
         task.task_name = task_name
-        task.period_beginning = period_beginning
-        task.period_ending = period_ending
+        task.period_beginning = str(period_beginning)
+        task.period_ending = str(period_ending)
         task.host = host
         task.state = "RUNNING"
         if message:
@@ -4782,6 +5007,22 @@ def task_log_begin_task(context, task_name, period_beginning, period_ending,
         task.save(session=session)
 
 
+@require_admin_context
+def task_log_checkpoint_task(context, task_name, period_beginning,
+                             period_ending, host, marker, task_items, errors):
+    values = dict(marker=marker, task_items=task_items, errors=errors)
+
+    session = get_session()
+    with session.begin():
+        rows = _task_log_get_query(context, task_name, period_beginning,
+                                   period_ending, host, state="RUNNING",
+                                   session=session).\
+                        update(values)
+        if rows == 0:
+            #It's not running!
+            raise exception.TaskNotRunning(task_name=task_name, host=host)
+
+
 @require_admin_context
 def task_log_end_task(context, task_name, period_beginning, period_ending,
                       host, errors, message=None):
@@ -1043,3 +1043,5 @@ class TaskLog(BASE, NovaBase):
     message = Column(String(255), nullable=False)
     task_items = Column(Integer(), default=0)
     errors = Column(Integer(), default=0)
+    # Where a task interrupted while running resumes from.
+    marker = Column(String(255))
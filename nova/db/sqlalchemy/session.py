@@ -230,6 +230,7 @@ try:
     import MySQLdb
 except ImportError:
     MySQLdb = None
+from sqlalchemy.exc import DBAPIError
 from sqlalchemy.exc import DisconnectionError, OperationalError, IntegrityError
 import sqlalchemy.interfaces
 import sqlalchemy.orm
@@ -250,6 +251,11 @@ sql_opts = [
                default='sqlite:///' + paths.state_path_def('$sqlite_db'),
                help='The SQLAlchemy connection string used to connect to the '
                     'database'),
+    cfg.StrOpt('slave_connection',
+               default='',
+               help='The SQLAlchemy connection string used to connect to a '
+                    'read-only replica of the database. When set, read-heavy '
+                    'queries that opt in are sent there'),
     cfg.StrOpt('sqlite_db',
                default='nova.sqlite',
                help='the filename to use with sqlite'),
@@ -274,6 +280,11 @@ sql_opts = [
     cfg.IntOpt('sql_retry_interval',
                default=10,
                help='interval between retries of opening a sql connection'),
+    cfg.IntOpt('sql_ping_interval',
+               default=10,
+               help='Only ping pooled MySQL connections that have been idle '
+                    'for more than this many seconds before handing them out. '
+                    '0 pings on every checkout'),
     cfg.IntOpt('sql_max_overflow',
                default=None,
                help='If set, use this value for max_overflow with sqlalchemy'),
@@ -295,11 +306,24 @@ LOG = logging.getLogger(__name__)
 
 _ENGINE = None
 _MAKER = None
+_SLAVE_ENGINE = None
+_SLAVE_MAKER = None
+
 
+def get_session(autocommit=True, expire_on_commit=False, slave_session=False):
+    """Return a SQLAlchemy session.
 
-def get_session(autocommit=True, expire_on_commit=False):
-    """Return a SQLAlchemy session."""
+    With slave_session the session reads from slave_connection, if one is
+    configured, and from the primary database otherwise.
+    """
     global _MAKER
+    global _SLAVE_MAKER
+
+    if slave_session and CONF.slave_connection:
+        if _SLAVE_MAKER is None:
+            engine = get_engine(slave_engine=True)
+            _SLAVE_MAKER = get_maker(engine, autocommit, expire_on_commit)
+        return _SLAVE_MAKER()
 
     if _MAKER is None:
         engine = get_engine()
@@ -389,9 +413,17 @@ def wrap_db_error(f):
     return _wrap
 
 
-def get_engine():
-    """Return a SQLAlchemy engine."""
+def get_engine(slave_engine=False):
+    """Return a SQLAlchemy engine.
+
+    The slave engine has its own connection pool to slave_connection.
+    """
     global _ENGINE
+    global _SLAVE_ENGINE
+    if slave_engine and CONF.slave_connection:
+        if _SLAVE_ENGINE is None:
+            _SLAVE_ENGINE = create_engine(CONF.slave_connection)
+        return _SLAVE_ENGINE
     if _ENGINE is None:
         _ENGINE = create_engine(CONF.sql_connection)
     return _ENGINE
@@ -402,13 +434,22 @@ def synchronous_switch_listener(dbapi_conn, connection_rec):
     dbapi_conn.execute("PRAGMA synchronous = OFF")
 
 
+_REGEXP_CACHE = {}
+_REGEXP_CACHE_SIZE = 100
+
+
+def _regexp(expr, item):
+    reg = _REGEXP_CACHE.get(expr)
+    if reg is None:
+        if len(_REGEXP_CACHE) >= _REGEXP_CACHE_SIZE:
+            _REGEXP_CACHE.clear()
+        reg = _REGEXP_CACHE[expr] = re.compile(expr)
+    return reg.search(unicode(item)) is not None
+
+
 def add_regexp_listener(dbapi_con, con_record):
     """Add REGEXP function to sqlite connections."""
-
-    def regexp(expr, item):
-        reg = re.compile(expr)
-        return reg.search(unicode(item)) is not None
-    dbapi_con.create_function('regexp', 2, regexp)
+    dbapi_con.create_function('regexp', 2, _regexp)
 
 
 def greenthread_yield(dbapi_con, con_record):
@@ -421,14 +462,29 @@ def greenthread_yield(dbapi_con, con_record):
     greenthread.sleep(0)
 
 
+def last_used_listener(dbapi_conn, connection_rec):
+    """Remember when a connection was returned to the pool."""
+    if connection_rec is not None:
+        connection_rec.info['last_used'] = time.time()
+
+
 def ping_listener(dbapi_conn, connection_rec, connection_proxy):
     """
     Ensures that MySQL connections checked out of the
     pool are alive.
 
+    Connections that were opened or last used less than sql_ping_interval
+    seconds ago are not pinged. Queries that still find their connection
+    gone are retried once by Query.
+
     Borrowed from:
     http://groups.google.com/group/sqlalchemy/msg/a4ce563d802c929f
     """
+    if CONF.sql_ping_interval > 0:
+        last_used = connection_rec.info.get('last_used')
+        if (last_used is None or
+                time.time() - last_used < CONF.sql_ping_interval):
+            return
     try:
         dbapi_conn.cursor().execute('select 1')
     except dbapi_conn.OperationalError, ex:
@@ -469,7 +525,7 @@ def create_engine(sql_connection):
     if "sqlite" in connection_dict.drivername:
         engine_args["poolclass"] = NullPool
 
-        if CONF.sql_connection == "sqlite://":
+        if sql_connection == "sqlite://":
             engine_args["poolclass"] = StaticPool
             engine_args["connect_args"] = {'check_same_thread': False}
     elif all((CONF.sql_dbpool_enable, MySQLdb,
@@ -497,6 +553,7 @@ def create_engine(sql_connection):
     sqlalchemy.event.listen(engine, 'checkin', greenthread_yield)
 
     if 'mysql' in connection_dict.drivername:
+        sqlalchemy.event.listen(engine, 'checkin', last_used_listener)
         sqlalchemy.event.listen(engine, 'checkout', ping_listener)
     elif 'sqlite' in connection_dict.drivername:
         if not CONF.sqlite_synchronous:
@@ -534,7 +591,22 @@ def create_engine(sql_connection):
 
 
 class Query(sqlalchemy.orm.query.Query):
-    """Subclass of sqlalchemy.query with soft_delete() method."""
+    """Subclass of sqlalchemy.query with soft_delete() method.
+
+    Reads that lose their connection outside of a transaction, such as on a
+    pooled connection that the server closed while it was idle, are retried
+    once on a new connection.
+    """
+    def __iter__(self):
+        try:
+            return super(Query, self).__iter__()
+        except DBAPIError, e:
+            if (not e.connection_invalidated or
+                    self.session.transaction is not None):
+                raise
+            LOG.warn(_('Database connection was lost, retrying: %s'), e)
+            return super(Query, self).__iter__()
+
     def soft_delete(self, synchronize_session='evaluate'):
         return self.update({'deleted': True,
                             'updated_at': literal_column('updated_at'),
@@ -799,6 +799,10 @@ class CellMaxHopCountReached(NovaException):
     message = _("Cell message has reached maximum hop count: %(hop_count)s")
 
 
+class CellMessageCodecNotSupported(NovaException):
+    message = _("Cell message encoded with unsupported codec: %(codec)s")
+
+
 class NoCellsAvailable(NovaException):
     message = _("No cells available matching scheduling criteria.")
 
@@ -1059,6 +1063,11 @@ class InstanceIsLocked(InstanceInvalidState):
     message = _("Instance %(instance_uuid)s is locked")
 
 
+class HypervisorCallTimeout(NovaException):
+    message = _("Call %(method)s to the hypervisor did not return within "
+                "%(timeout)s seconds")
+
+
 class ConfigDriveMountFailed(NovaException):
     message = _("Could not mount vfat config drive. %(operation)s failed. "
                 "Error: %(error)s")
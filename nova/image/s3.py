@@ -80,6 +80,15 @@ class S3ImageService(object):
         self.service.__init__(*args, **kwargs)
 
     def _translate_uuids_to_ids(self, context, images):
+        # NOTE: Map the ids of the whole listing at once, the translation
+        # of each image then finds them in the id mapping cache.
+        glance_ids = []
+        for image in images:
+            glance_ids.append(image.get('id'))
+            properties = image.get('properties') or {}
+            glance_ids.append(properties.get('kernel_id'))
+            glance_ids.append(properties.get('ramdisk_id'))
+        ec2utils.glance_ids_to_ids(context, glance_ids)
         return [self._translate_uuid_to_id(context, img) for img in images]
 
     def _translate_uuid_to_id(self, context, image):
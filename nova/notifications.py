@@ -19,6 +19,8 @@
 the system.
 """
 
+import collections
+
 import nova.context
 from nova import db
 from nova import exception
@@ -49,11 +51,59 @@ notify_api_faults = cfg.BoolOpt('notify_api_faults', default=False,
     help='If set, send api.fault notifications on caught exceptions '
          'in the API service.')
 
+notify_update_opts = [
+    cfg.StrOpt('notify_update_format', default='full',
+        help='Payload of compute.instance.update notifications.  Valid '
+             'values are "full" for all the instance information, or '
+             '"compact" for the instance identifiers, the states and only '
+             'the fields the update changed, without bandwidth usage.  '
+             'Updates that are not given the instance from before the '
+             'change send all the fields.'),
+    cfg.IntOpt('notify_update_cache_size', default=1000,
+        help='Number of instances for which the image metadata and network '
+             'information of compute.instance.update notifications are '
+             'kept in memory.'),
+]
+
 
 CONF = cfg.CONF
 CONF.register_opt(notify_state_opt)
 CONF.register_opt(notify_any_opt)
 CONF.register_opt(notify_api_faults)
+CONF.register_opts(notify_update_opts)
+
+# Payload fields sent in every compact compute.instance.update notification.
+_UPDATE_IDENTITY_FIELDS = ('tenant_id', 'user_id', 'instance_id')
+
+
+class UpdatePayloadCache(object):
+    """Bounded in-memory cache of compute.instance.update payload parts.
+
+    The system metadata and network information of an instance are kept
+    for as long as the instance and its network info cache have the same
+    updated_at.  The least recently used instances are dropped when there
+    are more than notify_update_cache_size of them.
+    """
+
+    def __init__(self):
+        self._entries = collections.OrderedDict()
+
+    def get(self, uuid):
+        entry = self._entries.pop(uuid, None)
+        if entry is None:
+            entry = {'version': None, 'system_metadata': None,
+                     'nw_info': None}
+        if CONF.notify_update_cache_size > 0:
+            self._entries[uuid] = entry
+            while len(self._entries) > CONF.notify_update_cache_size:
+                self._entries.popitem(last=False)
+        return entry
+
+    def clear(self):
+        self._entries.clear()
+
+
+_UPDATE_PAYLOAD_CACHE = UpdatePayloadCache()
 
 
 def send_api_fault(url, status, exception):
@@ -102,12 +152,13 @@ def send_update(context, old_instance, new_instance, service=None, host=None):
         # value of verify_states need not be True as the check for states is
         # already done here
         send_update_with_states(context, new_instance, old_vm_state,
-                new_vm_state, old_task_state, new_task_state, service, host)
+                new_vm_state, old_task_state, new_task_state, service, host,
+                old_instance=old_instance)
 
     else:
         try:
             _send_instance_update_notification(context, new_instance,
-                    service=service, host=host)
+                    service=service, host=host, old_instance=old_instance)
         except Exception:
             LOG.exception(_("Failed to send state update notification"),
                     instance=new_instance)
@@ -115,9 +166,12 @@ def send_update(context, old_instance, new_instance, service=None, host=None):
 
 def send_update_with_states(context, instance, old_vm_state, new_vm_state,
         old_task_state, new_task_state, service="compute", host=None,
-        verify_states=False):
+        verify_states=False, old_instance=None):
     """Send compute.instance.update notification to report changes if there
     are any, in the instance
+
+    :param old_instance: the instance before the change, if known, which
+        compact notifications only send the changed fields of.
     """
 
     if not CONF.notify_on_state_change:
@@ -147,7 +201,7 @@ def send_update_with_states(context, instance, old_vm_state, new_vm_state,
             _send_instance_update_notification(context, instance,
                     old_vm_state=old_vm_state, old_task_state=old_task_state,
                     new_vm_state=new_vm_state, new_task_state=new_task_state,
-                    service=service, host=host)
+                    service=service, host=host, old_instance=old_instance)
         except Exception:
             LOG.exception(_("Failed to send state update notification"),
                     instance=instance)
@@ -155,11 +209,35 @@ def send_update_with_states(context, instance, old_vm_state, new_vm_state,
 
 def _send_instance_update_notification(context, instance, old_vm_state=None,
             old_task_state=None, new_vm_state=None, new_task_state=None,
-            service="compute", host=None):
+            service="compute", host=None, old_instance=None):
     """Send 'compute.instance.update' notification to inform observers
     about instance state changes"""
 
-    payload = info_from_instance(context, instance, None, None)
+    entry = _UPDATE_PAYLOAD_CACHE.get(instance['uuid'])
+    version = _instance_version(instance)
+    if version is None or entry['version'] != version:
+        entry['version'] = version
+        entry['system_metadata'] = None
+        entry['nw_info'] = None
+
+    # NOTE: Only the system metadata read from the DB is cached, joined
+    # system metadata is always the current one.
+    system_metadata = _joined_system_metadata(instance)
+    if system_metadata is None:
+        if entry['system_metadata'] is None:
+            entry['system_metadata'] = _instance_system_metadata(context,
+                                                                 instance)
+        system_metadata = entry['system_metadata']
+
+    payload = info_from_instance(context, instance, None, system_metadata)
+
+    compact = CONF.notify_update_format == 'compact'
+    if compact and old_instance is not None:
+        old_payload = info_from_instance(context, old_instance, None,
+                _joined_system_metadata(old_instance) or system_metadata)
+        payload = dict((key, value) for key, value in payload.iteritems()
+                       if (key in _UPDATE_IDENTITY_FIELDS or
+                           old_payload.get(key) != value))
 
     if not new_vm_state:
         new_vm_state = instance["vm_state"]
@@ -180,9 +258,12 @@ def _send_instance_update_notification(context, instance, old_vm_state=None,
     payload["audit_period_beginning"] = audit_start
     payload["audit_period_ending"] = audit_end
 
-    # add bw usage info:
-    bw = bandwidth_usage(instance, audit_start)
-    payload["bandwidth"] = bw
+    if not compact:
+        # add bw usage info:
+        if entry['nw_info'] is None:
+            entry['nw_info'] = _instance_nw_info(instance)
+        bw = bandwidth_usage(instance, audit_start, nw_info=entry['nw_info'])
+        payload["bandwidth"] = bw
 
     publisher_id = notifier_api.publisher_id(service, host)
 
@@ -190,6 +271,40 @@ def _send_instance_update_notification(context, instance, old_vm_state=None,
             notifier_api.INFO, payload)
 
 
+def _instance_version(instance):
+    """What the cached update payload parts of an instance depend on, None
+    if they can't be cached."""
+    if not instance.get('updated_at'):
+        return None
+    info_cache = instance.get('info_cache') or {}
+    return (str(instance['updated_at']), str(info_cache.get('updated_at')))
+
+
+def _joined_system_metadata(instance):
+    """The system metadata joined with an instance, None if it wasn't."""
+    system_metadata = instance.get('system_metadata')
+    if system_metadata is None or isinstance(system_metadata, dict):
+        return system_metadata
+    return dict((item['key'], item['value']) for item in system_metadata)
+
+
+def _instance_system_metadata(context, instance):
+    """The system metadata of an instance, read from the DB."""
+    try:
+        return db.instance_system_metadata_get(context, instance['uuid'])
+    except exception.NotFound:
+        return {}
+
+
+def _instance_nw_info(instance):
+    """The network info of an instance from its info cache, None to get it
+    from the network API."""
+    if (instance.get('info_cache') and
+        instance['info_cache'].get('network_info') is not None):
+        cached_info = instance['info_cache']['network_info']
+        return network_model.NetworkInfo.hydrate(cached_info)
+
+
 def audit_period_bounds(current_period=False):
     """Get the start and end of the relevant audit usage period
 
@@ -210,19 +325,20 @@ def audit_period_bounds(current_period=False):
 
 
 def bandwidth_usage(instance_ref, audit_start,
-        ignore_missing_network_data=True):
+        ignore_missing_network_data=True, bw_usages=None, nw_info=None):
     """Get bandwidth usage information for the instance for the
     specified audit period.
+
+    :param bw_usages: the bandwidth usage entries of the instance for the
+        audit period if already read, they are read from the DB if None.
+    :param nw_info: the network info of the instance if already known.
     """
 
     admin_context = nova.context.get_admin_context(read_deleted='yes')
 
-    if (instance_ref.get('info_cache') and
-        instance_ref['info_cache'].get('network_info') is not None):
-
-        cached_info = instance_ref['info_cache']['network_info']
-        nw_info = network_model.NetworkInfo.hydrate(cached_info)
-    else:
+    if nw_info is None:
+        nw_info = _instance_nw_info(instance_ref)
+    if nw_info is None:
         try:
             nw_info = network.API().get_instance_nw_info(admin_context,
                     instance_ref)
@@ -235,8 +351,10 @@ def bandwidth_usage(instance_ref, audit_start,
     macs = [vif['address'] for vif in nw_info]
     uuids = [instance_ref["uuid"]]
 
-    bw_usages = db.bw_usage_get_by_uuids(admin_context, uuids, audit_start)
-    bw_usages = [b for b in bw_usages if b.mac in macs]
+    if bw_usages is None:
+        bw_usages = db.bw_usage_get_by_uuids(admin_context, uuids,
+                                             audit_start, use_slave=True)
+    bw_usages = [b for b in bw_usages if b['mac'] in macs]
 
     bw = {}
 
@@ -247,7 +365,7 @@ def bandwidth_usage(instance_ref, audit_start,
                 label = vif['network']['label']
                 break
 
-        bw[label] = dict(bw_in=b.bw_in, bw_out=b.bw_out)
+        bw[label] = dict(bw_in=b['bw_in'], bw_out=b['bw_out'])
 
     return bw
 
@@ -18,6 +18,8 @@
 """Policy Engine For Nova."""
 
 import os.path
+import re
+import time
 
 from nova import exception
 from nova.openstack.common import cfg
@@ -32,6 +34,10 @@ policy_opts = [
     cfg.StrOpt('policy_default_rule',
                default='default',
                help=_('Rule checked when requested rule is not found')),
+    cfg.IntOpt('policy_check_interval',
+               default=1,
+               help=_('Minimum number of seconds between checks of the '
+                      'policy file for modifications')),
     ]
 
 CONF = cfg.CONF
@@ -39,13 +45,16 @@ CONF.register_opts(policy_opts)
 
 _POLICY_PATH = None
 _POLICY_CACHE = {}
+_COMPILED = None
 
 
 def reset():
     global _POLICY_PATH
     global _POLICY_CACHE
+    global _COMPILED
     _POLICY_PATH = None
     _POLICY_CACHE = {}
+    _COMPILED = None
     policy.reset()
 
 
@@ -58,8 +67,17 @@ def init():
             _POLICY_PATH = CONF.find_file(_POLICY_PATH)
         if not _POLICY_PATH:
             raise exception.ConfigNotFound(path=CONF.policy_file)
+    # NOTE: Only stat the policy file once per policy_check_interval, the
+    # timestamp lives in the cache so that dropping the cache forces a
+    # check.
+    now = time.time()
+    checked_at = _POLICY_CACHE.get('checked_at')
+    if (checked_at is not None and
+            0 <= now - checked_at < CONF.policy_check_interval):
+        return
     utils.read_cached_file(_POLICY_PATH, _POLICY_CACHE,
                            reload_func=_set_rules)
+    _POLICY_CACHE['checked_at'] = now
 
 
 def _set_rules(data):
@@ -67,6 +85,227 @@ def _set_rules(data):
     policy.set_rules(policy.Rules.load_json(data, default_rule))
 
 
+_MISSING = object()
+_TARGET_KEY_RE = re.compile(r'%\(([^)]+)\)')
+
+
+def _constant(value):
+    def check(target, creds):
+        return value
+    return check
+
+
+class _CompiledRule(object):
+    """A rule tree flattened into a single callable.
+
+    target_keys and cred_keys name the fields the rule looks at; they are
+    None when the rule contains checks whose inputs are not known, which
+    makes its result unsuitable for memoization.
+    """
+
+    __slots__ = ('check', 'target_keys', 'cred_keys', 'value')
+
+    def __init__(self, check, target_keys=(), cred_keys=(), value=None):
+        self.check = check
+        self.target_keys = target_keys
+        self.cred_keys = cred_keys
+        # True or False for rules that do not depend on their input.
+        self.value = value
+
+    @property
+    def cacheable(self):
+        return self.target_keys is not None and self.cred_keys is not None
+
+
+def _merge_keys(compiled, attr):
+    keys = set()
+    for rule in compiled:
+        rule_keys = getattr(rule, attr)
+        if rule_keys is None:
+            return None
+        keys.update(rule_keys)
+    return tuple(sorted(keys))
+
+
+def _compile_bool(check, rules, compiled, resolving):
+    # NOTE: Nested checks of the same kind are flattened and constant
+    # sub-rules that cannot change the outcome are dropped.  Evaluation
+    # order is kept, a failing lookup in an earlier sub-rule still denies.
+    is_and = isinstance(check, policy.AndCheck)
+    subrules = []
+    pending = list(check.rules)
+    while pending:
+        rule = pending.pop(0)
+        if type(rule) is type(check):
+            pending[:0] = rule.rules
+            continue
+        subrule = _compile(rule, rules, compiled, resolving)
+        if subrule.value is is_and:
+            continue
+        subrules.append(subrule)
+        if subrule.value is not None:
+            # Nothing after this one is ever evaluated.
+            break
+    if not subrules:
+        return _CompiledRule(_constant(is_and), value=is_and)
+    if len(subrules) == 1:
+        return subrules[0]
+
+    funcs = tuple(subrule.check for subrule in subrules)
+    if is_and:
+        def and_check(target, creds):
+            for func in funcs:
+                if not func(target, creds):
+                    return False
+            return True
+        func = and_check
+    else:
+        def or_check(target, creds):
+            for func in funcs:
+                if func(target, creds):
+                    return True
+            return False
+        func = or_check
+    return _CompiledRule(func, _merge_keys(subrules, 'target_keys'),
+                         _merge_keys(subrules, 'cred_keys'))
+
+
+def _rule_boundary(rule):
+    """Make a referenced rule deny, instead of raising, on missing fields.
+
+    RuleCheck stops a KeyError from the rule it references, so a missing
+    target or credential field only fails that rule and not the rules
+    around it, e.g. "rule:a or role:admin" and "not rule:a".
+    """
+    if rule.value is not None:
+        return rule
+    func = rule.check
+
+    def rule_check(target, creds):
+        try:
+            return func(target, creds)
+        except KeyError:
+            return False
+    return _CompiledRule(rule_check, rule.target_keys, rule.cred_keys)
+
+
+def _compile(check, rules, compiled, resolving=()):
+    """Turn a tree of policy Check objects into a _CompiledRule."""
+    check_type = type(check)
+    if check_type is policy.TrueCheck:
+        return _CompiledRule(check, value=True)
+    elif check_type is policy.FalseCheck:
+        return _CompiledRule(check, value=False)
+    elif check_type in (policy.AndCheck, policy.OrCheck):
+        return _compile_bool(check, rules, compiled, resolving)
+    elif check_type is policy.NotCheck:
+        rule = _compile(check.rule, rules, compiled, resolving)
+        if rule.value is not None:
+            return _CompiledRule(_constant(not rule.value),
+                                 value=not rule.value)
+        func = rule.check
+
+        def not_check(target, creds):
+            return not func(target, creds)
+        return _CompiledRule(not_check, rule.target_keys, rule.cred_keys)
+    elif check_type is policy.RuleCheck:
+        name = check.match
+        if name in compiled:
+            return _rule_boundary(compiled[name])
+        if name in resolving:
+            # A rule referencing itself, leave it to the original check.
+            return _CompiledRule(check, None, None)
+        try:
+            rule = rules[name]
+        except KeyError:
+            return _CompiledRule(_constant(False), value=False)
+        result = _compile(rule, rules, compiled, resolving + (name,))
+        if name in rules:
+            compiled[name] = result
+        return _rule_boundary(result)
+    elif check_type is policy.RoleCheck:
+        role = check.match.lower()
+
+        def role_check(target, creds):
+            return role in [x.lower() for x in creds['roles']]
+        return _CompiledRule(role_check, (), ('roles',))
+    elif check_type is IsAdminCheck:
+        return _CompiledRule(check, (), ('is_admin',))
+    elif check_type is policy.GenericCheck:
+        return _CompiledRule(check,
+                             tuple(_TARGET_KEY_RE.findall(check.match)),
+                             (check.kind,))
+    # http checks and anything registered elsewhere may look at all of
+    # the target and credentials.
+    return _CompiledRule(check, None, None)
+
+
+def _compile_rules(rules):
+    compiled = {}
+    for name in rules:
+        if name not in compiled:
+            compiled[name] = _compile(rules[name], rules, compiled, (name,))
+    return compiled
+
+
+def _get_compiled_rules():
+    """Return the compiled form of the rules currently in use."""
+    global _COMPILED
+    # NOTE: Rules may be installed directly through the common policy
+    # module, so recompile whenever the rules object changes.
+    rules = policy._rules
+    if _COMPILED is None or _COMPILED[0] is not rules:
+        _COMPILED = (rules, _compile_rules(rules or {}), {})
+    return _COMPILED
+
+
+def _get_compiled_rule(action):
+    rules, compiled, defaults = _get_compiled_rules()
+    try:
+        return compiled[action]
+    except KeyError:
+        pass
+    # Unknown actions fall back to the default rule, if there is one.
+    if action not in defaults:
+        try:
+            rule = rules[action]
+        except (KeyError, TypeError):
+            defaults[action] = _CompiledRule(_constant(False), value=False)
+        else:
+            defaults[action] = _compile(rule, rules, compiled)
+    return defaults[action]
+
+
+def _memo_key(context, action, rule, target):
+    values = [action]
+    try:
+        for key in rule.target_keys:
+            values.append(target.get(key, _MISSING))
+        for key in rule.cred_keys:
+            value = getattr(context, key, _MISSING)
+            if isinstance(value, list):
+                value = tuple(value)
+            values.append(value)
+        key = tuple(values)
+        hash(key)
+    except (AttributeError, TypeError):
+        return None
+    return key
+
+
+def _get_memo(context):
+    """Return the policy decisions already taken with this context."""
+    rules = policy._rules
+    memo = getattr(context, '_policy_memo', None)
+    if memo is None or memo[0] is not rules:
+        memo = (rules, {})
+        try:
+            context._policy_memo = memo
+        except AttributeError:
+            pass
+    return memo[1]
+
+
 def enforce(context, action, target, do_raise=True):
     """Verifies that the action is valid on the target in this context.
 
@@ -91,14 +330,30 @@ def enforce(context, action, target, do_raise=True):
     """
     init()
 
-    credentials = context.to_dict()
-
-    # Add the exception arguments if asked to do a raise
-    extra = {}
-    if do_raise:
-        extra.update(exc=exception.PolicyNotAuthorized, action=action)
-
-    return policy.check(action, target, credentials, **extra)
+    rule = _get_compiled_rule(action)
+    if rule.value is not None:
+        result = rule.value
+    else:
+        key = None
+        if rule.cacheable:
+            memo = _get_memo(context)
+            key = _memo_key(context, action, rule, target)
+        if key is not None and key in memo:
+            result = memo[key]
+        else:
+            credentials = context.to_dict()
+            try:
+                result = rule.check(target, credentials)
+            except KeyError:
+                # Missing target or credential fields fail closed
+                result = False
+            if key is not None:
+                memo[key] = result
+
+    if do_raise and result is False:
+        raise exception.PolicyNotAuthorized(action=action)
+
+    return result
 
 
 def check_is_admin(roles):
@@ -110,7 +365,11 @@ def check_is_admin(roles):
     target = {}
     credentials = {'roles': roles}
 
-    return policy.check('context_is_admin', target, credentials)
+    try:
+        return _get_compiled_rule('context_is_admin').check(target,
+                                                            credentials)
+    except KeyError:
+        return False
 
 
 @policy.register('is_admin')
@@ -0,0 +1,284 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2013 OpenStack LLC.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Long-lived rootwrap, serving commands over a local socket.
+
+nova-rootwrap-daemon is started once through sudo. It loads the rootwrap
+config and filters, listens on a unix socket in a new directory only the
+invoking user can enter, and writes the socket path and a random key on
+its stdout. Each request is a connection that proves it knows the key by
+answering a challenge, sends the command and its input, and gets back the
+exit code, stdout and stderr of the command. The daemon exits when its
+stdin is closed, i.e. when the service that started it goes away.
+
+Only the standard library is used here, the daemon runs as root.
+"""
+
+import hashlib
+import hmac
+import json
+import logging
+import os
+import signal
+import socket
+import struct
+import subprocess
+import threading
+
+from nova.openstack.common.rootwrap import filters as rootwrap_filters
+from nova.openstack.common.rootwrap import wrapper
+
+RC_UNAUTHORIZED = 99
+RC_NOEXECFOUND = 96
+
+_HEADER = struct.Struct('!I')
+_MAX_MESSAGE = 64 * 1024 * 1024
+
+
+class ProtocolError(Exception):
+    pass
+
+
+class ReplyLost(ProtocolError):
+    """The connection failed after the whole request was sent, the command
+    may have run."""
+    pass
+
+
+def _recv_exactly(sock, size):
+    chunks = []
+    while size:
+        chunk = sock.recv(min(size, 65536))
+        if not chunk:
+            raise ProtocolError('Connection closed')
+        chunks.append(chunk)
+        size -= len(chunk)
+    return ''.join(chunks)
+
+
+def send_message(sock, message):
+    # NOTE: Byte strings go through latin-1, which maps every byte to one
+    # character, so command output needs not be valid utf-8.
+    data = json.dumps(message)
+    sock.sendall(_HEADER.pack(len(data)) + data)
+
+
+def recv_message(sock):
+    size = _HEADER.unpack(_recv_exactly(sock, _HEADER.size))[0]
+    if size > _MAX_MESSAGE:
+        raise ProtocolError('Message too large')
+    return json.loads(_recv_exactly(sock, size))
+
+
+def _encode(data):
+    if data is None:
+        return None
+    return data.decode('latin-1')
+
+
+def _decode(data):
+    if data is None:
+        return None
+    return data.encode('latin-1')
+
+
+def _digest(authkey, challenge):
+    return hmac.new(authkey, challenge, hashlib.sha256).hexdigest()
+
+
+def _compare(a, b):
+    # NOTE: Takes the same time wherever the strings differ.
+    if len(a) != len(b):
+        return False
+    result = 0
+    for x, y in zip(a, b):
+        result |= ord(x) ^ ord(y)
+    return result == 0
+
+
+def _subprocess_setup():
+    # Python installs a SIGPIPE handler by default. This is usually not what
+    # non-Python subprocesses expect.
+    signal.signal(signal.SIGPIPE, signal.SIG_DFL)
+
+
+# Characters that make a RegExpFilter command pattern more than a name
+_REGEXP_SPECIAL_CHARS = frozenset('.^$*+?{}[]\\|()')
+
+
+def _command_name(f):
+    return os.path.basename(f.exec_path)
+
+
+def _regexp_command_name(f):
+    if f.args and not _REGEXP_SPECIAL_CHARS.intersection(f.args[0]):
+        return f.args[0]
+
+
+# NOTE: The commands (1st arguments) filters of these exact classes can
+# match. Filters of other classes may match any command.
+_COMMAND_NAMES = {
+    rootwrap_filters.CommandFilter: _command_name,
+    rootwrap_filters.RegExpFilter: _regexp_command_name,
+    rootwrap_filters.DnsmasqFilter: lambda f: 'env',
+    rootwrap_filters.DeprecatedDnsmasqFilter: lambda f: 'env',
+    rootwrap_filters.KillFilter: lambda f: 'kill',
+    rootwrap_filters.ReadFileFilter: lambda f: 'cat',
+}
+
+
+class FilterIndex(object):
+    """Filters grouped by the commands (1st arguments) they can match, so
+    that a command is only checked against its own filters.
+    """
+
+    def __init__(self, filterlist):
+        self.filters = list(filterlist)
+        # Filters that may match any command are checked for every command
+        self.any_command = []
+        self.by_command = {}
+        for f in self.filters:
+            name = _COMMAND_NAMES.get(type(f), lambda f: None)(f)
+            if name is None:
+                self.any_command.append(f)
+            else:
+                self.by_command.setdefault(name, []).append(f)
+        if self.any_command:
+            # Keep the order of filterlist, the first match wins
+            positions = dict((id(f), i) for i, f in enumerate(self.filters))
+            for command_filters in self.by_command.values():
+                command_filters.extend(self.any_command)
+                command_filters.sort(key=lambda f: positions[id(f)])
+
+    def get_filters(self, userargs):
+        """Returns the filters that may match userargs, in load order."""
+        if not userargs:
+            return self.any_command
+        return self.by_command.get(userargs[0], self.any_command)
+
+
+class RootwrapServer(object):
+    """Runs the commands allowed by the rootwrap filters for its clients."""
+
+    def __init__(self, config, filters, authkey, execname='nova-rootwrap'):
+        self.config = config
+        self.filters = FilterIndex(filters)
+        self.authkey = authkey
+        self.execname = execname
+
+    def _error(self, message, returncode):
+        if self.config.use_syslog:
+            logging.error(message)
+        return {'returncode': returncode,
+                'stdout': _encode('%s: %s\n' % (self.execname, message)),
+                'stderr': u''}
+
+    def run(self, userargs, process_input=None):
+        """Run a command, returns the message for the client."""
+        exec_dirs = self.config.exec_dirs
+        try:
+            filtermatch = wrapper.match_filter(
+                    self.filters.get_filters(userargs), userargs,
+                    exec_dirs=exec_dirs)
+        except wrapper.FilterMatchNotExecutable as exc:
+            return self._error("Executable not found: %s (filter match = %s)"
+                               % (exc.match.exec_path, exc.match.name),
+                               RC_NOEXECFOUND)
+        except wrapper.NoFilterMatched:
+            return self._error("Unauthorized command: %s (no filter matched)"
+                               % ' '.join(userargs), RC_UNAUTHORIZED)
+
+        command = filtermatch.get_command(userargs, exec_dirs=exec_dirs)
+        if self.config.use_syslog:
+            logging.info("Executing %s (filter match = %s)" % (
+                         command, filtermatch.name))
+        obj = subprocess.Popen(command,
+                               stdin=subprocess.PIPE,
+                               stdout=subprocess.PIPE,
+                               stderr=subprocess.PIPE,
+                               close_fds=True,
+                               preexec_fn=_subprocess_setup,
+                               env=filtermatch.get_environment(userargs))
+        stdout, stderr = obj.communicate(process_input)
+        return {'returncode': obj.returncode,
+                'stdout': _encode(stdout),
+                'stderr': _encode(stderr)}
+
+    def handle(self, sock):
+        """Serve the request of one connection."""
+        try:
+            challenge = os.urandom(32).encode('hex')
+            send_message(sock, {'challenge': challenge})
+            answer = recv_message(sock)
+            if not _compare(str(answer.get('digest', '')),
+                            _digest(self.authkey, challenge)):
+                return
+            request = recv_message(sock)
+            userargs = [str(arg) for arg in request['cmd']]
+            send_message(sock, self.run(userargs,
+                                        _decode(request.get('stdin'))))
+        except (ProtocolError, ValueError, KeyError, TypeError,
+                socket.error):
+            pass
+        finally:
+            sock.close()
+
+    def serve_forever(self, listener):
+        """Accept connections, serving each one in its own thread."""
+        while True:
+            sock, _addr = listener.accept()
+            thread = threading.Thread(target=self.handle, args=(sock,))
+            thread.daemon = True
+            thread.start()
+
+
+def listen(path):
+    listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    listener.bind(path)
+    listener.listen(128)
+    return listener
+
+
+class RootwrapDaemonClient(object):
+    """Sends commands to a rootwrap daemon listening on address."""
+
+    def __init__(self, address, authkey):
+        self.address = address
+        self.authkey = authkey
+
+    def execute(self, cmd, process_input=None):
+        """Run cmd through the daemon.
+
+        :returns: a tuple of (returncode, stdout, stderr)
+        :raises: ReplyLost if the connection fails once the request is sent
+        """
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            sock.connect(self.address)
+            challenge = recv_message(sock)['challenge']
+            send_message(sock, {'digest': _digest(self.authkey,
+                                                  str(challenge))})
+            send_message(sock, {'cmd': list(cmd),
+                                'stdin': _encode(process_input)})
+            try:
+                result = recv_message(sock)
+            except (ProtocolError, socket.error) as exc:
+                raise ReplyLost(str(exc))
+        finally:
+            sock.close()
+        return (result['returncode'], _decode(result['stdout']),
+                _decode(result['stderr']))
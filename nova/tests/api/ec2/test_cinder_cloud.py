@@ -32,6 +32,7 @@ from nova.openstack.common import cfg
 from nova.openstack.common import log as logging
 from nova.openstack.common import rpc
 from nova import test
+from nova.tests import ec2_id_cache_fixture
 from nova.tests import fake_network
 from nova.tests.image import fake
 from nova.tests import matchers
@@ -86,6 +87,7 @@ def get_instances_with_cached_ips(orig_func, *args, **kwargs):
 class CinderCloudTestCase(test.TestCase):
     def setUp(self):
         super(CinderCloudTestCase, self).setUp()
+        self.useFixture(ec2_id_cache_fixture.EC2IdCacheFixture())
         vol_tmpdir = tempfile.mkdtemp()
         self.flags(compute_driver='nova.virt.fake.FakeDriver',
                    volume_api_class='nova.tests.fake_volume.API')
@@ -44,6 +44,7 @@ from nova.openstack.common import cfg
 from nova.openstack.common import log as logging
 from nova.openstack.common import rpc
 from nova import test
+from nova.tests import ec2_id_cache_fixture
 from nova.tests import fake_network
 from nova.tests.image import fake
 from nova.tests import matchers
@@ -102,6 +103,7 @@ def get_instances_with_cached_ips(orig_func, *args, **kwargs):
 class CloudTestCase(test.TestCase):
     def setUp(self):
         super(CloudTestCase, self).setUp()
+        self.useFixture(ec2_id_cache_fixture.EC2IdCacheFixture())
         self.flags(compute_driver='nova.virt.fake.FakeDriver',
                    volume_api_class='nova.tests.fake_volume.API')
         self.useFixture(fixtures.FakeLogger('boto'))
@@ -812,6 +814,57 @@ class CloudTestCase(test.TestCase):
         db.service_destroy(self.context, comp1['id'])
         db.service_destroy(self.context, comp2['id'])
 
+    def test_describe_instances_bulk_lookups(self):
+        # Makes sure describe_instances looks data up for the whole page.
+        self._stub_instance_get_with_fixed_ips('get_all')
+
+        image_uuid = 'cedef40a-ed67-4d10-800e-17455edce175'
+        kernel_uuid = 'aebef40a-ed67-4d10-800e-17455edce175'
+        instances = []
+        for x in xrange(3):
+            instances.append(db.instance_create(self.context,
+                    {'reservation_id': 'a', 'image_ref': image_uuid,
+                     'kernel_id': kernel_uuid, 'instance_type_id': 1,
+                     'host': 'host%d' % (x % 2), 'vm_state': 'active'}))
+        service = db.service_create(self.context, {'host': 'host0',
+                                                   'topic': "compute"})
+        agg = db.aggregate_create(self.context,
+                {'name': 'agg1'}, {'availability_zone': 'zone1'})
+        db.aggregate_host_add(self.context, agg.id, 'host0')
+
+        def fail(*args, **kwargs):
+            self.fail('per-instance lookup')
+        self.stubs.Set(ec2utils, 'id_to_ec2_inst_id', fail)
+        self.stubs.Set(ec2utils, 'glance_id_to_ec2_id', fail)
+        self.stubs.Set(db, 'block_device_mapping_get_all_by_instance', fail)
+        self.stubs.Set(db, 'service_get_all_by_host', fail)
+
+        result = self.cloud.describe_instances(self.context)
+        result = result['reservationSet'][0]['instancesSet']
+        self.assertEqual(len(result), 3)
+        self.stubs.UnsetAll()
+
+        result = dict((formatted['instanceId'], formatted)
+                      for formatted in result)
+        result = [result[ec2utils.id_to_ec2_inst_id(instance['uuid'])]
+                  for instance in instances]
+        for formatted in result:
+            self.assertEqual(formatted['imageId'],
+                             ec2utils.glance_id_to_ec2_id(self.context,
+                                                          image_uuid))
+            self.assertEqual(formatted['kernelId'],
+                             ec2utils.glance_id_to_ec2_id(self.context,
+                                                          kernel_uuid, 'aki'))
+            self.assertFalse('ramdiskId' in formatted)
+        self.assertEqual(result[0]['placement']['availabilityZone'], 'zone1')
+        self.assertEqual(result[1]['placement']['availabilityZone'],
+                         'unknown zone')
+        self.assertEqual(result[2]['placement']['availabilityZone'], 'zone1')
+
+        for instance in instances:
+            db.instance_destroy(self.context, instance['uuid'])
+        db.service_destroy(self.context, service['id'])
+
     def test_describe_instances_all_invalid(self):
         # Makes sure describe_instances works and filters results.
         self.flags(use_ipv6=True)
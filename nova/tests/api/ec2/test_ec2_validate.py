@@ -29,6 +29,7 @@ from nova.openstack.common import log as logging
 from nova.openstack.common import rpc
 from nova.openstack.common import timeutils
 from nova import test
+from nova.tests import ec2_id_cache_fixture
 from nova.tests import fake_network
 from nova.tests.image import fake
 
@@ -40,6 +41,7 @@ LOG = logging.getLogger(__name__)
 class EC2ValidateTestCase(test.TestCase):
     def setUp(self):
         super(EC2ValidateTestCase, self).setUp()
+        self.useFixture(ec2_id_cache_fixture.EC2IdCacheFixture())
         self.flags(compute_driver='nova.virt.fake.FakeDriver')
 
         def dumb(*args, **kwargs):
@@ -250,3 +252,127 @@ class EC2TimestampValidationTestCase(test.TestCase):
         self.assertRaises(exception.InvalidRequest,
                           ec2utils.is_ec2_timestamp_expired,
                           params)
+
+
+class EC2IdMappingCacheTestCase(test.TestCase):
+    """Test case for the in-memory uuid to EC2 id mapping cache."""
+
+    def setUp(self):
+        super(EC2IdMappingCacheTestCase, self).setUp()
+        self.useFixture(ec2_id_cache_fixture.EC2IdCacheFixture())
+        self.context = context.get_admin_context()
+
+    def _fail_db_lookups(self, *names):
+        def fail(*args, **kwargs):
+            self.fail('Unexpected database lookup')
+        for name in names:
+            self.stubs.Set(db, name, fail)
+
+    def test_instance_ids_are_cached(self):
+        uuid = 'b48316c5-71e8-45e4-9884-6c78055b9b13'
+        int_id = db.ec2_instance_create(self.context, uuid)['id']
+        self.assertEqual(ec2utils.get_int_id_from_instance_uuid(self.context,
+                                                                uuid),
+                         int_id)
+        self._fail_db_lookups('get_ec2_instance_id_by_uuid',
+                              'get_instance_uuid_by_ec2_id')
+        self.assertEqual(ec2utils.get_int_id_from_instance_uuid(self.context,
+                                                                uuid),
+                         int_id)
+        self.assertEqual(ec2utils.id_to_ec2_inst_id(uuid),
+                         ec2utils.id_to_ec2_id(int_id))
+        self.assertEqual(ec2utils.get_instance_uuid_from_int_id(self.context,
+                                                                int_id),
+                         uuid)
+
+    def test_created_ids_are_cached(self):
+        uuid = 'e6f1a7a3-6d9a-4d1b-9a0e-0c1d4b1f7a21'
+        int_id = ec2utils.get_int_id_from_volume_uuid(self.context, uuid)
+        self._fail_db_lookups('get_ec2_volume_id_by_uuid', 'ec2_volume_create',
+                              'get_volume_uuid_by_ec2_id')
+        self.assertEqual(ec2utils.get_int_id_from_volume_uuid(self.context,
+                                                              uuid),
+                         int_id)
+        self.assertEqual(ec2utils.ec2_vol_id_to_uuid(
+                             ec2utils.id_to_ec2_vol_id(uuid)),
+                         uuid)
+
+    def test_bulk_lookup_warms_cache(self):
+        uuids = ['5b1b6d6e-0c4f-4b8e-8d8f-3a5f1e2c9d01',
+                 '5b1b6d6e-0c4f-4b8e-8d8f-3a5f1e2c9d02']
+        existing_id = db.ec2_snapshot_create(self.context, uuids[0])['id']
+        int_ids = ec2utils.get_int_ids_from_snapshot_uuids(self.context,
+                                                           uuids + [None])
+        self.assertEqual(sorted(int_ids), sorted(uuids))
+        self.assertEqual(int_ids[uuids[0]], existing_id)
+        self._fail_db_lookups('get_ec2_snapshot_id_by_uuid',
+                              'get_ec2_snapshot_ids_by_uuids',
+                              'ec2_snapshot_create')
+        for uuid in uuids:
+            self.assertEqual(
+                ec2utils.get_int_id_from_snapshot_uuid(self.context, uuid),
+                int_ids[uuid])
+        self.assertEqual(ec2utils.get_int_ids_from_snapshot_uuids(
+                             self.context, uuids),
+                         int_ids)
+
+    def _race_volume_create(self):
+        real_create = db.ec2_volume_create
+
+        def racing_create(context, uuid):
+            # Another worker maps the uuid just before this one does.
+            real_create(context, uuid)
+            return real_create(context, uuid)
+
+        self.stubs.Set(db, 'ec2_volume_create', racing_create)
+
+    def test_racing_create_caches_lowest_id(self):
+        uuid = '0c3f2b1e-8d4a-4c6e-9b7a-1e2d3c4b5a61'
+        self._race_volume_create()
+        int_id = ec2utils.get_int_id_from_volume_uuid(self.context, uuid)
+        self.assertEqual(int_id,
+                         db.get_ec2_volume_id_by_uuid(self.context, uuid))
+        self.assertEqual(ec2utils.get_int_ids_from_volume_uuids(self.context,
+                                                                [uuid]),
+                         {uuid: int_id})
+
+    def test_racing_bulk_create_caches_lowest_id(self):
+        uuid = '0c3f2b1e-8d4a-4c6e-9b7a-1e2d3c4b5a62'
+        self._race_volume_create()
+        int_ids = ec2utils.get_int_ids_from_volume_uuids(self.context, [uuid])
+        self.assertEqual(int_ids,
+                         db.get_ec2_volume_ids_by_uuids(self.context, [uuid]))
+        self.assertEqual(int_ids[uuid],
+                         db.get_ec2_volume_id_by_uuid(self.context, uuid))
+
+    def test_image_ids_are_cached(self):
+        image_id = ec2utils.glance_id_to_id(self.context, 'image-uuid')
+        self._fail_db_lookups('s3_image_get', 's3_image_get_by_uuid',
+                              's3_image_get_all_by_uuids', 's3_image_create')
+        self.assertEqual(ec2utils.glance_ids_to_ids(self.context,
+                                                    ['image-uuid', None]),
+                         {'image-uuid': image_id})
+        self.assertEqual(ec2utils.id_to_glance_id(self.context, image_id),
+                         'image-uuid')
+        self.assertEqual(ec2utils.id_to_glance_id(self.context,
+                                                  str(image_id)),
+                         'image-uuid')
+
+    def test_cache_size_is_bounded(self):
+        self.flags(ec2_id_cache_size=2)
+        cache = ec2utils.IdMappingCache()
+        cache.add('uuid1', 1)
+        cache.add('uuid2', 2)
+        self.assertEqual(cache.get_uuid(1), 'uuid1')
+        cache.add('uuid3', 3)
+        self.assertEqual(cache.get_id('uuid1'), 1)
+        self.assertEqual(cache.get_id('uuid2'), None)
+        self.assertEqual(cache.get_uuid(2), None)
+        self.assertEqual(cache.get_id('uuid3'), 3)
+
+    def test_cache_disabled(self):
+        self.flags(ec2_id_cache_size=0)
+        cache = ec2utils.IdMappingCache()
+        cache.add('uuid1', 1)
+        self.assertEqual(cache.get_id('uuid1'), None)
+        self.assertEqual(cache.get_uuid(1), None)
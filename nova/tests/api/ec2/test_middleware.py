@@ -25,8 +25,10 @@ from nova.api import ec2
 from nova import context
 from nova import exception
 from nova.openstack.common import cfg
+from nova.openstack.common import jsonutils
 from nova.openstack.common import timeutils
 from nova import test
+from nova import wsgi
 
 CONF = cfg.CONF
 
@@ -87,6 +89,106 @@ class LockoutTestCase(test.TestCase):
         self.assertFalse(self._is_locked_out('test'))
 
 
+class FakeKeystone(object):
+    """Stand-in for the keystone ec2tokens endpoint."""
+
+    def __init__(self):
+        self.requests = 0
+
+    @webob.dec.wsgify
+    def __call__(self, req):
+        self.requests += 1
+        creds = jsonutils.loads(req.body)['ec2Credentials']
+        if creds['signature'] != 'good':
+            raise webob.exc.HTTPUnauthorized()
+        result = {'access': {'token': {'id': 'token',
+                                       'tenant': {'id': 'project'}},
+                             'user': {'id': creds['access'],
+                                      'roles': [{'name': 'member'}]},
+                             'serviceCatalog': []}}
+        return webob.Response(body=jsonutils.dumps(result),
+                              content_type='application/json')
+
+
+@webob.dec.wsgify
+def context_user(req):
+    return str(req.environ['nova.context'].user_id)
+
+
+class EC2KeystoneAuthTestCase(test.TestCase):
+    """Test case for the EC2KeystoneAuth middleware."""
+
+    def setUp(self):
+        super(EC2KeystoneAuthTestCase, self).setUp()
+        self.keystone = FakeKeystone()
+        self.server = wsgi.Server("fake_keystone", self.keystone,
+                                  host="127.0.0.1", port=0)
+        self.server.start()
+        self.addCleanup(self.server.wait)
+        self.addCleanup(self.server.stop)
+        self.flags(keystone_ec2_url='http://127.0.0.1:%d/v2.0/ec2tokens' %
+                   self.server.port)
+        self.auth = ec2.EC2KeystoneAuth(context_user)
+
+        self.connections = 0
+        orig_connect = ec2.KeystoneConnectionPool._connect
+
+        def fake_connect(pool):
+            self.connections += 1
+            return orig_connect(pool)
+
+        self.stubs.Set(ec2.KeystoneConnectionPool, '_connect', fake_connect)
+
+    def _request(self, signature='good', timestamp='2013-02-01T00:00:00Z'):
+        req = webob.Request.blank('/?AWSAccessKeyId=fake&Timestamp=%s'
+                                  '&Signature=%s' % (timestamp, signature))
+        return req.get_response(self.auth)
+
+    def test_connection_is_reused(self):
+        for second in range(3):
+            res = self._request(timestamp='2013-02-01T00:00:0%dZ' % second)
+            self.assertEqual(res.body, 'fake')
+        self.assertEqual(self.keystone.requests, 3)
+        self.assertEqual(self.connections, 1)
+
+    def test_connection_per_request_without_pool(self):
+        self.flags(keystone_ec2_pool_size=0)
+        for second in range(3):
+            self._request(timestamp='2013-02-01T00:00:0%dZ' % second)
+        self.assertEqual(self.keystone.requests, 3)
+        self.assertEqual(self.connections, 3)
+
+    def test_broken_idle_connection_is_replaced(self):
+        pool = self.auth._get_pool()
+        pool._idle.append(ec2.httplib.HTTPConnection('127.0.0.1:1'))
+        self.assertEqual(self._request().body, 'fake')
+        self.assertEqual(self.keystone.requests, 1)
+        self.assertEqual(len(pool._idle), 1)
+
+    def test_validation_is_cached(self):
+        timeutils.set_time_override()
+        self.addCleanup(timeutils.clear_time_override)
+        self.assertEqual(self._request().body, 'fake')
+        self.assertEqual(self._request().body, 'fake')
+        self.assertEqual(self.keystone.requests, 1)
+        self._request(timestamp='2013-02-01T00:00:01Z')
+        self.assertEqual(self.keystone.requests, 2)
+        timeutils.advance_time_seconds(CONF.keystone_ec2_cache_ttl + 1)
+        self._request()
+        self.assertEqual(self.keystone.requests, 3)
+
+    def test_validation_cache_disabled(self):
+        self.flags(keystone_ec2_cache_ttl=0)
+        self._request()
+        self._request()
+        self.assertEqual(self.keystone.requests, 2)
+
+    def test_failure_is_not_cached(self):
+        self.assertEqual(self._request(signature='bad').status_int, 400)
+        self.assertEqual(self._request(signature='bad').status_int, 400)
+        self.assertEqual(self.keystone.requests, 2)
+
+
 class ExecutorTestCase(test.TestCase):
     def setUp(self):
         super(ExecutorTestCase, self).setUp()
@@ -607,6 +607,115 @@ class LimiterTest(BaseLimitTestSuite):
         self.assertEqual(expected, results)
 
 
+class CacheLimiterTest(LimiterTest):
+    """
+    Tests for the shared `limits.CacheLimiter` class.
+    """
+
+    def setUp(self):
+        """Run before each test."""
+        super(CacheLimiterTest, self).setUp()
+        self.stubs.Set(limits.CacheLimiter, "_get_time", self._get_time)
+        userlimits = {'user:user3': ''}
+        self.limiter = limits.CacheLimiter(TEST_LIMITS, **userlimits)
+
+    def test_delay_POST(self):
+        expected = [None] * 7
+        results = list(self._check(7, "POST", "/anything"))
+        self.assertEqual(expected, results)
+
+        # Bucket levels are kept in microseconds
+        expected = 60.0 / 7.0
+        results = self._check_sum(1, "POST", "/anything")
+        self.assertAlmostEqual(expected, results, 5)
+
+    def test_user_limit(self):
+        # Test user-specific limits.
+        self.assertEqual(self.limiter.user_limits['user3'], [])
+
+    def test_shared_between_workers(self):
+        other = limits.CacheLimiter(TEST_LIMITS)
+        other.cache = self.limiter.cache
+
+        for x in xrange(5):
+            self.assertEqual((None, None),
+                             self.limiter.check_for_delay("PUT", "/anything"))
+            self.assertEqual((None, None),
+                             other.check_for_delay("PUT", "/anything"))
+        delay, error = other.check_for_delay("PUT", "/anything")
+        self.assertEqual(6.0, delay)
+        self.assertEqual(delay, self.limiter.check_for_delay("PUT", "/a")[0])
+
+    def test_bucket_drains(self):
+        expected = [None] * 10 + [6.0]
+        results = list(self._check(11, "PUT", "/anything"))
+        self.assertEqual(expected, results)
+
+        self.time += 60.0
+
+        expected = [None] * 10 + [6.0]
+        results = list(self._check(11, "PUT", "/anything"))
+        self.assertEqual(expected, results)
+
+    def test_get_limits(self):
+        list(self._check(4, "PUT", "/servers"))
+        self.time += 12.0
+
+        result = dict((limit['URI'], limit) for limit in
+                      self.limiter.get_limits()
+                      if limit['verb'] == 'PUT')
+        # 4 requests, 2 of which leaked out already
+        self.assertEqual(result['*']['remaining'], 8)
+        self.assertEqual(result['/servers']['remaining'], 2)
+        self.assertEqual(result['/servers']['resetTime'], 12)
+
+        list(self._check(2, "PUT", "/servers"))
+        result = dict((limit['URI'], limit) for limit in
+                      self.limiter.get_limits()
+                      if limit['verb'] == 'PUT')
+        self.assertEqual(result['/servers']['remaining'], 0)
+        self.assertEqual(result['/servers']['resetTime'], 24)
+
+
+class LimitMatcherTest(test.TestCase):
+    """
+    Tests for the `limits.LimitMatcher` class.
+    """
+
+    def test_match(self):
+        matcher = limits.LimitMatcher(TEST_LIMITS)
+        self.assertEqual(matcher.match("GET", "/delayed/1"), [0])
+        self.assertEqual(matcher.match("GET", "/servers"), [])
+        self.assertEqual(matcher.match("POST", "/servers/1"), [1, 2])
+        self.assertEqual(matcher.match("POST", "/images"), [1])
+        self.assertEqual(matcher.match("PUT", "/servers"), [3, 4])
+        self.assertEqual(matcher.match("DELETE", "/servers"), [])
+
+    def test_match_uncombinable(self):
+        test_limits = [
+            limits.Limit("GET", "*", "(?P<x>/a)", 1, limits.PER_MINUTE),
+            limits.Limit("GET", "*", "(?P<x>/a)b", 1, limits.PER_MINUTE),
+            limits.Limit("POST", "*", r"/(\w)\1", 1, limits.PER_MINUTE),
+            limits.Limit("POST", "*", "/b", 1, limits.PER_MINUTE),
+        ]
+        matcher = limits.LimitMatcher(test_limits)
+        self.assertEqual(matcher.match("GET", "/ab"), [0, 1])
+        self.assertEqual(matcher.match("GET", "/ac"), [0])
+        self.assertEqual(matcher.match("POST", "/bb"), [2, 3])
+        self.assertEqual(matcher.match("POST", "/bc"), [3])
+
+    def test_match_with_capturing_groups(self):
+        test_limits = [
+            limits.Limit("GET", "*", "/(a|b)(c)", 1, limits.PER_MINUTE),
+            limits.Limit("GET", "*", "/d", 1, limits.PER_MINUTE),
+            limits.Limit("GET", "*", "/(d|e)", 1, limits.PER_MINUTE),
+        ]
+        matcher = limits.LimitMatcher(test_limits)
+        self.assertEqual(matcher.match("GET", "/ac"), [0])
+        self.assertEqual(matcher.match("GET", "/d"), [1, 2])
+        self.assertEqual(matcher.match("GET", "/e"), [2])
+
+
 class WsgiLimiterTest(BaseLimitTestSuite):
     """
     Tests for `limits.WsgiLimiter` class.
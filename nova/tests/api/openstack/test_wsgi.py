@@ -96,6 +96,28 @@ class RequestTest(test.TestCase):
                  'uuid1': instances[1],
                  'uuid2': instances[2]})
 
+    def test_prefetch_db_items(self):
+        request = wsgi.Request.blank('/foo')
+        request.cache_db_items('hosts', [{'id': 'host0'}])
+        calls = []
+
+        def fetch(keys):
+            calls.append(keys)
+            return dict((key, {'id': key}) for key in keys if key != 'host2')
+
+        items = request.prefetch_db_items('hosts',
+                                          ['host0', 'host1', 'host2', 'host1'],
+                                          fetch)
+        self.assertEqual(calls, [['host1', 'host2']])
+        self.assertEqual(items, {'host0': {'id': 'host0'},
+                                 'host1': {'id': 'host1'},
+                                 'host2': None})
+        # Everything is cached now, including the missing item.
+        request.prefetch_db_items('hosts', ['host1', 'host2'], fetch)
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(request.get_db_item('hosts', 'host1'),
+                         {'id': 'host1'})
+
 
 class ActionDispatcherTest(test.TestCase):
     def test_dispatch(self):
@@ -652,6 +652,75 @@ class TemplateTest(test.TestCase):
                          str(obj['test']['image']['id']))
         self.assertEqual(result[idx].text, obj['test']['image']['name'])
 
+    def test_compiled_template_cache(self):
+        root = xmlutil.TemplateElement('test', selector='test')
+        elem = xmlutil.SubTemplateElement(root, 'a', selector='a')
+        elem.text = xmlutil.Selector()
+        master = xmlutil.MasterTemplate(root, 1)
+        root_slave = xmlutil.TemplateElement('test', selector='test')
+        elem = xmlutil.SubTemplateElement(root_slave, 'b', selector='b')
+        elem.text = xmlutil.Selector()
+        slave = xmlutil.SlaveTemplate(root_slave, 1)
+
+        compiled = xmlutil.compile_siblings(master._siblings())
+        self.assertEqual(compiled, xmlutil.compile_siblings([root]))
+        self.assertEqual(['a'],
+                         [c.siblings[0].tag for c in compiled.children])
+
+        # Attaching a slave is a different combination of templates
+        copy = master.copy()
+        copy.attach(slave)
+        compiled_copy = xmlutil.compile_siblings(copy._siblings())
+        self.assertNotEqual(compiled, compiled_copy)
+        self.assertEqual(['a', 'b'],
+                         [c.siblings[0].tag for c in compiled_copy.children])
+        self.assertEqual(compiled_copy,
+                         xmlutil.compile_siblings(copy._siblings()))
+
+        # Changing the shape of a template recompiles it
+        elem = xmlutil.SubTemplateElement(root, 'c', selector='c')
+        elem.text = xmlutil.Selector()
+        compiled = xmlutil.compile_siblings(master._siblings())
+        self.assertEqual(['a', 'c'],
+                         [c.siblings[0].tag for c in compiled.children])
+
+        obj = dict(test=dict(a=[1], b=[2], c=[3]))
+        self.assertEqual("<?xml version='1.0' encoding='UTF-8'?>\n"
+                         "<test><a>1</a><c>3</c><b>2</b></test>",
+                         copy.serialize(obj))
+
+        # So does changing its attributes or text
+        root.set('name')
+        elem.text = xmlutil.ConstantSelector('const')
+        self.assertEqual("<?xml version='1.0' encoding='UTF-8'?>\n"
+                         "<test name=\"foo\"><a>1</a><c>const</c><b>2</b>"
+                         "</test>",
+                         copy.serialize(dict(test=dict(name='foo', a=[1],
+                                                       b=[2], c=[3]))))
+
+    def test_compiled_selectors(self):
+        root = xmlutil.TemplateElement('test', selector='test')
+        elem = xmlutil.SubTemplateElement(root, 'meta', selector='meta')
+        item = xmlutil.SubTemplateElement(elem, 'item',
+                                          selector=xmlutil.get_items)
+        item.set('key', 0)
+        item.set('missing', 5)
+        item.text = 1
+        elem = xmlutil.SubTemplateElement(root, 'value', selector='values',
+                                          subselector='value')
+        elem.set('empty', xmlutil.EmptyStringSelector('missing'))
+        elem.text = 'id'
+        xmlutil.SubTemplateElement(root, 'none', selector='none')
+        template = xmlutil.MasterTemplate(root, 1)
+
+        obj = dict(test=dict(meta=dict(a='1'),
+                             values=[dict(value=dict(id='a')),
+                                     dict(value=dict(id='b'))]))
+        self.assertEqual("<?xml version='1.0' encoding='UTF-8'?>\n"
+                         '<test><meta><item key="a">1</item></meta>'
+                         '<value empty="">a</value><value empty="">b</value>'
+                         '</test>', template.serialize(obj))
+
 
 class MasterTemplateBuilder(xmlutil.TemplateBuilder):
     def construct(self):
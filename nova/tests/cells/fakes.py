@@ -57,7 +57,7 @@ class FakeDBApi(object):
     def cell_get_all(self, ctxt):
         return self.cell_db_entries
 
-    def compute_node_get_all(self, ctxt):
+    def compute_node_get_all(self, ctxt, **kwargs):
         return []
 
     def instance_get_all_by_filters(self, ctxt, *args, **kwargs):
@@ -75,8 +75,8 @@ class FakeCellState(cells_state.CellState):
     def send_message(self, message):
         message_runner = get_message_runner(self.name)
         orig_ctxt = message.ctxt
-        json_message = message.to_json()
-        message = message_runner.message_from_json(json_message)
+        encoded_message = message.encode()
+        message = message_runner.message_from_json(encoded_message)
         # Restore this so we can use mox and verify same context
         message.ctxt = orig_ctxt
         message.process()
@@ -0,0 +1,58 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2013 OpenStack LLC.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+"""
+Tests For Cells message codecs
+"""
+
+from nova.cells import codec as cells_codec
+from nova import exception
+from nova.openstack.common import jsonutils
+from nova import test
+
+
+class CellsCodecTestCase(test.TestCase):
+    def setUp(self):
+        super(CellsCodecTestCase, self).setUp()
+        self.message = {'method_name': 'instance_update_at_top',
+                        'method_kwargs': {'instance': {'uuid': 'fake-uuid',
+                                                       'vm_state': 'active',
+                                                       'memory_mb': 512}},
+                        'routing_path': 'api-cell!child-cell1',
+                        'hop_count': 1}
+        self.flags(message_compress_threshold=256, group='cells')
+
+    def test_plain_json_by_default(self):
+        self.message['method_kwargs']['instance']['display_name'] = 'x' * 256
+        encoded = cells_codec.encode(self.message)
+        self.assertEqual(self.message, jsonutils.loads(encoded))
+        self.assertEqual(self.message, cells_codec.decode(encoded))
+
+    def test_compression(self):
+        self.flags(compress_messages=True, group='cells')
+        encoded = cells_codec.encode(self.message)
+        self.assertEqual(self.message, jsonutils.loads(encoded))
+
+        self.message['method_kwargs']['instance']['display_name'] = 'x' * 256
+        encoded = cells_codec.encode(self.message)
+        self.assertTrue(encoded.startswith('~json/1:z:'))
+        self.assertEqual(self.message, cells_codec.decode(encoded))
+        # Received back from the RPC layer.
+        self.assertEqual(self.message, cells_codec.decode(unicode(encoded)))
+
+    def test_unsupported_codec(self):
+        self.assertRaises(exception.CellMessageCodecNotSupported,
+                          cells_codec.decode, '~marshal/2::eA==')
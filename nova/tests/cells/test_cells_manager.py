@@ -169,21 +169,15 @@ class CellsManagerClassTestCase(test.TestCase):
         self.cells_manager.bw_usage_update_at_top(
                 self.ctxt, bw_update_info='fake-bw-info')
 
-    def test_heal_instances(self):
-        self.flags(instance_updated_at_threshold=1000,
-                   instance_update_num_instances=2,
-                   group='cells')
-
-        fake_context = context.RequestContext('fake', 'fake')
+    def _setup_heal_instances(self, fake_context, instances):
         stalled_time = timeutils.utcnow()
         updated_since = stalled_time - datetime.timedelta(seconds=1000)
+        timeutils.set_time_override(stalled_time)
+        self.addCleanup(timeutils.clear_time_override)
 
-        def utcnow():
-            return stalled_time
-
-        call_info = {'get_instances': 0, 'sync_instances': []}
-
-        instances = ['instance1', 'instance2', 'instance3']
+        call_info = {'get_instances': 0, 'get_all': 0,
+                     'sync_instances': [],
+                     'updated_since': updated_since}
 
         def get_instances_to_sync(context, **kwargs):
             self.assertEqual(context, fake_context)
@@ -193,29 +187,43 @@ class CellsManagerClassTestCase(test.TestCase):
             call_info['get_instances'] += 1
             return iter(instances)
 
-        def instance_get_by_uuid(context, uuid):
-            return instances[int(uuid[-1]) - 1]
+        def instance_get_all_by_filters(context, filters, sort_key,
+                                        sort_dir):
+            self.assertEqual(context.read_deleted, 'yes')
+            call_info['get_all'] += 1
+            return [instances[int(uuid[-1]) - 1]
+                    for uuid in filters['uuid']]
 
-        def sync_instance(context, instance):
+        def instances_sync_at_top(context, batch):
             self.assertEqual(context, fake_context)
-            call_info['sync_instances'].append(instance)
+            call_info['sync_instances'].append(batch)
 
         self.stubs.Set(cells_utils, 'get_instances_to_sync',
                 get_instances_to_sync)
-        self.stubs.Set(self.cells_manager.db, 'instance_get_by_uuid',
-                instance_get_by_uuid)
-        self.stubs.Set(self.cells_manager, '_sync_instance',
-                sync_instance)
-        self.stubs.Set(timeutils, 'utcnow', utcnow)
+        self.stubs.Set(self.cells_manager.db, 'instance_get_all_by_filters',
+                instance_get_all_by_filters)
+        self.stubs.Set(self.msg_runner, 'instances_sync_at_top',
+                instances_sync_at_top)
+        return call_info
+
+    def test_heal_instances(self):
+        self.flags(instance_updated_at_threshold=1000,
+                   instance_update_num_instances=2,
+                   group='cells')
+
+        fake_context = context.RequestContext('fake', 'fake')
+        instances = ['instance1', 'instance2', 'instance3']
+        call_info = self._setup_heal_instances(fake_context, instances)
+        updated_since = call_info['updated_since']
 
         self.cells_manager._heal_instances(fake_context)
         self.assertEqual(call_info['shuffle'], True)
         self.assertEqual(call_info['project_id'], None)
         self.assertEqual(call_info['updated_since'], updated_since)
         self.assertEqual(call_info['get_instances'], 1)
-        # Only first 2
+        # Only first 2, in one message
         self.assertEqual(call_info['sync_instances'],
-                instances[:2])
+                [instances[:2]])
 
         call_info['sync_instances'] = []
         self.cells_manager._heal_instances(fake_context)
@@ -225,7 +233,29 @@ class CellsManagerClassTestCase(test.TestCase):
         self.assertEqual(call_info['get_instances'], 2)
         # Now the last 1 and the first 1
         self.assertEqual(call_info['sync_instances'],
-                [instances[-1], instances[0]])
+                [[instances[-1], instances[0]]])
+        self.assertEqual(call_info['get_all'], 2)
+
+    def test_heal_instances_by_rate(self):
+        self.flags(instance_sync_rate=2, instance_sync_batch_size=2,
+                   group='cells')
+
+        fake_context = context.RequestContext('fake', 'fake')
+        instances = ['instance1', 'instance2', 'instance3', 'instance4',
+                     'instance5', 'instance6', 'instance7']
+        call_info = self._setup_heal_instances(fake_context, instances)
+        self.cells_manager._last_heal_time = timeutils.utcnow_ts() - 3
+
+        # 3 seconds at 2 instances per second, 2 per message
+        self.cells_manager._heal_instances(fake_context)
+        self.assertEqual(call_info['sync_instances'],
+                [instances[0:2], instances[2:4], instances[4:6]])
+        self.assertEqual(call_info['get_all'], 3)
+
+        # No time went by
+        call_info['sync_instances'] = []
+        self.cells_manager._heal_instances(fake_context)
+        self.assertEqual(call_info['sync_instances'], [])
 
     def test_sync_instances(self):
         self.mox.StubOutWithMock(self.msg_runner,
@@ -566,6 +566,33 @@ class CellsMessageClassesTestCase(test.TestCase):
             self.assertTrue(response.failure)
             self.assertRaises(test.TestingException, response.value_or_raise)
 
+    def test_compressed_message(self):
+        self.flags(compress_messages=True, group='cells')
+        target_cell = 'api-cell!child-cell2'
+        encoded = []
+        orig_encode = messaging._BaseMessage.encode
+
+        def _fake_encode(message):
+            encoded.append(orig_encode(message))
+            return encoded[-1]
+
+        self.stubs.Set(messaging._BaseMessage, 'encode', _fake_encode)
+
+        def our_fake_method(message, **kwargs):
+            return kwargs
+
+        fakes.stub_tgt_method(self, 'child-cell2', 'our_fake_method',
+                our_fake_method)
+
+        tgt_message = messaging._TargetedMessage(self.msg_runner,
+                self.ctxt, 'our_fake_method', {'arg': 'x' * 8192},
+                'down', target_cell, need_response=True)
+        response = tgt_message.process()
+        self.assertEqual({'arg': 'x' * 8192}, response.value_or_raise())
+        self.assertEqual(2, len(encoded))
+        for message in encoded:
+            self.assertTrue(message.startswith('~json/1:z:'))
+
 
 class CellsTargetedMethodsTestCase(test.TestCase):
     """Test case for _TargetedMessageMethods class.  Most of these
@@ -824,6 +851,51 @@ class CellsBroadcastMethodsTestCase(test.TestCase):
 
         self.src_msg_runner.instance_update_at_top(self.ctxt, fake_instance)
 
+    def test_instances_sync_at_top(self):
+        fake_info_cache = {'id': 1,
+                           'instance': 'fake_instance',
+                           'other': 'moo'}
+        fake_sys_metadata = [{'id': 1,
+                              'key': 'key1',
+                              'value': 'value1'}]
+        fake_instance = {'id': 2,
+                         'uuid': 'fake_uuid',
+                         'deleted': False,
+                         'security_groups': 'fake',
+                         'cell_name': 'fake',
+                         'metadata': 'fake',
+                         'info_cache': fake_info_cache,
+                         'system_metadata': fake_sys_metadata,
+                         'other': 'meow'}
+        fake_deleted_instance = {'id': 3,
+                                 'uuid': 'fake_uuid2',
+                                 'deleted': True}
+        expected_cell_name = 'api-cell!child-cell2!grandchild-cell1'
+        expected_instance = {'system_metadata': {'key1': 'value1'},
+                             'cell_name': expected_cell_name,
+                             'deleted': False,
+                             'info_cache': {'other': 'moo'},
+                             'other': 'meow',
+                             'uuid': 'fake_uuid'}
+
+        # To show these should not be called in src/mid-level cell
+        self.mox.StubOutWithMock(self.src_db_inst,
+                                 'instance_update_or_create_bulk')
+        self.mox.StubOutWithMock(self.mid_db_inst,
+                                 'instance_update_or_create_bulk')
+
+        self.mox.StubOutWithMock(self.tgt_db_inst,
+                                 'instance_update_or_create_bulk')
+        self.mox.StubOutWithMock(self.tgt_db_inst, 'instance_destroy')
+        self.tgt_db_inst.instance_destroy(self.ctxt, 'fake_uuid2',
+                                          update_cells=False)
+        self.tgt_db_inst.instance_update_or_create_bulk(self.ctxt,
+                                                        [expected_instance])
+        self.mox.ReplayAll()
+
+        self.src_msg_runner.instances_sync_at_top(self.ctxt,
+                [fake_instance, fake_deleted_instance])
+
     def test_instance_destroy_at_top(self):
         fake_instance = {'uuid': 'fake_uuid'}
 
@@ -928,10 +1000,9 @@ class CellsBroadcastMethodsTestCase(test.TestCase):
         instance2 = dict(uuid='fake_uuid2', deleted=True)
         fake_instances = [instance1, instance2]
 
+        self.flags(instance_sync_batch_size=1, group='cells')
         self.mox.StubOutWithMock(self.tgt_msg_runner,
-                                 'instance_update_at_top')
-        self.mox.StubOutWithMock(self.tgt_msg_runner,
-                                 'instance_destroy_at_top')
+                                 'instances_sync_at_top')
 
         self.mox.StubOutWithMock(timeutils, 'parse_isotime')
         self.mox.StubOutWithMock(cells_utils, 'get_instances_to_sync')
@@ -951,8 +1022,8 @@ class CellsBroadcastMethodsTestCase(test.TestCase):
                 updated_since=updated_since_parsed,
                 project_id=project_id,
                 deleted=deleted).AndReturn(fake_instances)
-        self.tgt_msg_runner.instance_update_at_top(self.ctxt, instance1)
-        self.tgt_msg_runner.instance_destroy_at_top(self.ctxt, instance2)
+        self.tgt_msg_runner.instances_sync_at_top(self.ctxt, [instance1])
+        self.tgt_msg_runner.instances_sync_at_top(self.ctxt, [instance2])
 
         self.mox.ReplayAll()
 
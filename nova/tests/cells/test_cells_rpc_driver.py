@@ -128,7 +128,7 @@ class CellsRPCDriverTestCase(test.TestCase):
         expected_cast_args = (self.ctxt, expected_server_params,
                               'fake-message')
         expected_cast_kwargs = {'topic': 'cells.intercell.targeted'}
-        expected_rpc_kwargs = {'message': message.to_json()}
+        expected_rpc_kwargs = {'message': message.encode()}
         self.assertEqual(expected_cast_args, call_info['cast_args'])
         self.assertEqual(expected_cast_kwargs, call_info['cast_kwargs'])
         self.assertEqual('process_message', call_info['rpc_method'])
@@ -167,7 +167,7 @@ class CellsRPCDriverTestCase(test.TestCase):
         expected_cast_args = (self.ctxt, expected_server_params,
                               'fake-message')
         expected_cast_kwargs = {'topic': 'cells.intercell.targeted'}
-        expected_rpc_kwargs = {'message': message.to_json()}
+        expected_rpc_kwargs = {'message': message.encode()}
         self.assertEqual(expected_cast_args, call_info['cast_args'])
         self.assertEqual(expected_cast_kwargs, call_info['cast_kwargs'])
         self.assertEqual('process_message', call_info['rpc_method'])
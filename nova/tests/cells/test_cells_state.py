@@ -0,0 +1,116 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2013 OpenStack LLC.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+"""
+Tests For CellStateManager
+"""
+
+import datetime
+
+from nova.cells import state
+from nova.openstack.common import timeutils
+from nova import test
+from nova.tests.cells import fakes
+
+
+FAKE_INSTANCE_TYPES = [
+    {'memory_mb': 512, 'root_gb': 1, 'ephemeral_gb': 0},
+    {'memory_mb': 1024, 'root_gb': 10, 'ephemeral_gb': 0},
+    {'memory_mb': 1024, 'root_gb': 20, 'ephemeral_gb': 10},
+]
+
+
+def _fake_compute_node(compute_id, service_id, free_ram_mb, free_disk_gb,
+                       deleted=False):
+    return {'id': compute_id,
+            'deleted': deleted,
+            'service': {'id': service_id, 'host': 'host%s' % service_id},
+            'free_ram_mb': free_ram_mb,
+            'free_disk_gb': free_disk_gb}
+
+
+class FakeCapacityDB(object):
+    def __init__(self, compute_nodes):
+        self.compute_nodes = compute_nodes
+        self.disabled = []
+        self.calls = []
+
+    def compute_node_get_all(self, context, **kwargs):
+        self.calls.append(kwargs)
+        return self.compute_nodes
+
+    def service_get_all(self, context, disabled=None):
+        return [{'id': service_id} for service_id in self.disabled]
+
+    def instance_type_get_all(self, context):
+        return FAKE_INSTANCE_TYPES
+
+
+class CellStateManagerCapacityTestCase(test.TestCase):
+    def setUp(self):
+        super(CellStateManagerCapacityTestCase, self).setUp()
+        fakes.init(self)
+        self.state_manager = fakes.get_state_manager('api-cell')
+        self.state_manager._compute_nodes_checked_at = None
+        self.db = FakeCapacityDB([_fake_compute_node(1, 1, 1024, 100),
+                                  _fake_compute_node(2, 2, 2048, 50),
+                                  _fake_compute_node(3, 3, 1024, 100)])
+        self.state_manager.db = self.db
+
+    def _capacities(self):
+        self.state_manager._update_our_capacity('fake-context')
+        return self.state_manager.my_cell_state.capacities
+
+    def test_capacities(self):
+        capacities = self._capacities()
+        self.assertEqual({'total_mb': 4096,
+                          'units_by_mb': {'512': 8, '1024': 8}},
+                         capacities['ram_free'])
+        self.assertEqual({'total_mb': 250 * 1024,
+                          'units_by_mb': {'1024': 250, '10240': 25,
+                                          '30720': 7}},
+                         capacities['disk_free'])
+        self.assertEqual([{'use_slave': True}], self.db.calls)
+
+    def test_capacities_from_changed_compute_nodes(self):
+        now = timeutils.utcnow()
+        timeutils.set_time_override(now)
+        self.addCleanup(timeutils.clear_time_override)
+        self._capacities()
+        timeutils.advance_time_seconds(60)
+        self.db.compute_nodes = [_fake_compute_node(2, 2, 512, 50),
+                                 _fake_compute_node(3, 3, 0, 0,
+                                                    deleted=True)]
+        capacities = self._capacities()
+        self.assertEqual({'total_mb': 1536,
+                          'units_by_mb': {'512': 3, '1024': 2}},
+                         capacities['ram_free'])
+        self.assertFalse(self.db.calls[1]['use_slave'])
+        self.assertEqual(now - state._CAPACITY_CHANGES_OVERLAP,
+                         self.db.calls[1]['updated_since'])
+        self.assertEqual(now + datetime.timedelta(seconds=60),
+                         self.state_manager._compute_nodes_checked_at)
+
+    def test_capacities_skip_disabled_services(self):
+        self.db.disabled = [1, 3]
+        capacities = self._capacities()
+        self.assertEqual({'total_mb': 2048,
+                          'units_by_mb': {'512': 4, '1024': 4}},
+                         capacities['ram_free'])
+
+        self.db.disabled = [1, 2, 3]
+        self.db.compute_nodes = []
+        self.assertEqual({}, self._capacities())
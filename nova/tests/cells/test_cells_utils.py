@@ -80,3 +80,9 @@ class CellsUtilsTestCase(test.TestCase):
                 {'changes-since': 'fake-updated-since',
                  'project_id': 'fake-project'})
         self.assertEqual(call_info['shuffle'], 2)
+
+    def test_batches(self):
+        batches = cells_utils.batches(iter(xrange(5)), 2)
+        self.assertTrue(inspect.isgenerator(batches))
+        self.assertEqual([[0, 1], [2, 3], [4]], list(batches))
+        self.assertEqual([], list(cells_utils.batches([], 2)))
@@ -2965,6 +2965,151 @@ class ComputeTestCase(BaseTestCase):
         self.assertEqual(call_info['get_by_uuid'], 3)
         self.assertEqual(call_info['get_nw_info'], 4)
 
+    def test_poll_bandwidth_usage(self):
+        ctxt = context.get_admin_context()
+        self.compute._last_bw_usage_poll = 0
+        prev_time, start_time = utils.last_completed_audit_period()
+        instances = [{'uuid': 'fake-uuid1'}, {'uuid': 'fake-uuid2'}]
+        bw_counters = [
+            dict(uuid='fake-uuid1', mac_address='mac1', bw_in=110,
+                 bw_out=220),
+            dict(uuid='fake-uuid2', mac_address='mac2', bw_in=10,
+                 bw_out=20)]
+        usage1 = dict(uuid='fake-uuid1', mac='mac1', bw_in=1000, bw_out=2000,
+                      last_ctr_in=100, last_ctr_out=200)
+        prev_usage2 = dict(uuid='fake-uuid2', mac='mac2', bw_in=0, bw_out=0,
+                           last_ctr_in=5, last_ctr_out=10)
+
+        capi = self.compute.conductor_api
+        self.mox.StubOutWithMock(capi, 'instance_get_all_by_host')
+        self.mox.StubOutWithMock(self.compute.driver, 'get_all_bw_counters')
+        self.mox.StubOutWithMock(capi, 'bw_usage_get_by_uuids')
+        self.mox.StubOutWithMock(capi, 'bw_usage_update_bulk')
+        self.mox.StubOutWithMock(capi, 'bw_usage_update')
+        capi.instance_get_all_by_host(ctxt,
+                                      self.compute.host).AndReturn(instances)
+        self.compute.driver.get_all_bw_counters(instances).AndReturn(
+            bw_counters)
+        capi.bw_usage_get_by_uuids(
+            ctxt, mox.SameElementsAs(['fake-uuid1', 'fake-uuid2']),
+            start_time).AndReturn([usage1])
+        capi.bw_usage_get_by_uuids(ctxt, ['fake-uuid2'],
+                                   prev_time).AndReturn([prev_usage2])
+        capi.bw_usage_update_bulk(
+            ctxt, start_time,
+            [dict(uuid='fake-uuid1', mac='mac1', bw_in=1010, bw_out=2020,
+                  last_ctr_in=110, last_ctr_out=220),
+             dict(uuid='fake-uuid2', mac='mac2', bw_in=5, bw_out=10,
+                  last_ctr_in=10, last_ctr_out=20)],
+            last_refreshed=mox.IgnoreArg())
+        self.mox.ReplayAll()
+
+        self.compute._poll_bandwidth_usage(ctxt)
+
+    def test_update_volume_usage_cache(self):
+        ctxt = context.get_admin_context()
+        vol_usages = [dict(volume='vol1', instance={'uuid': 'fake-uuid1'},
+                           rd_req=1, rd_bytes=2, wr_req=3, wr_bytes=4),
+                      dict(volume='vol2', instance={'uuid': 'fake-uuid2'},
+                           rd_req=5, rd_bytes=6, wr_req=7, wr_bytes=8)]
+        capi = self.compute.conductor_api
+        self.mox.StubOutWithMock(capi, 'vol_usage_update')
+        self.mox.StubOutWithMock(capi, 'vol_usage_update_bulk')
+        capi.vol_usage_update_bulk(
+            ctxt,
+            [dict(volume='vol1', instance_uuid='fake-uuid1', rd_req=1,
+                  rd_bytes=2, wr_req=3, wr_bytes=4),
+             dict(volume='vol2', instance_uuid='fake-uuid2', rd_req=5,
+                  rd_bytes=6, wr_req=7, wr_bytes=8)],
+            last_refreshed='fake-refreshed')
+        self.mox.ReplayAll()
+
+        self.compute._update_volume_usage_cache(ctxt, vol_usages,
+                                                'fake-refreshed')
+
+    def _stub_instance_usage_audit_page(self, ctxt, begin, end, marker,
+                                        instances, bw_usages):
+        capi = self.compute.conductor_api
+        capi.instance_get_active_by_window(
+            ctxt, begin, end, host=self.compute.host,
+            columns_to_join=['info_cache', 'instance_type',
+                             'system_metadata'],
+            marker=marker, limit=2).AndReturn(instances)
+        if not instances:
+            return
+        capi.bw_usage_get_by_uuids(
+            ctxt, [instance['uuid'] for instance in instances],
+            begin).AndReturn(bw_usages)
+
+    def test_instance_usage_audit(self):
+        self.flags(instance_usage_audit=True,
+                   instance_usage_audit_page_size=2)
+        ctxt = context.get_admin_context()
+        begin, end = utils.last_completed_audit_period()
+        instances = [{'id': i, 'uuid': 'fake-uuid%d' % i}
+                     for i in xrange(1, 4)]
+        usage1 = dict(uuid='fake-uuid1', mac='mac1', bw_in=1, bw_out=2)
+
+        capi = self.compute.conductor_api
+        self.mox.StubOutWithMock(capi, 'instance_get_active_by_window')
+        self.mox.StubOutWithMock(capi, 'bw_usage_get_by_uuids')
+        self.mox.StubOutWithMock(compute_utils, 'notify_usage_exists')
+        self._stub_instance_usage_audit_page(ctxt, begin, end, None,
+                                             instances[:2], [usage1])
+        compute_utils.notify_usage_exists(ctxt, instances[0],
+                                          ignore_missing_network_data=False,
+                                          bw_usages=[usage1])
+        compute_utils.notify_usage_exists(ctxt, instances[1],
+                                          ignore_missing_network_data=False,
+                                          bw_usages=[]).AndRaise(
+                                              test.TestingException())
+        self._stub_instance_usage_audit_page(ctxt, begin, end, 2,
+                                             instances[2:], [])
+        compute_utils.notify_usage_exists(ctxt, instances[2],
+                                          ignore_missing_network_data=False,
+                                          bw_usages=[])
+        self.mox.ReplayAll()
+
+        self.compute._instance_usage_audit(ctxt)
+        task_log = compute_utils.get_instance_usage_audit(ctxt, begin, end,
+                                                          self.compute.host)
+        self.assertEqual(('DONE', '3', 3, 1),
+                         (task_log['state'], task_log['marker'],
+                          task_log['task_items'], task_log['errors']))
+
+        # Done for this period.
+        self.compute._instance_usage_audit(ctxt)
+
+    def test_instance_usage_audit_resumes(self):
+        self.flags(instance_usage_audit=True,
+                   instance_usage_audit_page_size=2)
+        ctxt = context.get_admin_context()
+        begin, end = utils.last_completed_audit_period()
+        compute_utils.start_instance_usage_audit(ctxt, begin, end,
+                                                 self.compute.host, 0)
+        compute_utils.checkpoint_instance_usage_audit(ctxt, begin, end,
+                                                      self.compute.host,
+                                                      '2', 2, 1)
+        instance = {'id': 3, 'uuid': 'fake-uuid3'}
+
+        capi = self.compute.conductor_api
+        self.mox.StubOutWithMock(capi, 'instance_get_active_by_window')
+        self.mox.StubOutWithMock(capi, 'bw_usage_get_by_uuids')
+        self.mox.StubOutWithMock(compute_utils, 'notify_usage_exists')
+        self._stub_instance_usage_audit_page(ctxt, begin, end, 2,
+                                             [instance], [])
+        compute_utils.notify_usage_exists(ctxt, instance,
+                                          ignore_missing_network_data=False,
+                                          bw_usages=[])
+        self.mox.ReplayAll()
+
+        self.compute._instance_usage_audit(ctxt)
+        task_log = compute_utils.get_instance_usage_audit(ctxt, begin, end,
+                                                          self.compute.host)
+        self.assertEqual(('DONE', 3, 1),
+                         (task_log['state'], task_log['task_items'],
+                          task_log['errors']))
+
     def test_poll_rescued_instances(self):
         timed_out_time = timeutils.utcnow() - datetime.timedelta(minutes=5)
         not_timed_out_time = timeutils.utcnow()
@@ -5346,7 +5491,7 @@ class ComputeAPITestCase(BaseTestCase):
                 'created_at': datetime.datetime(2010, 10, 10, 12, 0, 0),
             }
 
-        def return_fault(_ctxt, instance_uuids):
+        def return_fault(_ctxt, instance_uuids, use_slave=False):
             return dict.fromkeys(instance_uuids, [fault_fixture])
 
         self.stubs.Set(nova.db,
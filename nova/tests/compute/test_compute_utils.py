@@ -28,6 +28,7 @@ from nova.image import glance
 from nova.network import api as network_api
 from nova.openstack.common import cfg
 from nova.openstack.common import importutils
+from nova.openstack.common import jsonutils
 from nova.openstack.common import log as logging
 from nova.openstack.common.notifier import api as notifier_api
 from nova.openstack.common.notifier import test_notifier
@@ -288,6 +289,27 @@ class UsageInfoTestCase(test.TestCase):
         self.assertEquals(payload['image_ref_url'], image_ref_url)
         self.compute.terminate_instance(self.context, instance)
 
+    def test_notify_usage_exists_with_bw_usages(self):
+        instance_id = self._create_instance()
+        instance = db.instance_get(self.context, instance_id)
+        nw_info = [{'address': 'fake-mac', 'network': {'label': 'private'}}]
+        db.instance_info_cache_update(self.context, instance['uuid'],
+                {'network_info': jsonutils.dumps(nw_info)})
+        instance = db.instance_get(self.context, instance_id)
+        self.mox.StubOutWithMock(db, 'bw_usage_get_by_uuids')
+        self.mox.ReplayAll()
+
+        bw_usages = [{'uuid': instance['uuid'], 'mac': 'fake-mac',
+                      'bw_in': 1, 'bw_out': 2},
+                     {'uuid': instance['uuid'], 'mac': 'other-mac',
+                      'bw_in': 3, 'bw_out': 4}]
+        compute_utils.notify_usage_exists(self.context, instance,
+                                          bw_usages=bw_usages)
+        payload = test_notifier.NOTIFICATIONS[-1]['payload']
+        self.assertEqual({'private': {'bw_in': 1, 'bw_out': 2}},
+                         payload['bandwidth'])
+        self.compute.terminate_instance(self.context, instance)
+
     def test_notify_usage_exists_deleted_instance(self):
         # Ensure 'exists' notification generates appropriate usage data.
         instance_id = self._create_instance()
@@ -20,6 +20,7 @@ from nova.compute import instance_types
 from nova.compute import vm_states
 from nova import conductor
 from nova.conductor import api as conductor_api
+from nova.conductor import cache as conductor_cache
 from nova.conductor import manager as conductor_manager
 from nova.conductor import rpcapi as conductor_rpcapi
 from nova import context
@@ -171,6 +172,22 @@ class _BaseTestCase(object):
         self.assertEqual(orig_instance['name'],
                          copy_instance['name'])
 
+    def test_instance_get_all_by_uuids(self):
+        inst1 = self._create_fake_instance()
+        inst2 = self._create_fake_instance()
+        inst3 = self._create_fake_instance()
+        db.instance_destroy(self.context, inst3['uuid'])
+        result = self.conductor.instance_get_all_by_uuids(
+            self.context, [inst1['uuid'], inst2['uuid'], inst3['uuid']])
+        self.assertEqual(set([inst1['uuid'], inst2['uuid']]),
+                         set([inst['uuid'] for inst in result]))
+
+    def test_instance_get_all_by_uuids_empty(self):
+        self.mox.StubOutWithMock(db, 'instance_get_all_by_filters')
+        self.mox.ReplayAll()
+        result = self.conductor.instance_get_all_by_uuids(self.context, [])
+        self.assertEqual([], result)
+
     def _setup_aggregate_with_host(self):
         aggregate_ref = db.aggregate_create(self.context.elevated(),
                 {'name': 'foo'}, metadata={'availability_zone': 'foo'})
@@ -246,12 +263,32 @@ class _BaseTestCase(object):
         get_args = (self.context, 'uuid', 0, 'mac')
 
         db.bw_usage_update(*update_args)
-        db.bw_usage_get(*get_args).AndReturn('foo')
+        db.bw_usage_get(*get_args, use_slave=False).AndReturn('foo')
 
         self.mox.ReplayAll()
         result = self.conductor.bw_usage_update(*update_args)
         self.assertEqual(result, 'foo')
 
+    def test_bw_usage_get_by_uuids(self):
+        self.mox.StubOutWithMock(db, 'bw_usage_get_by_uuids')
+        db.bw_usage_get_by_uuids(self.context, ['uuid1', 'uuid2'],
+                                 0, use_slave=False).AndReturn('foo')
+        self.mox.ReplayAll()
+        result = self.conductor.bw_usage_get_by_uuids(self.context,
+                                                      ['uuid1', 'uuid2'], 0)
+        self.assertEqual(result, 'foo')
+
+    def test_bw_usage_update_bulk(self):
+        self.mox.StubOutWithMock(db, 'bw_usage_update_bulk')
+        usages = [dict(uuid='uuid1', mac='mac1', bw_in=10, bw_out=20,
+                       last_ctr_in=5, last_ctr_out=10),
+                  dict(uuid='uuid2', mac='mac2', bw_in=1, bw_out=2,
+                       last_ctr_in=3, last_ctr_out=4)]
+        db.bw_usage_update_bulk(self.context, 0, usages, 'fake-refr')
+        self.mox.ReplayAll()
+        self.conductor.bw_usage_update_bulk(self.context, 0, usages,
+                                            'fake-refr')
+
     def test_get_backdoor_port(self):
         backdoor_port = 59697
 
@@ -337,12 +374,29 @@ class _BaseTestCase(object):
         self.mox.StubOutWithMock(db, 'instance_get_active_by_window_joined')
         db.instance_get_active_by_window_joined(self.context, 'fake-begin',
                                                 'fake-end', 'fake-proj',
-                                                'fake-host')
+                                                'fake-host', use_slave=True,
+                                                columns_to_join=None,
+                                                marker=None, limit=None)
         self.mox.ReplayAll()
         self.conductor.instance_get_active_by_window(self.context,
                                                      'fake-begin', 'fake-end',
                                                      'fake-proj', 'fake-host')
 
+    def test_instance_get_active_by_window_page(self):
+        self.mox.StubOutWithMock(db, 'instance_get_active_by_window_joined')
+        db.instance_get_active_by_window_joined(self.context, 'fake-begin',
+                                                'fake-end', None,
+                                                'fake-host', use_slave=True,
+                                                columns_to_join=['info_cache'],
+                                                marker=42, limit=10)
+        self.mox.ReplayAll()
+        self.conductor.instance_get_active_by_window(self.context,
+                                                     'fake-begin', 'fake-end',
+                                                     host='fake-host',
+                                                     columns_to_join=[
+                                                         'info_cache'],
+                                                     marker=42, limit=10)
+
     def test_instance_destroy(self):
         self.mox.StubOutWithMock(db, 'instance_destroy')
         db.instance_destroy(self.context, 'fake-uuid')
@@ -394,6 +448,20 @@ class _BaseTestCase(object):
                                         {'uuid': 'fake-id'}, 'fake-refr',
                                         'fake-bool')
 
+    def test_vol_usage_update_bulk(self):
+        self.mox.StubOutWithMock(db, 'vol_usage_update')
+        usages = [dict(volume='vol1', instance_uuid='uuid1', rd_req=1,
+                       rd_bytes=2, wr_req=3, wr_bytes=4),
+                  dict(volume='vol2', instance_uuid='uuid2', rd_req=5,
+                       rd_bytes=6, wr_req=7, wr_bytes=8)]
+        db.vol_usage_update(self.context, 'vol1', 1, 2, 3, 4, 'uuid1',
+                            'fake-refr', False)
+        db.vol_usage_update(self.context, 'vol2', 5, 6, 7, 8, 'uuid2',
+                            'fake-refr', False)
+        self.mox.ReplayAll()
+        self.conductor.vol_usage_update_bulk(self.context, usages,
+                                             'fake-refr')
+
     def test_ping(self):
         result = self.conductor.ping(self.context, 'foo')
         self.assertEqual(result, {'service': 'conductor', 'arg': 'foo'})
@@ -536,6 +604,152 @@ class ConductorTestCase(_BaseTestCase, test.TestCase):
                            dict(host='host', binary='binary'))
 
 
+class ConductorCacheTestCase(test.TestCase):
+    """Conductor Manager read cache Tests."""
+    def setUp(self):
+        super(ConductorCacheTestCase, self).setUp()
+        self.context = FakeContext('fake', 'fake')
+        self.flags(cached_methods=['instance_type_get:600',
+                                   'aggregate_get_by_host:0',
+                                   'provider_fw_rule_get_all'],
+                   group='conductor')
+        self.conductor = conductor_manager.ConductorManager()
+
+    def test_cached_method(self):
+        self.mox.StubOutWithMock(db, 'instance_type_get')
+        db.instance_type_get(self.context, 1).AndReturn({'id': 1})
+        db.instance_type_get(self.context, 2).AndReturn({'id': 2})
+        self.mox.ReplayAll()
+        for x in xrange(3):
+            self.assertEqual({'id': 1},
+                             self.conductor.instance_type_get(self.context,
+                                                              1))
+        self.assertEqual({'id': 2},
+                         self.conductor.instance_type_get(
+                             self.context, instance_type_id=2))
+        stats = self.conductor.cache.stats()['instance_type_get']
+        self.assertEqual(2, stats['hits'])
+        self.assertEqual(2, stats['misses'])
+        self.assertEqual(2, stats['entries'])
+
+    def test_cached_result_is_copied(self):
+        self.mox.StubOutWithMock(db, 'instance_type_get')
+        db.instance_type_get(self.context, 1).AndReturn({'id': 1})
+        self.mox.ReplayAll()
+        result = self.conductor.instance_type_get(self.context, 1)
+        result['id'] = 'changed'
+        self.assertEqual({'id': 1},
+                         self.conductor.instance_type_get(self.context, 1))
+
+    def test_cache_expires(self):
+        self.useFixture(test.TimeOverride())
+        self.mox.StubOutWithMock(db, 'instance_type_get')
+        db.instance_type_get(self.context, 1).AndReturn({'id': 1})
+        db.instance_type_get(self.context, 1).AndReturn({'id': 1})
+        self.mox.ReplayAll()
+        self.conductor.instance_type_get(self.context, 1)
+        timeutils.advance_time_seconds(601)
+        self.conductor.instance_type_get(self.context, 1)
+
+    def test_set_drops_expired_entries(self):
+        self.useFixture(test.TimeOverride())
+        cache = self.conductor.cache
+        cache.set('instance_type_get', 1, {'id': 1})
+        timeutils.advance_time_seconds(300)
+        cache.set('instance_type_get', 2, {'id': 2})
+        timeutils.advance_time_seconds(301)
+        cache.set('instance_type_get', 3, {'id': 3})
+        self.assertEqual(2, cache.stats()['instance_type_get']['entries'])
+        self.assertEqual((True, {'id': 2}),
+                         cache.get('instance_type_get', 2))
+
+    def test_cache_size(self):
+        self.flags(cache_size=2, group='conductor')
+        cache = self.conductor.cache
+        for key in xrange(3):
+            cache.set('instance_type_get', key, {'id': key})
+        self.assertEqual(2, cache.stats()['instance_type_get']['entries'])
+        self.assertEqual((False, None), cache.get('instance_type_get', 0))
+        self.assertEqual((True, {'id': 2}),
+                         cache.get('instance_type_get', 2))
+
+    def test_cache_key_includes_context(self):
+        self.mox.StubOutWithMock(db, 'instance_type_get')
+        db.instance_type_get(self.context, 1).AndReturn({'id': 1})
+        db.instance_type_get(self.context.elevated(), 1).AndReturn({'id': 1})
+        self.mox.ReplayAll()
+        self.conductor.instance_type_get(self.context, 1)
+        self.conductor.instance_type_get(self.context.elevated(), 1)
+
+    def test_default_ttl(self):
+        self.flags(cache_ttl=0, group='conductor')
+        conductor = conductor_manager.ConductorManager()
+        self.assertFalse(
+            conductor.cache.is_enabled('provider_fw_rule_get_all'))
+        self.assertTrue(self.conductor.cache.is_enabled(
+            'provider_fw_rule_get_all'))
+
+    def test_disabled_method_not_cached(self):
+        self.mox.StubOutWithMock(db, 'aggregate_get_by_host')
+        self.mox.StubOutWithMock(db, 'agent_build_get_by_triple')
+        db.aggregate_get_by_host(self.context.elevated(), 'host',
+                                 None).AndReturn([])
+        db.aggregate_get_by_host(self.context.elevated(), 'host',
+                                 None).AndReturn([])
+        db.agent_build_get_by_triple(self.context, 'xen', 'linux',
+                                     'x86').AndReturn(None)
+        db.agent_build_get_by_triple(self.context, 'xen', 'linux',
+                                     'x86').AndReturn(None)
+        self.mox.ReplayAll()
+        for x in xrange(2):
+            self.conductor.aggregate_get_by_host(self.context, 'host')
+            self.conductor.agent_build_get_by_triple(self.context, 'xen',
+                                                     'linux', 'x86')
+        self.assertFalse('aggregate_get_by_host' in
+                         self.conductor.cache.stats())
+
+    def test_aggregates_not_cached_by_default(self):
+        self.flags(cached_methods=conductor_cache.cache_opts[0].default,
+                   group='conductor')
+        conductor = conductor_manager.ConductorManager()
+        self.assertFalse(conductor.cache.is_enabled('aggregate_get_by_host'))
+        self.assertTrue(conductor.cache.is_enabled('instance_type_get'))
+
+    def test_write_invalidates(self):
+        self.flags(cached_methods=['aggregate_get_by_host'],
+                   group='conductor')
+        self.conductor = conductor_manager.ConductorManager()
+        aggregate = {'id': 'fake-id'}
+        self.mox.StubOutWithMock(db, 'aggregate_get_by_host')
+        self.mox.StubOutWithMock(db, 'aggregate_metadata_add')
+        db.aggregate_get_by_host(self.context.elevated(), 'host',
+                                 'key').AndReturn([])
+        db.aggregate_metadata_add(self.context.elevated(), 'fake-id',
+                                  {'key': 'value'}, False)
+        db.aggregate_get_by_host(self.context.elevated(), 'host',
+                                 'key').AndReturn([aggregate])
+        self.mox.ReplayAll()
+        self.assertEqual([], self.conductor.aggregate_get_by_host(
+            self.context, 'host', 'key'))
+        self.assertEqual([], self.conductor.aggregate_get_by_host(
+            self.context, 'host', 'key'))
+        self.conductor.aggregate_metadata_add(self.context, aggregate,
+                                              {'key': 'value'})
+        self.assertEqual([aggregate], self.conductor.aggregate_get_by_host(
+            self.context, 'host', 'key'))
+
+    def test_exceptions_not_cached(self):
+        self.mox.StubOutWithMock(db, 'instance_type_get')
+        db.instance_type_get(self.context, 1).AndRaise(
+            exc.InstanceTypeNotFound(instance_type_id=1))
+        db.instance_type_get(self.context, 1).AndReturn({'id': 1})
+        self.mox.ReplayAll()
+        self.assertRaises(exc.InstanceTypeNotFound,
+                          self.conductor.instance_type_get, self.context, 1)
+        self.assertEqual({'id': 1},
+                         self.conductor.instance_type_get(self.context, 1))
+
+
 class ConductorRPCAPITestCase(_BaseTestCase, test.TestCase):
     """Conductor RPC API Tests."""
     def setUp(self):
@@ -653,7 +867,7 @@ class ConductorAPITestCase(_BaseTestCase, test.TestCase):
 
         get_args = (self.context, 'uuid', 0, 'mac')
 
-        db.bw_usage_get(*get_args).AndReturn('foo')
+        db.bw_usage_get(*get_args, use_slave=False).AndReturn('foo')
 
         self.mox.ReplayAll()
         result = self.conductor.bw_usage_get(*get_args)
@@ -0,0 +1,30 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2013 OpenStack LLC.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import fixtures
+
+from nova.api.ec2 import ec2utils
+
+
+class EC2IdCacheFixture(fixtures.Fixture):
+    """Forgets the EC2 id mappings cached in memory, which outlive the
+    database of a test."""
+
+    def setUp(self):
+        super(EC2IdCacheFixture, self).setUp()
+        ec2utils.reset_id_caches()
+        self.addCleanup(ec2utils.reset_id_caches)
@@ -54,6 +54,10 @@ def copy_image(src, dest):
     pass
 
 
+def clone_image(src, dest, reflink=True):
+    return 0
+
+
 def resize2fs(path):
     pass
 
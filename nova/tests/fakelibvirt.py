@@ -305,6 +305,12 @@ class Domain(object):
     def UUIDString(self):
         return self._def['uuid']
 
+    def ID(self):
+        for domain_id, dom in self._connection._running_vms.iteritems():
+            if dom is self:
+                return domain_id
+        return -1
+
     def interfaceStats(self, device):
         return [10000242400, 1234, 0, 2, 213412343233, 34214234, 23, 3]
 
@@ -28,6 +28,7 @@ import nova.db.api
 from nova import exception
 from nova.image import s3
 from nova import test
+from nova.tests import ec2_id_cache_fixture
 from nova.tests.image import fake
 
 
@@ -84,6 +85,7 @@ file_manifest_xml = """<?xml version="1.0" ?>
 class TestS3ImageService(test.TestCase):
     def setUp(self):
         super(TestS3ImageService, self).setUp()
+        self.useFixture(ec2_id_cache_fixture.EC2IdCacheFixture())
         self.context = context.RequestContext(None, None)
         self.useFixture(fixtures.FakeLogger('boto'))
 
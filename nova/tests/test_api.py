@@ -41,6 +41,7 @@ from nova import context
 from nova import exception
 from nova.openstack.common import timeutils
 from nova import test
+from nova.tests import ec2_id_cache_fixture
 from nova.tests import matchers
 
 
@@ -215,6 +216,7 @@ class ApiEc2TestCase(test.TestCase):
     """Unit test for the cloud controller on an EC2 API."""
     def setUp(self):
         super(ApiEc2TestCase, self).setUp()
+        self.useFixture(ec2_id_cache_fixture.EC2IdCacheFixture())
         self.host = '127.0.0.1'
         # NOTE(vish): skipping the Authorizer
         roles = ['sysadmin', 'netadmin']
@@ -22,12 +22,17 @@ Tests for Block Device Mapping Code.
 from nova.api.ec2 import cloud
 from nova.api.ec2 import ec2utils
 from nova import test
+from nova.tests import ec2_id_cache_fixture
 from nova.tests import matchers
 
 
 class BlockDeviceMappingEc2CloudTestCase(test.TestCase):
     """Test Case for Block Device Mapping."""
 
+    def setUp(self):
+        super(BlockDeviceMappingEc2CloudTestCase, self).setUp()
+        self.useFixture(ec2_id_cache_fixture.EC2IdCacheFixture())
+
     def fake_ec2_vol_id_to_uuid(obj, ec2_id):
         if ec2_id == 'vol-87654321':
             return '22222222-3333-4444-5555-666666666666'
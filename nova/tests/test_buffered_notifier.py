@@ -0,0 +1,203 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2013 OpenStack LLC.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Tests for the buffered notification driver."""
+
+import os
+
+import eventlet
+
+from nova import buffered_notifier
+from nova import context
+from nova.openstack.common import jsonutils
+from nova.openstack.common.notifier import api as notifier_api
+from nova.openstack.common.notifier import test_notifier
+from nova import test
+from nova import utils
+
+
+class FakeDriver(object):
+    def __init__(self, fail=False):
+        self.fail = fail
+        self.notifications = []
+
+    def notify(self, context, message):
+        if self.fail:
+            raise Exception('fake broker down')
+        self.notifications.append((context, message))
+
+
+class BufferedNotifierTestCase(test.TestCase):
+    def setUp(self):
+        super(BufferedNotifierTestCase, self).setUp()
+        self.context = context.get_admin_context()
+        self.driver = FakeDriver()
+
+    def _notify(self, notifier, count):
+        for i in xrange(count):
+            notifier.notify(self.context, {'message_id': i})
+
+    def _sent(self):
+        return [message['message_id']
+                for _ctxt, message in self.driver.notifications]
+
+    def test_notify_in_batches(self):
+        notifier = buffered_notifier.BufferedNotifier([self.driver], 10, 2)
+        self._notify(notifier, 5)
+        self.assertEqual([], self.driver.notifications)
+        self.assertEqual(5, notifier.depth())
+
+        eventlet.sleep(0)
+        self.assertEqual(range(5), self._sent())
+        self.assertEqual(self.context, self.driver.notifications[0][0])
+        self.assertEqual(0, notifier.depth())
+        self.assertEqual(5, notifier.metrics['sent'])
+        self.assertEqual(3, notifier.metrics['batches'])
+        self.assertEqual(5, notifier.metrics['max_depth'])
+
+    def test_drop_oldest(self):
+        notifier = buffered_notifier.BufferedNotifier([self.driver], 2, 10,
+                                                      overflow='drop_oldest')
+        self._notify(notifier, 3)
+        eventlet.sleep(0)
+        self.assertEqual([1, 2], self._sent())
+        self.assertEqual(1, notifier.metrics['dropped'])
+
+    def test_spill_to_journal(self):
+        with utils.tempdir() as tmpdir:
+            journal = os.path.join(tmpdir, 'notifications.journal')
+            notifier = buffered_notifier.BufferedNotifier(
+                    [self.driver], 1, 10, overflow='spill', journal=journal)
+            self._notify(notifier, 3)
+            spilled = '%s.%d' % (journal, os.getpid())
+            self.assertTrue(os.path.exists(spilled))
+            self.assertEqual(2, notifier.metrics['spilled'])
+
+            eventlet.sleep(0)
+            self.assertEqual([0, 1, 2], sorted(self._sent()))
+            self.assertEqual(self.context.to_dict(),
+                             self.driver.notifications[1][0].to_dict())
+            self.assertEqual([], os.listdir(tmpdir))
+
+    def test_replay_journal_of_dead_process(self):
+        self.stubs.Set(buffered_notifier, '_pid_alive',
+                       lambda pid: pid == os.getpid())
+        with utils.tempdir() as tmpdir:
+            journal = os.path.join(tmpdir, 'notifications.journal')
+            with open(journal + '.1', 'w') as f:
+                f.write(jsonutils.dumps({'context': None,
+                                         'message': {'message_id': 0}}))
+            notifier = buffered_notifier.BufferedNotifier(
+                    [self.driver], 10, 10, overflow='spill', journal=journal)
+            self._notify(notifier, 1)
+            eventlet.sleep(0)
+            self.assertEqual([0, 0], self._sent())
+            self.assertEqual([], os.listdir(tmpdir))
+
+    def test_stop_spills_queued_notifications(self):
+        with utils.tempdir() as tmpdir:
+            journal = os.path.join(tmpdir, 'notifications.journal')
+            notifier = buffered_notifier.BufferedNotifier(
+                    [self.driver], 10, 10, overflow='spill', journal=journal)
+            self._notify(notifier, 2)
+            notifier.stop()
+            self.assertEqual(0, notifier.depth())
+            self.assertEqual(2, notifier.metrics['spilled'])
+            self.assertEqual(2, len(notifier._read_journal(
+                    '%s.%d' % (journal, os.getpid()))))
+
+    def test_stop_sends_queued_notifications_without_journal(self):
+        notifier = buffered_notifier.BufferedNotifier([self.driver], 10, 10)
+        self._notify(notifier, 2)
+        notifier.stop()
+        self.assertEqual([0, 1], self._sent())
+
+    def test_spill_without_journal_blocks(self):
+        notifier = buffered_notifier.BufferedNotifier([self.driver], 1, 10,
+                                                      overflow='spill')
+        self.assertEqual('block', notifier.overflow)
+
+    def test_driver_errors_do_not_stop_others(self):
+        failing = FakeDriver(fail=True)
+        notifier = buffered_notifier.BufferedNotifier([failing, self.driver],
+                                                      10, 10)
+        self._notify(notifier, 2)
+        eventlet.sleep(0)
+        self.assertEqual([0, 1], self._sent())
+        self.assertEqual(2, notifier.metrics['errors'])
+        self.assertEqual(2, notifier.metrics['sent'])
+
+    def test_worker_survives_errors(self):
+        notifier = buffered_notifier.BufferedNotifier([self.driver], 10, 10)
+        calls = []
+
+        def fake_report():
+            calls.append(None)
+            if len(calls) == 1:
+                raise IOError('fake journal error')
+
+        self.stubs.Set(notifier, '_report', fake_report)
+        self._notify(notifier, 1)
+        eventlet.sleep(0)
+        self._notify(notifier, 1)
+        eventlet.sleep(0)
+        self.assertEqual([0, 0], self._sent())
+        self.assertEqual(2, len(calls))
+
+    def test_worker_is_respawned_after_exit(self):
+        notifier = buffered_notifier.BufferedNotifier([self.driver], 10, 10)
+        self._notify(notifier, 1)
+        eventlet.sleep(0)
+        notifier._worker.kill()
+        self.assertEqual(None, notifier._worker)
+        self._notify(notifier, 1)
+        eventlet.sleep(0)
+        self.assertEqual([0, 0], self._sent())
+
+    def test_report_metrics(self):
+        info = []
+        self.stubs.Set(buffered_notifier.LOG, 'info',
+                       lambda msg, *args: info.append(msg))
+        notifier = buffered_notifier.BufferedNotifier([self.driver], 10, 10,
+                                                      report_interval=60)
+        notifier._reported_at -= 61
+        self._notify(notifier, 2)
+        eventlet.sleep(0)
+        self.assertEqual(1, len(info))
+        self.assertTrue('0 queued, 2 sent' in info[0])
+
+        self._notify(notifier, 1)
+        eventlet.sleep(0)
+        self.assertEqual(1, len(info))
+
+    def test_notifier_api(self):
+        notifier_api._reset_drivers()
+        self.addCleanup(notifier_api._reset_drivers)
+        buffered_notifier._reset_notifier()
+        self.addCleanup(buffered_notifier._reset_notifier)
+        test_notifier.NOTIFICATIONS = []
+        self.flags(notification_driver=[buffered_notifier.__name__],
+                   buffered_notification_drivers=[test_notifier.__name__])
+
+        notifier_api.notify(self.context, 'compute.host1',
+                            'compute.instance.create.end',
+                            notifier_api.INFO, {'uuid': 'fake-uuid'})
+        self.assertEqual([], test_notifier.NOTIFICATIONS)
+        eventlet.sleep(0)
+        self.assertEqual(1, len(test_notifier.NOTIFICATIONS))
+        self.assertEqual({'uuid': 'fake-uuid'},
+                         test_notifier.NOTIFICATIONS[0]['payload'])
@@ -20,10 +20,14 @@
 """Unit tests for the DB API."""
 
 import datetime
+import os
+import tempfile
 import uuid as stdlib_uuid
 
 from nova import context
 from nova import db
+from nova.db.sqlalchemy import models
+from nova.db.sqlalchemy import session
 from nova import exception
 from nova.openstack.common import cfg
 from nova.openstack.common import timeutils
@@ -152,6 +156,26 @@ class DbApiTestCase(test.TestCase):
         else:
             self.assertTrue(result[1]['deleted'])
 
+    def test_instance_get_active_by_window_joined_paginate(self):
+        ctxt = context.get_admin_context()
+        begin = timeutils.utcnow()
+        instances = [self.create_instances_with_args(host='host1')
+                     for i in xrange(3)]
+        self.create_instances_with_args(host='host2')
+        ids = [instance['id'] for instance in instances]
+
+        result = db.instance_get_active_by_window_joined(ctxt, begin,
+                host='host1', use_slave=False, marker=None, limit=2,
+                columns_to_join=['system_metadata'])
+        self.assertEqual(ids[:2], [instance['id'] for instance in result])
+        self.assertEqual([], result[0]['system_metadata'])
+        result = db.instance_get_active_by_window_joined(ctxt, begin,
+                host='host1', use_slave=False, marker=ids[1], limit=2)
+        self.assertEqual(ids[2:], [instance['id'] for instance in result])
+        result = db.instance_get_active_by_window_joined(ctxt, begin,
+                host='host1', use_slave=False, marker=ids[2], limit=2)
+        self.assertEqual([], result)
+
     def test_instance_get_all_by_filters_paginate(self):
         self.flags(sql_connection="notdb://")
         test1 = self.create_instances_with_args(display_name='test1')
@@ -370,6 +394,48 @@ class DbApiTestCase(test.TestCase):
         self.assertEqual(instance['instance_type']['name'],
                 inst_type2['name'])
 
+    def test_ec2_lookups_by_uuids(self):
+        inst1 = self.create_instances_with_args()
+        inst2 = self.create_instances_with_args()
+        uuids = [inst1['uuid'], inst2['uuid'], 'missing-uuid']
+        result = db.get_ec2_instance_ids_by_uuids(self.context, uuids)
+        self.assertEqual(result, {
+            inst1['uuid']: db.get_ec2_instance_id_by_uuid(self.context,
+                                                          inst1['uuid']),
+            inst2['uuid']: db.get_ec2_instance_id_by_uuid(self.context,
+                                                          inst2['uuid'])})
+        self.assertEqual(db.get_ec2_instance_ids_by_uuids(self.context, []),
+                         {})
+
+        volume_id = db.ec2_volume_create(self.context, 'volume-uuid')['id']
+        self.assertEqual(db.get_ec2_volume_ids_by_uuids(self.context,
+                                                        ['volume-uuid', 'x']),
+                         {'volume-uuid': volume_id})
+        snapshot_id = db.ec2_snapshot_create(self.context,
+                                             'snapshot-uuid')['id']
+        self.assertEqual(db.get_ec2_snapshot_ids_by_uuids(self.context,
+                                                          ['snapshot-uuid']),
+                         {'snapshot-uuid': snapshot_id})
+
+        s3_image = db.s3_image_create(self.context, 'image-uuid')
+        result = db.s3_image_get_all_by_uuids(self.context,
+                                              ['image-uuid', 'other-uuid'])
+        self.assertEqual([(r['id'], r['uuid']) for r in result],
+                         [(s3_image['id'], 'image-uuid')])
+
+        db.block_device_mapping_create(self.context,
+                                       {'instance_uuid': inst1['uuid'],
+                                        'device_name': '/dev/vdb'})
+        db.block_device_mapping_create(self.context,
+                                       {'instance_uuid': inst2['uuid'],
+                                        'device_name': '/dev/vdc'})
+        result = db.block_device_mapping_get_all_by_instances(self.context,
+                                                              uuids)
+        self.assertEqual(sorted((r['instance_uuid'], r['device_name'])
+                                for r in result),
+                         sorted([(inst1['uuid'], '/dev/vdb'),
+                                 (inst2['uuid'], '/dev/vdc')]))
+
     def test_instance_update_unique_name(self):
         otherprojectcontext = context.RequestContext(self.user_id,
                                           "%s2" % self.project_id)
@@ -420,6 +486,35 @@ class DbApiTestCase(test.TestCase):
         self.flags(osapi_compute_unique_server_name_scope='project')
         db.instance_update(otherprojectcontext, uuid1p2, values)
 
+    def test_instance_update_or_create_bulk(self):
+        ctxt = context.get_admin_context()
+        values = {'vm_state': 'building',
+                  'system_metadata': {'original_image_ref': 'blah',
+                                      'gone': 'soon'},
+                  'info_cache': {'network_info': '[]'}}
+        instance = db.instance_create(ctxt, values)
+        deleted = db.instance_create(ctxt, {'vm_state': 'active'})
+        db.instance_destroy(ctxt, deleted['uuid'])
+
+        db.instance_update_or_create_bulk(ctxt, [
+                {'uuid': instance['uuid'], 'vm_state': 'active',
+                 'system_metadata': {'original_image_ref': 'baz'},
+                 'info_cache': {'network_info': '[{}]'}},
+                {'uuid': deleted['uuid'], 'vm_state': 'deleted'},
+                {'uuid': 'new-uuid', 'vm_state': 'building',
+                 'cell_name': 'child'}])
+
+        instance = db.instance_get_by_uuid(ctxt, instance['uuid'])
+        self.assertEqual('active', instance['vm_state'])
+        self.assertEqual('[{}]', instance['info_cache']['network_info'])
+        system_meta = db.instance_system_metadata_get(ctxt, instance['uuid'])
+        self.assertEqual({'original_image_ref': 'baz'}, system_meta)
+        read_deleted = context.get_admin_context(read_deleted='yes')
+        deleted = db.instance_get_by_uuid(read_deleted, deleted['uuid'])
+        self.assertEqual('deleted', deleted['vm_state'])
+        created = db.instance_get_by_uuid(ctxt, 'new-uuid')
+        self.assertEqual('child', created['cell_name'])
+
     def test_instance_update_with_and_get_original(self):
         ctxt = context.get_admin_context()
 
@@ -987,6 +1082,40 @@ class DbApiTestCase(test.TestCase):
         _compare(bw_usages[2], expected_bw_usages[2])
         timeutils.clear_time_override()
 
+    def test_bw_usage_update_bulk(self):
+        ctxt = context.get_admin_context()
+        start_period = datetime.datetime(2013, 2, 1, 0, 0, 0)
+        refreshed = datetime.datetime(2013, 2, 1, 12, 0, 0)
+        db.bw_usage_update(ctxt, 'fake_uuid1', 'fake_mac1', start_period,
+                           100, 200, 12345, 67890)
+        db.bw_usage_update(ctxt, 'fake_uuid1', 'fake_mac1',
+                           start_period - datetime.timedelta(days=1),
+                           1, 2, 3, 4)
+
+        usages = [dict(uuid='fake_uuid1', mac='fake_mac1', bw_in=150,
+                       bw_out=250, last_ctr_in=12395, last_ctr_out=67940),
+                  dict(uuid='fake_uuid1', mac='fake_mac2', bw_in=0,
+                       bw_out=0, last_ctr_in=10, last_ctr_out=20),
+                  dict(uuid='fake_uuid2', mac='fake_mac3', bw_in=0,
+                       bw_out=0, last_ctr_in=30, last_ctr_out=40)]
+        db.bw_usage_update_bulk(ctxt, start_period, usages,
+                                last_refreshed=refreshed)
+
+        bw_usages = db.bw_usage_get_by_uuids(ctxt,
+                ['fake_uuid1', 'fake_uuid2'], start_period)
+        self.assertEqual(3, len(bw_usages))
+        for usage in usages:
+            bw_usage = db.bw_usage_get(ctxt, usage['uuid'], start_period,
+                                       usage['mac'])
+            for key, value in usage.items():
+                self.assertEqual(value, bw_usage[key])
+            self.assertEqual(refreshed, bw_usage['last_refreshed'])
+
+        previous = db.bw_usage_get(ctxt, 'fake_uuid1',
+                                   start_period - datetime.timedelta(days=1),
+                                   'fake_mac1')
+        self.assertEqual(1, previous['bw_in'])
+
 
 def _get_fake_aggr_values():
     return {'name': 'fake_aggregate'}
@@ -1410,6 +1539,53 @@ class CapacityTestCase(test.TestCase):
         self.assertEqual(2, int(stats['num_proj_12345']))
         self.assertEqual(3, int(stats['num_vm_building']))
 
+    def test_compute_node_get_all_updated_since(self):
+        now = timeutils.utcnow()
+        timeutils.set_time_override(now)
+        self.addCleanup(timeutils.clear_time_override)
+        item = self._create_helper('host1')
+
+        nodes = db.compute_node_get_all(self.ctxt, updated_since=now)
+        self.assertEqual([], nodes)
+        since = now - datetime.timedelta(seconds=1)
+        nodes = db.compute_node_get_all(self.ctxt, updated_since=since)
+        self.assertEqual([item['id']], [node['id'] for node in nodes])
+
+        timeutils.advance_time_seconds(10)
+        db.compute_node_update(self.ctxt, item['id'], {'free_ram_mb': 512})
+        nodes = db.compute_node_get_all(self.ctxt, updated_since=now)
+        self.assertEqual([512], [node['free_ram_mb'] for node in nodes])
+
+        since = timeutils.utcnow()
+        timeutils.advance_time_seconds(10)
+        db.service_destroy(self.ctxt, self.service['id'])
+        nodes = db.compute_node_get_all(self.ctxt, updated_since=since)
+        self.assertEqual([True], [node['deleted'] for node in nodes])
+
+    def test_compute_node_get_by_hosts(self):
+        item = self._create_helper('host1')
+        service_dict = dict(host='host2', binary='binary2',
+                            topic='compute', report_count=1,
+                            disabled=False)
+        service = db.service_create(self.ctxt, service_dict)
+        values = dict(vcpus=2, memory_mb=1024, local_gb=2048,
+                      vcpus_used=0, memory_mb_used=0, local_gb_used=0,
+                      free_ram_mb=1024, free_disk_gb=2048,
+                      hypervisor_type="xen", hypervisor_version=1,
+                      cpu_info="", running_vms=0, current_workload=0,
+                      service_id=service['id'])
+        db.compute_node_create(self.ctxt, values)
+
+        nodes = db.compute_node_get_by_hosts(self.ctxt, ['host1', 'host3'])
+        self.assertEqual(1, len(nodes))
+        self.assertEqual(item['id'], nodes[0]['id'])
+        self.assertEqual('host1', nodes[0]['service']['host'])
+
+        nodes = db.compute_node_get_by_hosts(self.ctxt, ['host1', 'host2'])
+        self.assertEqual(['host1', 'host2'],
+                         sorted(node['service']['host'] for node in nodes))
+        self.assertEqual([], db.compute_node_get_by_hosts(self.ctxt, []))
+
     def test_compute_node_update(self):
         item = self._create_helper('host1')
 
@@ -1671,3 +1847,105 @@ class VolumeUsageDBApiTestCase(test.TestCase):
         for key, value in expected_vol_usages.items():
             self.assertEqual(vol_usages[0][key], value)
         timeutils.clear_time_override()
+
+
+class TaskLogTestCase(test.TestCase):
+    def setUp(self):
+        super(TaskLogTestCase, self).setUp()
+        self.context = context.get_admin_context()
+        self.begin = '2013-01-01 00:00:00'
+        self.end = '2013-02-01 00:00:00'
+
+    def _task_log_get(self):
+        return db.task_log_get(self.context, 'fake-task', self.begin,
+                               self.end, 'fake-host')
+
+    def test_task_log_lifecycle(self):
+        self.assertEqual(None, self._task_log_get())
+        db.task_log_begin_task(self.context, 'fake-task', self.begin,
+                               self.end, 'fake-host', 0, 'started')
+        self.assertRaises(exception.TaskAlreadyRunning,
+                          db.task_log_begin_task, self.context, 'fake-task',
+                          self.begin, self.end, 'fake-host')
+        task_log = self._task_log_get()
+        self.assertEqual('RUNNING', task_log['state'])
+        self.assertEqual(None, task_log['marker'])
+
+        db.task_log_checkpoint_task(self.context, 'fake-task', self.begin,
+                                    self.end, 'fake-host', '42', 10, 1)
+        task_log = self._task_log_get()
+        self.assertEqual(('RUNNING', '42', 10, 1),
+                         (task_log['state'], task_log['marker'],
+                          task_log['task_items'], task_log['errors']))
+
+        db.task_log_end_task(self.context, 'fake-task', self.begin,
+                             self.end, 'fake-host', 2, 'done')
+        task_log = self._task_log_get()
+        self.assertEqual(('DONE', 2, 'done'),
+                         (task_log['state'], task_log['errors'],
+                          task_log['message']))
+        self.assertRaises(exception.TaskNotRunning,
+                          db.task_log_checkpoint_task, self.context,
+                          'fake-task', self.begin, self.end, 'fake-host',
+                          '43', 11, 2)
+        self.assertEqual([task_log['id']],
+                         [t['id'] for t in db.task_log_get_all(self.context,
+                                 'fake-task', self.begin, self.end)])
+
+
+class SlaveConnectionTestCase(test.TestCase):
+    """Tests for reads routed to slave_connection."""
+
+    def setUp(self):
+        super(SlaveConnectionTestCase, self).setUp()
+        self.context = context.get_admin_context()
+        slave_db = os.path.join(tempfile.mkdtemp(), 'slave.sqlite')
+        self.flags(slave_connection='sqlite:///%s' % slave_db)
+        self.addCleanup(self._reset_slave)
+        models.BASE.metadata.create_all(session.get_engine(slave_engine=True))
+
+        # NOTE: The two databases hold different instances, so the results
+        # tell which one was read.
+        db.instance_create(self.context, {'host': 'primary'})
+        slave_session = session.get_session(slave_session=True)
+        with slave_session.begin():
+            instance = models.Instance()
+            instance.update({'uuid': str(stdlib_uuid.uuid4()),
+                             'host': 'slave'})
+            slave_session.add(instance)
+
+    def _reset_slave(self):
+        if session._SLAVE_ENGINE is not None:
+            session._SLAVE_ENGINE.dispose()
+        session._SLAVE_ENGINE = None
+        session._SLAVE_MAKER = None
+
+    def _hosts(self, instances):
+        return [instance['host'] for instance in instances]
+
+    def test_instance_get_all_by_filters(self):
+        self.assertEqual(self._hosts(
+            db.instance_get_all_by_filters(self.context, {})), ['primary'])
+        self.assertEqual(self._hosts(
+            db.instance_get_all_by_filters(self.context, {},
+                                           use_slave=True)), ['slave'])
+
+    def test_instance_get_active_by_window_joined(self):
+        begin = timeutils.utcnow()
+        self.assertEqual(self._hosts(
+            db.instance_get_active_by_window_joined(self.context, begin)),
+            ['primary'])
+        self.assertEqual(self._hosts(
+            db.instance_get_active_by_window_joined(self.context, begin,
+                                                    use_slave=True)),
+            ['slave'])
+
+    def test_writes_and_other_reads_use_primary(self):
+        self.assertEqual(self._hosts(db.instance_get_all(self.context)),
+                         ['primary'])
+
+    def test_without_slave_connection(self):
+        self.flags(slave_connection='')
+        self.assertEqual(self._hosts(
+            db.instance_get_all_by_filters(self.context, {},
+                                           use_slave=True)), ['primary'])
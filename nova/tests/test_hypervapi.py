@@ -31,6 +31,7 @@ from nova import context
 from nova import db
 from nova.image import glance
 from nova.openstack.common import cfg
+from nova.tests import ec2_id_cache_fixture
 from nova.tests import fake_network
 from nova.tests.hyperv import basetestcase
 from nova.tests.hyperv import db_fakes
@@ -51,6 +52,7 @@ class HyperVAPITestCase(basetestcase.BaseTestCase):
 
     def setUp(self):
         super(HyperVAPITestCase, self).setUp()
+        self.useFixture(ec2_id_cache_fixture.EC2IdCacheFixture())
 
         self._user_id = 'fake'
         self._project_id = 'fake'
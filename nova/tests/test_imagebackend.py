@@ -123,14 +123,15 @@ class RawTestCase(_ImageTestCase, test.TestCase):
         fn = self.mox.CreateMockAnything()
         self.mox.StubOutWithMock(imagebackend.lockutils.synchronized,
                                  '__call__')
-        self.mox.StubOutWithMock(imagebackend.libvirt_utils, 'copy_image')
+        self.mox.StubOutWithMock(imagebackend.libvirt_utils, 'clone_image')
         self.mox.StubOutWithMock(imagebackend.disk, 'extend')
         return fn
 
     def test_create_image(self):
         fn = self.prepare_mocks()
         fn(target=self.TEMPLATE_PATH, image_id=None)
-        imagebackend.libvirt_utils.copy_image(self.TEMPLATE_PATH, self.PATH)
+        imagebackend.libvirt_utils.clone_image(self.TEMPLATE_PATH, self.PATH,
+                                               reflink=True).AndReturn(0)
         self.mox.ReplayAll()
 
         image = self.image_class(self.INSTANCE, self.NAME)
@@ -151,7 +152,8 @@ class RawTestCase(_ImageTestCase, test.TestCase):
     def test_create_image_extend(self):
         fn = self.prepare_mocks()
         fn(target=self.TEMPLATE_PATH, image_id=None)
-        imagebackend.libvirt_utils.copy_image(self.TEMPLATE_PATH, self.PATH)
+        imagebackend.libvirt_utils.clone_image(self.TEMPLATE_PATH, self.PATH,
+                                               reflink=True).AndReturn(0)
         imagebackend.disk.extend(self.PATH, self.SIZE)
         self.mox.ReplayAll()
 
@@ -160,6 +162,19 @@ class RawTestCase(_ImageTestCase, test.TestCase):
 
         self.mox.VerifyAll()
 
+    def test_create_image_without_reflink(self):
+        self.flags(libvirt_images_reflink=False)
+        fn = self.prepare_mocks()
+        fn(target=self.TEMPLATE_PATH, image_id=None)
+        imagebackend.libvirt_utils.clone_image(self.TEMPLATE_PATH, self.PATH,
+                                               reflink=False).AndReturn(4096)
+        self.mox.ReplayAll()
+
+        image = self.image_class(self.INSTANCE, self.NAME)
+        image.create_image(fn, self.TEMPLATE_PATH, None, image_id=None)
+
+        self.mox.VerifyAll()
+
 
 class Qcow2TestCase(_ImageTestCase, test.TestCase):
     SIZE = 1024 * 1024 * 1024
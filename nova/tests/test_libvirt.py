@@ -24,6 +24,8 @@ import mox
 import os
 import re
 import shutil
+import StringIO
+import sys
 import tempfile
 
 from lxml import etree
@@ -43,6 +45,7 @@ from nova.openstack.common import fileutils
 from nova.openstack.common import importutils
 from nova.openstack.common import jsonutils
 from nova.openstack.common import log as logging
+from nova.openstack.common import timeutils
 from nova import test
 from nova.tests import fake_libvirt_utils
 from nova.tests import fake_network
@@ -59,6 +62,7 @@ from nova.virt.libvirt import config as vconfig
 from nova.virt.libvirt import driver as libvirt_driver
 from nova.virt.libvirt import firewall
 from nova.virt.libvirt import imagebackend
+from nova.virt.libvirt import proxy
 from nova.virt.libvirt import utils as libvirt_utils
 from nova.virt.libvirt import volume
 from nova.virt.libvirt import volume_nfs
@@ -117,6 +121,9 @@ class FakeVirtDomain(object):
     def name(self):
         return "fake-domain %s" % self
 
+    def ID(self):
+        return 1
+
     def info(self):
         return [power_state.RUNNING, None, None, None, None]
 
@@ -1376,6 +1383,76 @@ class LibvirtConnTestCase(test.TestCase):
         devices = conn.get_disks(conn.list_instances()[0])
         self.assertEqual(devices, ['vda', 'vdb'])
 
+    def _setup_domain_xml(self, conn):
+        xml = ("<domain type='kvm'><name>fake</name><devices>"
+               "<disk type='file'><source file='/test/disk'/>"
+               "<target dev='vda' bus='virtio'/></disk>"
+               "</devices></domain>")
+        calls = {'XMLDesc': 0, 'detached': []}
+
+        class FakeDomain(FakeVirtDomain):
+            domain_id = 1
+
+            def ID(self):
+                return self.domain_id
+
+            def XMLDesc(self, *args):
+                calls['XMLDesc'] += 1
+                return xml
+
+            def attachDeviceFlags(self, xml, flags):
+                pass
+
+            def detachDeviceFlags(self, xml, flags):
+                calls['detached'].append(xml)
+
+        domain = FakeDomain()
+        self.stubs.Set(conn, '_lookup_by_name', lambda name: domain)
+        return domain, calls
+
+    def test_get_disks_reuses_domain_xml(self):
+        conn = libvirt_driver.LibvirtDriver(fake.FakeVirtAPI(), False)
+        domain, calls = self._setup_domain_xml(conn)
+        self.assertEqual(conn.get_disks('fake'), ['vda'])
+        self.assertEqual(conn.get_disks('fake'), ['vda'])
+        self.assertEqual(calls['XMLDesc'], 1)
+
+        # A restarted domain has a new id.
+        domain.domain_id = 2
+        self.assertEqual(conn.get_disks('fake'), ['vda'])
+        self.assertEqual(calls['XMLDesc'], 2)
+
+        conn._forget_domain('fake')
+        self.assertEqual(conn.get_disks('fake'), ['vda'])
+        self.assertEqual(calls['XMLDesc'], 3)
+
+    def test_attach_detach_volume_edit_domain_xml(self):
+        conn = libvirt_driver.LibvirtDriver(fake.FakeVirtAPI(), False)
+        domain, calls = self._setup_domain_xml(conn)
+
+        def fake_volume_driver_method(method_name, connection_info,
+                                      mount_device):
+            if method_name == 'connect_volume':
+                conf = vconfig.LibvirtConfigGuestDisk()
+                conf.source_type = 'block'
+                conf.source_path = '/dev/sdb'
+                conf.target_dev = mount_device
+                conf.target_bus = 'virtio'
+                return conf
+        self.stubs.Set(conn, 'volume_driver_method',
+                       fake_volume_driver_method)
+
+        self.assertEqual(conn.get_disks('fake'), ['vda'])
+        conn.attach_volume({}, {'name': 'fake'}, '/dev/vdb')
+        self.assertEqual(conn.get_disks('fake'), ['vda', 'vdb'])
+        conn.detach_volume({}, {'name': 'fake'}, '/dev/vdb')
+        self.assertEqual(conn.get_disks('fake'), ['vda'])
+        self.assertEqual(calls['XMLDesc'], 1)
+        self.assertTrue("<source dev=\"/dev/sdb\"/>" in calls['detached'][0])
+
+        self.assertRaises(exception.DiskNotFound, conn.detach_volume,
+                          {}, {'name': 'fake'}, '/dev/vdb')
+
     def test_snapshot_in_ami_format(self):
         expected_calls = [
             {'args': (),
@@ -2618,6 +2695,7 @@ class LibvirtConnTestCase(test.TestCase):
         # Preparing mocks
         vdmock = self.mox.CreateMock(libvirt.virDomain)
         self.mox.StubOutWithMock(vdmock, "XMLDesc")
+        vdmock.ID().AndReturn(1)
         vdmock.XMLDesc(0).AndReturn(dummyxml)
 
         def fake_lookup(instance_name):
@@ -3111,14 +3189,94 @@ class LibvirtConnTestCase(test.TestCase):
             return ['fake']
         self.stubs.Set(conn, 'list_instances', list_instances)
 
-        def get_info(instance_name):
+        def get_info(instance_name, inventory=None):
             raise exception.InstanceNotFound(instance_id='fake')
-        self.stubs.Set(conn, 'get_instance_disk_info', get_info)
+        self.stubs.Set(conn, '_get_instance_disk_info', get_info)
 
         result = conn.get_disk_available_least()
         space = fake_libvirt_utils.get_fs_info(CONF.instances_path)['free']
         self.assertEqual(result, space / 1024 ** 3)
 
+    def _setup_disk_inventory(self, conn, tmpdir):
+        disk_path = os.path.join(tmpdir, 'disk')
+        with open(disk_path, 'w') as f:
+            f.write('x' * 1024)
+        dummyxml = ("<domain type='kvm'><name>fake</name>"
+                    "<devices>"
+                    "<disk type='file'><driver name='qemu' type='qcow2'/>"
+                    "<source file='%s'/>"
+                    "<target dev='vda' bus='virtio'/></disk>"
+                    "<disk type='block'><driver name='qemu' type='raw'/>"
+                    "<source dev='/dev/sdb'/>"
+                    "<target dev='vdb' bus='virtio'/></disk>"
+                    "</devices></domain>" % disk_path)
+        calls = {'XMLDesc': 0, 'image_info': 0}
+
+        class FakeDomain(object):
+            def ID(self):
+                return 1
+
+            def XMLDesc(self, flags):
+                calls['XMLDesc'] += 1
+                return dummyxml
+
+        def fake_image_info(path, disk_type):
+            calls['image_info'] += 1
+            return '', 10 * 1024
+
+        self.stubs.Set(conn, 'list_instances', lambda: ['fake'])
+        self.stubs.Set(conn, '_lookup_by_name',
+                       lambda instance_name: FakeDomain())
+        self.stubs.Set(libvirt_driver, '_get_image_info', fake_image_info)
+        return disk_path, calls
+
+    def test_available_least_uses_disk_inventory(self):
+        conn = libvirt_driver.LibvirtDriver(fake.FakeVirtAPI(), False)
+        with utils.tempdir() as tmpdir:
+            disk_path, calls = self._setup_disk_inventory(conn, tmpdir)
+            result = conn.get_disk_available_least()
+            self.assertEqual(conn.get_disk_available_least(), result)
+            self.assertEqual(calls, {'XMLDesc': 1, 'image_info': 1})
+
+            info = conn._get_instance_disk_info(
+                    'fake', inventory=conn._disk_inventory)
+            self.assertEqual(info, [{'type': 'qcow2',
+                                     'path': disk_path,
+                                     'virt_disk_size': 10 * 1024,
+                                     'backing_file': '',
+                                     'disk_size': 1024}])
+
+            # NOTE: The allocated size is read again on every audit.
+            with open(disk_path, 'a') as f:
+                f.write('x' * 1024)
+            info = conn._get_instance_disk_info(
+                    'fake', inventory=conn._disk_inventory)
+            self.assertEqual(info[0]['disk_size'], 2048)
+            self.assertEqual(calls, {'XMLDesc': 1, 'image_info': 1})
+
+    def test_available_least_disk_inventory_invalidated(self):
+        conn = libvirt_driver.LibvirtDriver(fake.FakeVirtAPI(), False)
+        with utils.tempdir() as tmpdir:
+            disk_path, calls = self._setup_disk_inventory(conn, tmpdir)
+            conn.get_disk_available_least()
+
+            conn._forget_domain('fake')
+            conn.get_disk_available_least()
+            self.assertEqual(calls, {'XMLDesc': 2, 'image_info': 2})
+
+            # A file replaced under the same path is inspected again.
+            with open(disk_path + '.new', 'w') as f:
+                f.write('x' * 1024)
+            os.rename(disk_path + '.new', disk_path)
+            conn.get_disk_available_least()
+            self.assertEqual(calls, {'XMLDesc': 2, 'image_info': 3})
+
+            # Domains that went away are forgotten.
+            self.stubs.Set(conn, 'list_instances', lambda: [])
+            conn.get_disk_available_least()
+            self.assertEqual(conn._disk_inventory._disks, {})
+            self.assertEqual(conn._disk_inventory._images, {})
+
     def test_cpu_info(self):
         conn = libvirt_driver.LibvirtDriver(fake.FakeVirtAPI(), True)
 
@@ -4293,6 +4451,55 @@ disk size: 4.4M''', ''))
         finally:
             os.unlink(dst_path)
 
+    def test_clone_image_copies_sparse(self):
+        with utils.tempdir() as tmpdir:
+            src_path = os.path.join(tmpdir, 'src')
+            dst_path = os.path.join(tmpdir, 'dst')
+            data = 'canary' + '\0' * 1024 * 1024 + 'canary'
+            with open(src_path, 'w') as fp:
+                fp.write(data)
+
+            copied = libvirt_utils.clone_image(src_path, dst_path,
+                                               reflink=False)
+            with open(dst_path, 'r') as fp:
+                self.assertEquals(fp.read(), data)
+            self.assertTrue(copied < 1024 * 1024)
+
+    def _clone_image_twice(self, stderr):
+        self.stubs.Set(libvirt_utils, '_NO_REFLINK_DEVICES', set())
+        calls = []
+
+        def fake_execute(*args, **kwargs):
+            calls.append(args[1])
+            if '--reflink=always' in args:
+                raise exception.ProcessExecutionError(stderr=stderr)
+        self.stubs.Set(libvirt_utils, 'execute', fake_execute)
+
+        with utils.tempdir() as tmpdir:
+            src_path = os.path.join(tmpdir, 'src')
+            dst_path = os.path.join(tmpdir, 'dst')
+            open(src_path, 'w').close()
+            open(dst_path, 'w').close()
+            self.assertEqual(libvirt_utils.clone_image(src_path, dst_path),
+                             0)
+            libvirt_utils.clone_image(src_path, dst_path)
+        return calls
+
+    def test_clone_image_falls_back_to_copy(self):
+        calls = self._clone_image_twice(
+                "cp: failed to clone 'dst' from 'src': "
+                "Operation not supported\n")
+        # Reflinks are not tried again between the same filesystems.
+        self.assertEqual(calls, ['--reflink=always', '--sparse=always',
+                                 '--sparse=always'])
+
+    def test_clone_image_retries_reflink_after_other_errors(self):
+        calls = self._clone_image_twice(
+                "cp: failed to clone 'dst' from 'src': "
+                "No space left on device\n")
+        self.assertEqual(calls, ['--reflink=always', '--sparse=always',
+                                 '--reflink=always', '--sparse=always'])
+
     def test_write_to_file(self):
         dst_fd, dst_path = tempfile.mkstemp()
         try:
@@ -4770,10 +4977,10 @@ class LibvirtVolumeUsageTestCase(test.TestCase):
                       'device_name': 'vda'}]
 
     def test_get_all_volume_usage(self):
-        def fake_block_stats(instance_name, disk):
+        def fake_block_stats(instance_name, disk, domain=None):
             return (169L, 688640L, 0L, 0L, -1L)
 
-        self.stubs.Set(self.conn, 'block_stats', fake_block_stats)
+        self.stubs.Set(self.conn, '_block_stats', fake_block_stats)
         vol_usage = self.conn.get_all_volume_usage(self.c,
               [dict(instance=self.ins_ref, instance_bdms=self.bdms)])
 
@@ -4799,6 +5006,121 @@ class LibvirtVolumeUsageTestCase(test.TestCase):
         self.assertEqual(vol_usage, [])
 
 
+def _no_domain_error(msg):
+    error = libvirt.libvirtError(msg)
+    error.get_error_code = lambda: libvirt.VIR_ERR_NO_DOMAIN
+    return error
+
+
+class FakeStatsDomain(object):
+
+    def __init__(self, name, memory_kb, vcpus):
+        self._name = name
+        self.memory_kb = memory_kb
+        self.vcpus = vcpus
+        self.stale = False
+
+    def name(self):
+        return self._name
+
+    def info(self):
+        if self.stale:
+            raise _no_domain_error('stale')
+        return [power_state.RUNNING, self.memory_kb, self.memory_kb,
+                self.vcpus, 0L]
+
+    def blockStats(self, disk):
+        return (1L, 2L, 3L, 4L, 5L)
+
+
+class FakeStatsConnection(object):
+
+    def __init__(self, domains):
+        self.domains = domains
+        self.lookups = 0
+
+    def numOfDomains(self):
+        return len(self.domains)
+
+    def listDomainsID(self):
+        return self.domains.keys()
+
+    def lookupByID(self, domain_id):
+        self.lookups += 1
+        if domain_id not in self.domains:
+            raise _no_domain_error('gone')
+        return self.domains[domain_id]
+
+
+class DomainStatsCollectorTestCase(test.TestCase):
+    """Test for nova.virt.libvirt.driver.DomainStatsCollector."""
+
+    def setUp(self):
+        super(DomainStatsCollectorTestCase, self).setUp()
+        self.fake_conn = FakeStatsConnection(
+            {1: FakeStatsDomain('instance-1', 2048, 2),
+             2: FakeStatsDomain('instance-2', 4096, 4)})
+        self.collector = libvirt_driver.DomainStatsCollector(
+            lambda: self.fake_conn)
+        timeutils.set_time_override()
+        self.addCleanup(timeutils.clear_time_override)
+
+    def test_collect(self):
+        self.assertEqual(self.collector.collect(),
+            {1: {'name': 'instance-1', 'memory_kb': 2048, 'vcpus': 2},
+             2: {'name': 'instance-2', 'memory_kb': 4096, 'vcpus': 4}})
+
+    def test_get_reuses_recent_pass(self):
+        stats = self.collector.get()
+        self.assertEqual(self.fake_conn.lookups, 2)
+        self.fake_conn.domains[1].vcpus = 8
+        self.assertEqual(self.collector.get(), stats)
+
+        timeutils.advance_time_seconds(self.collector.max_age)
+        self.assertEqual(self.collector.get()[1]['vcpus'], 8)
+        # Handles are kept across passes.
+        self.assertEqual(self.fake_conn.lookups, 2)
+
+    def test_collect_stale_and_missing_domains(self):
+        self.collector.collect()
+        self.fake_conn.domains[1].stale = True
+        self.fake_conn.domains[1] = FakeStatsDomain('instance-1', 1024, 1)
+        self.fake_conn.domains[3] = FakeStatsDomain('instance-3', 512, 1)
+        self.stubs.Set(self.fake_conn, 'listDomainsID', lambda: [1, 2, 3, 4])
+        stats = self.collector.collect()
+        self.assertEqual(sorted(stats), [1, 2, 3])
+        self.assertEqual(stats[1]['memory_kb'], 1024)
+        self.assertEqual(self.fake_conn.lookups, 5)
+
+    def test_lookup(self):
+        self.assertEqual(self.collector.lookup('instance-2'),
+                         self.fake_conn.domains[2])
+        self.assertEqual(self.collector.lookup('instance-9'), None)
+
+    def test_driver_methods_share_one_pass(self):
+        self.flags(libvirt_type='xen')
+        self.fake_conn.domains[0] = FakeStatsDomain('Domain-0', 1024, 1)
+        self.stubs.Set(sys, 'platform', 'linux2')
+        meminfo = 'MemFree: 0 kB\nBuffers: 0 kB\nCached: 0 kB\n'
+        libvirt_driver.open = lambda path: StringIO.StringIO(meminfo)
+        self.addCleanup(delattr, libvirt_driver, 'open')
+        conn = libvirt_driver.LibvirtDriver(fake.FakeVirtAPI(), False)
+        conn._domain_stats = self.collector
+
+        def fake_lookup(instance_name):
+            self.fail('domain should be taken from the last pass')
+        self.stubs.Set(conn, '_lookup_by_name', fake_lookup)
+
+        self.assertEqual(conn.get_vcpu_used(), 7)
+        self.assertEqual(conn.get_memory_mb_used(), 7)
+        usage = conn.get_all_volume_usage(None,
+            [{'instance': {'name': 'instance-1'},
+              'instance_bdms': [{'volume_id': 1,
+                                 'device_name': '/dev/vdb'}]}])
+        self.assertEqual(usage[0]['wr_bytes'], 4L)
+        self.assertEqual(self.fake_conn.lookups, 3)
+
+
 class LibvirtNonblockingTestCase(test.TestCase):
     """Test libvirt_nonblocking option."""
 
@@ -4811,3 +5133,128 @@ class LibvirtNonblockingTestCase(test.TestCase):
         import nova.virt.libvirt.driver as libvirt_driver
         connection = libvirt_driver.LibvirtDriver('')
         jsonutils.to_primitive(connection._conn, convert_instances=True)
+
+
+class LibvirtCallPoolTestCase(test.TestCase):
+    """Test for nova.virt.libvirt.proxy."""
+
+    def setUp(self):
+        super(LibvirtCallPoolTestCase, self).setUp()
+        self.native_sleep = eventlet.patcher.original('time').sleep
+        self.native_lock = eventlet.patcher.original('threading').Lock()
+        self.running = 0
+        self.max_running = 0
+        self.answer = eventlet.patcher.original('threading').Event()
+        self.answered = []
+
+    def _wait_for_answer(self):
+        self.answer.wait(5)
+        self.answered.append(self.answer.is_set())
+
+    def _blocking(self, seconds):
+        with self.native_lock:
+            self.running += 1
+            self.max_running = max(self.max_running, self.running)
+        self.native_sleep(seconds)
+        with self.native_lock:
+            self.running -= 1
+        return seconds
+
+    def test_calls_do_not_block_the_hub(self):
+        pool = proxy.CallPool(2, 2, 0)
+        ticks = []
+
+        def ticker():
+            for i in range(5):
+                ticks.append(i)
+                eventlet.sleep(0.01)
+        eventlet.spawn(ticker)
+        self.assertEqual(pool.execute('info', self._blocking, 0.2), 0.2)
+        self.assertEqual(len(ticks), 5)
+        self.assertEqual(pool.metrics['info']['calls'], 1)
+
+    def test_calls_are_bounded(self):
+        pool = proxy.CallPool(2, 1, 0)
+        calls = [eventlet.spawn(pool.execute, 'createWithFlags',
+                                self._blocking, 0.05) for i in range(3)]
+        queries = [eventlet.spawn(pool.execute, 'XMLDesc',
+                                  self._blocking, 0.05) for i in range(4)]
+        for call in calls + queries:
+            call.wait()
+        self.assertEqual(self.max_running, 3)
+        self.assertEqual(pool.metrics['createWithFlags']['calls'], 3)
+        self.assertEqual(pool.metrics['XMLDesc']['calls'], 4)
+
+    def test_queries_do_not_wait_for_calls(self):
+        pool = proxy.CallPool(1, 1, 0)
+        call = eventlet.spawn(pool.execute, 'createWithFlags',
+                              self._wait_for_answer)
+        eventlet.sleep(0.01)
+        # Every call slot is busy, a query still gets an answer.
+        self.assertEqual(pool.execute('XMLDesc', self._blocking, 0), 0)
+        self.assertEqual(self.answered, [])
+        self.answer.set()
+        call.wait()
+        self.assertEqual(self.answered, [True])
+
+    def test_long_running_calls_are_not_bounded(self):
+        pool = proxy.CallPool(1, 1, 0)
+        migrations = [eventlet.spawn(pool.execute, 'migrateToURI',
+                                     self._wait_for_answer)
+                      for i in range(2)]
+        eventlet.sleep(0.01)
+        self.assertEqual(pool.execute('createWithFlags', self._blocking, 0),
+                         0)
+        self.assertEqual(self.answered, [])
+        self.answer.set()
+        for migration in migrations:
+            migration.wait()
+        self.assertEqual(self.answered, [True, True])
+        self.assertEqual(pool.metrics['migrateToURI']['calls'], 2)
+
+    def test_query_timeout(self):
+        pool = proxy.CallPool(1, 1, 0.05)
+        answer = eventlet.patcher.original('threading').Event()
+        self.assertRaises(exception.HypervisorCallTimeout,
+                          pool.execute, 'lookupByName', answer.wait, 5)
+        self.assertEqual(pool.metrics['lookupByName']['timeouts'], 1)
+        # The call keeps its slot until the native call returns.
+        self.assertRaises(exception.HypervisorCallTimeout,
+                          pool.execute, 'lookupByName', self._blocking, 0)
+        answer.set()
+        while not pool.metrics['lookupByName']['calls']:
+            eventlet.sleep(0.01)
+        self.assertEqual(pool.execute('lookupByName', self._blocking, 0), 0)
+        self.assertEqual(pool.metrics['lookupByName']['calls'], 2)
+        self.assertEqual(pool.metrics['lookupByName']['timeouts'], 2)
+
+        # Calls that change state are not timed out.
+        self.assertEqual(pool.execute('migrateToURI', self._blocking, 0.1),
+                         0.1)
+
+    def test_errors(self):
+        pool = proxy.CallPool(1, 1, 0)
+
+        def fail():
+            raise libvirt.libvirtError('failed')
+        self.assertRaises(libvirt.libvirtError, pool.execute, 'info', fail)
+        self.assertEqual(pool.metrics['info']['errors'], 1)
+        self.assertEqual(pool.metrics['info']['calls'], 1)
+
+    def test_proxy_autowrap(self):
+        pool = proxy.CallPool(1, 1, 0)
+        domain = FakeVirtDomain()
+
+        class FakeConnection(object):
+            uri = 'test:///default'
+
+            def lookupByName(self, name):
+                return domain
+
+        conn = proxy.Proxy(FakeConnection(), pool, (FakeVirtDomain,))
+        self.assertEqual(conn.uri, 'test:///default')
+        proxied = conn.lookupByName('fake')
+        self.assertTrue(isinstance(proxied, proxy.Proxy))
+        self.assertEqual(proxied.XMLDesc(0), domain.XMLDesc(0))
+        self.assertEqual(str(proxied), str(domain))
+        self.assertEqual(sorted(pool.metrics), ['XMLDesc', 'lookupByName'])
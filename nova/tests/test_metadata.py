@@ -35,6 +35,7 @@ from nova import exception
 from nova.network import api as network_api
 from nova.openstack.common import cfg
 from nova import test
+from nova.tests import ec2_id_cache_fixture
 from nova.tests import fake_network
 
 CONF = cfg.CONF
@@ -115,6 +116,7 @@ def fake_request(stubs, mdinst, relpath, address="127.0.0.1",
 class MetadataTestCase(test.TestCase):
     def setUp(self):
         super(MetadataTestCase, self).setUp()
+        self.useFixture(ec2_id_cache_fixture.EC2IdCacheFixture())
         self.instance = INSTANCES[0]
         fake_network.stub_out_nw_api_get_instance_nw_info(self.stubs,
                                                           spectacular=True)
@@ -244,6 +246,7 @@ class MetadataTestCase(test.TestCase):
 class OpenStackMetadataTestCase(test.TestCase):
     def setUp(self):
         super(OpenStackMetadataTestCase, self).setUp()
+        self.useFixture(ec2_id_cache_fixture.EC2IdCacheFixture())
         self.instance = INSTANCES[0]
         fake_network.stub_out_nw_api_get_instance_nw_info(self.stubs,
                                                           spectacular=True)
@@ -376,6 +379,7 @@ class MetadataHandlerTestCase(test.TestCase):
 
     def setUp(self):
         super(MetadataHandlerTestCase, self).setUp()
+        self.useFixture(ec2_id_cache_fixture.EC2IdCacheFixture())
 
         fake_network.stub_out_nw_api_get_instance_nw_info(self.stubs,
                                                           spectacular=True)
@@ -18,6 +18,7 @@
 """Tests for common notifcations."""
 
 import copy
+import datetime
 
 from nova.compute import instance_types
 from nova.compute import task_states
@@ -30,6 +31,7 @@ from nova.openstack.common import cfg
 from nova.openstack.common import log as logging
 from nova.openstack.common.notifier import api as notifier_api
 from nova.openstack.common.notifier import test_notifier
+from nova.openstack.common import timeutils
 from nova import test
 from nova.tests import fake_network
 
@@ -56,6 +58,8 @@ class NotificationsTestCase(test.TestCase):
 
         notifier_api._reset_drivers()
         self.addCleanup(notifier_api._reset_drivers)
+        notifications._UPDATE_PAYLOAD_CACHE.clear()
+        self.addCleanup(notifications._UPDATE_PAYLOAD_CACHE.clear)
         self.flags(compute_driver='nova.virt.fake.FakeDriver',
                    notification_driver=[test_notifier.__name__],
                    network_manager='nova.network.manager.FlatManager',
@@ -319,3 +323,67 @@ class NotificationsTestCase(test.TestCase):
 
         notifications.send_update(self.context, self.instance, self.instance)
         self.assertEquals(0, len(test_notifier.NOTIFICATIONS))
+
+    def test_update_payload_parts_cached(self):
+        self.instance = db.instance_update(self.context,
+                self.instance['uuid'], {'system_metadata': {'image_os': 'x'}})
+        calls = []
+        orig_sys_meta_get = db.instance_system_metadata_get
+
+        def fake_sys_meta_get(context, instance_uuid):
+            calls.append(instance_uuid)
+            return orig_sys_meta_get(context, instance_uuid)
+        self.stubs.Set(db, 'instance_system_metadata_get', fake_sys_meta_get)
+        instance = dict(self.instance.iteritems())
+        del instance['system_metadata']
+        instance['updated_at'] = timeutils.utcnow()
+
+        notifications.send_update(self.context, instance, instance)
+        notifications.send_update(self.context, instance, instance)
+        self.assertEquals([instance['uuid']], calls)
+        for notif in test_notifier.NOTIFICATIONS:
+            self.assertEquals({'os': 'x'}, notif['payload']['image_meta'])
+
+        instance['updated_at'] += datetime.timedelta(seconds=1)
+        notifications.send_update(self.context, instance, instance)
+        self.assertEquals(2, len(calls))
+
+    def test_joined_system_metadata_not_cached(self):
+        instance = dict(self.instance.iteritems())
+        instance['updated_at'] = timeutils.utcnow()
+        instance['system_metadata'] = {'image_os': 'x'}
+        notifications.send_update(self.context, instance, instance)
+        instance['system_metadata'] = {'image_os': 'y'}
+        notifications.send_update(self.context, instance, instance)
+        self.assertEquals(['x', 'y'],
+                          [notif['payload']['image_meta']['os']
+                           for notif in test_notifier.NOTIFICATIONS])
+
+    def test_send_compact_update(self):
+        self.flags(notify_update_format='compact')
+        old = copy.copy(self.instance)
+        self.instance['task_state'] = task_states.SPAWNING
+        notifications.send_update(self.context, old, self.instance)
+        self.assertEquals(1, len(test_notifier.NOTIFICATIONS))
+
+        payload = test_notifier.NOTIFICATIONS[0]['payload']
+        self.assertEquals(set(['tenant_id', 'user_id', 'instance_id',
+                               'state_description', 'old_state', 'state',
+                               'old_task_state', 'new_task_state',
+                               'audit_period_beginning',
+                               'audit_period_ending']), set(payload))
+        self.assertEquals(self.instance['uuid'], payload['instance_id'])
+        self.assertEquals(task_states.SPAWNING,
+                          payload['state_description'])
+        self.assertEquals(task_states.SPAWNING, payload['new_task_state'])
+
+    def test_send_compact_update_without_old_instance(self):
+        self.flags(notify_update_format='compact')
+        notifications.send_update_with_states(self.context, self.instance,
+                vm_states.BUILDING, vm_states.BUILDING, None,
+                task_states.SPAWNING)
+        self.assertEquals(1, len(test_notifier.NOTIFICATIONS))
+        payload = test_notifier.NOTIFICATIONS[0]['payload']
+        self.assertEquals(self.instance['display_name'],
+                          payload['display_name'])
+        self.assertFalse('bandwidth' in payload)
@@ -0,0 +1,90 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2013 OpenStack LLC.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import os
+
+from nova.openstack.common.rootwrap import filters
+from nova.openstack.common.rootwrap import wrapper
+from nova import rootwrap_daemon
+from nova import test
+
+FILTERS_PATH = os.path.join(os.path.dirname(__file__), os.pardir, os.pardir,
+                            'etc', 'nova', 'rootwrap.d')
+
+
+class RootwrapFilterIndexTestCase(test.TestCase):
+
+    def setUp(self):
+        super(RootwrapFilterIndexTestCase, self).setUp()
+        self.filters = [
+            filters.CommandFilter('/bin/ls', 'root'),
+            filters.RegExpFilter('/usr/bin/tee', 'root', 'tee', '/tmp/.*'),
+            filters.RegExpFilter('/bin/ls', 'root', '(ls|cat)', '-l'),
+            filters.CommandFilter('/bin/cat', 'root'),
+            filters.KillFilter('root', '/bin/sleep'),
+            filters.DnsmasqFilter('/usr/bin/dnsmasq', 'root'),
+        ]
+        self.index = rootwrap_daemon.FilterIndex(self.filters)
+
+    def test_filters_by_command(self):
+        f = self.filters
+        self.assertEqual([f[0], f[2]], self.index.get_filters(['ls', '-l']))
+        self.assertEqual([f[1], f[2]],
+                         self.index.get_filters(['tee', '/tmp/x']))
+        self.assertEqual([f[2], f[3]], self.index.get_filters(['cat', '-l']))
+        self.assertEqual([f[2], f[4]], self.index.get_filters(['kill', '1']))
+        self.assertEqual([f[2], f[5]], self.index.get_filters(['env']))
+        self.assertEqual([f[2]], self.index.get_filters(['rm', '-rf']))
+        self.assertEqual([f[2]], self.index.get_filters([]))
+
+    def test_unknown_filters_match_any_command(self):
+        class OtherFilter(filters.CommandFilter):
+            pass
+
+        f = self.filters + [OtherFilter('/bin/ls', 'root')]
+        index = rootwrap_daemon.FilterIndex(f)
+        self.assertEqual([f[2], f[4], f[6]], index.get_filters(['kill', '1']))
+
+    def _match(self, userargs):
+        return wrapper.match_filter(self.index.get_filters(userargs),
+                                    userargs)
+
+    def test_match_filter_keeps_order(self):
+        self.assertEqual(self.filters[2], self._match(['cat', '-l']))
+        self.assertEqual(self.filters[3], self._match(['cat', 'foo']))
+        self.assertRaises(wrapper.NoFilterMatched,
+                          self._match, ['tee', '/etc'])
+
+    def test_shipped_filters(self):
+        filterlist = wrapper.load_filters([FILTERS_PATH])
+        index = rootwrap_daemon.FilterIndex(filterlist)
+        commands = [['kpartx', '-a', '/dev/sda'],
+                    ['tee', '/sys/class/net/eth0/brport/hairpin_mode'],
+                    ['cat', '/etc/iscsi/initiatorname.iscsi'],
+                    ['env', 'CONFIG_FILE=/etc/nova/nova.conf',
+                     'NETWORK_ID=1', 'dnsmasq', '--strict-order'],
+                    ['rm', '-rf', '/']]
+        for userargs in commands:
+            for f in filterlist:
+                if f.match(userargs):
+                    expected = f
+                    break
+            else:
+                expected = None
+            matched = [f for f in index.get_filters(userargs)
+                       if f.match(userargs)]
+            self.assertEqual(expected, matched[0] if matched else None)
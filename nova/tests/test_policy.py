@@ -58,6 +58,29 @@ class PolicyFileTestCase(test.TestCase):
             self.assertRaises(exception.PolicyNotAuthorized, policy.enforce,
                               self.context, action, self.target)
 
+    def test_policy_file_check_interval(self):
+        with utils.tempdir() as tmpdir:
+            tmpfilename = os.path.join(tmpdir, 'policy')
+
+            self.flags(policy_file=tmpfilename, policy_check_interval=3600)
+            policy.reset()
+
+            action = "example:test"
+            with open(tmpfilename, "w") as policyfile:
+                policyfile.write('{"example:test": ""}')
+            policy.enforce(self.context, action, self.target)
+            with open(tmpfilename, "w") as policyfile:
+                policyfile.write('{"example:test": "!"}')
+            mtime = os.path.getmtime(tmpfilename)
+            os.utime(tmpfilename, (mtime + 10, mtime + 10))
+
+            # Not stat'ed again yet
+            policy.enforce(self.context, action, self.target)
+
+            self.flags(policy_check_interval=0)
+            self.assertRaises(exception.PolicyNotAuthorized, policy.enforce,
+                              self.context, action, self.target)
+
 
 class PolicyTestCase(test.TestCase):
     def setUp(self):
@@ -146,6 +169,137 @@ class PolicyTestCase(test.TestCase):
         policy.enforce(admin_context, lowercase_action, self.target)
         policy.enforce(admin_context, uppercase_action, self.target)
 
+    def test_enforce_memoized_per_context(self):
+        calls = []
+        to_dict = self.context.to_dict
+
+        def fake_to_dict():
+            calls.append(1)
+            return to_dict()
+        self.stubs.Set(self.context, 'to_dict', fake_to_dict)
+
+        action = "example:my_file"
+        target_mine = {'project_id': 'fake', 'host': 'host1'}
+        policy.enforce(self.context, action, target_mine)
+        self.assertEqual(len(calls), 1)
+        # Fields the rule does not look at do not matter
+        policy.enforce(self.context, action,
+                       {'project_id': 'fake', 'host': 'host2'})
+        self.assertEqual(len(calls), 1)
+
+        target_not_mine = {'project_id': 'another'}
+        self.assertRaises(exception.PolicyNotAuthorized, policy.enforce,
+                          self.context, action, target_not_mine)
+        self.assertEqual(len(calls), 2)
+        self.assertRaises(exception.PolicyNotAuthorized, policy.enforce,
+                          self.context, action, target_not_mine)
+        self.assertEqual(len(calls), 2)
+
+        # Credentials are part of the key
+        self.context.roles = ['compute_admin']
+        policy.enforce(self.context, action, target_not_mine)
+        self.assertEqual(len(calls), 3)
+
+    def test_enforce_memo_dropped_on_new_rules(self):
+        action = "example:allowed"
+        target = {'project_id': 'fake'}
+        self.policy.set_rules({action: 'project_id:%(project_id)s'})
+        policy.enforce(self.context, action, target)
+        self.policy.set_rules({action: 'role:admin'})
+        self.assertRaises(exception.PolicyNotAuthorized, policy.enforce,
+                          self.context, action, target)
+
+    def test_enforce_not_memoized_for_http(self):
+
+        def fakeurlopen(url, post_data):
+            calls.append(url)
+            return StringIO.StringIO("True")
+        calls = []
+        self.stubs.Set(urllib2, 'urlopen', fakeurlopen)
+        action = "example:get_http"
+        policy.enforce(self.context, action, {})
+        policy.enforce(self.context, action, {})
+        self.assertEqual(len(calls), 2)
+
+    def test_enforce_missing_target_field_denies(self):
+        action = "example:my_file"
+        self.assertRaises(exception.PolicyNotAuthorized, policy.enforce,
+                          self.context, action, {})
+
+
+class CompiledPolicyTestCase(test.TestCase):
+    """Compiled rules must decide exactly like the common policy engine."""
+
+    rules = {
+        "default": "rule:admin_or_owner",
+        "context_is_admin": "role:admin",
+        "admin_or_owner": "is_admin:True or project_id:%(project_id)s",
+        "admin_api": "is_admin:True",
+        "empty": "",
+        "deny": "!",
+        "nested": "(role:a or role:b) and (role:c or (role:d and role:e))",
+        "negated": "not rule:admin_api and user_id:%(user_id)s",
+        "list": [["role:a", "role:b"], ["rule:admin_api"]],
+        "or_true": "role:a or @",
+        "and_false": "! and role:a",
+        "ref_missing": "rule:no_such_rule",
+        "bad": "role:a or ",
+        "owner": "project_id:%(project_id)s",
+        "owner_or_admin": "rule:owner or role:admin",
+        "not_owner": "not rule:owner",
+    }
+
+    def setUp(self):
+        super(CompiledPolicyTestCase, self).setUp()
+        self.policy.set_rules(self.rules)
+        common_policy._rules.default_rule = "default"
+
+    def test_same_decisions(self):
+        targets = [{}, {'project_id': 'p1'}, {'project_id': 'p2'},
+                   {'project_id': 'p1', 'user_id': 'u1'}]
+        credentials = []
+        for roles in ([], ['a'], ['A', 'b'], ['c', 'd', 'e'], ['admin']):
+            for is_admin in (True, False):
+                credentials.append({'roles': roles, 'is_admin': is_admin,
+                                    'project_id': 'p1', 'user_id': 'u1'})
+        actions = list(self.rules) + ['undefined']
+        for action in actions:
+            rule = policy._get_compiled_rule(action)
+            for target in targets:
+                for creds in credentials:
+                    expected = common_policy.check(action, target, creds)
+                    try:
+                        result = rule.check(target, creds)
+                    except KeyError:
+                        result = False
+                    self.assertEqual(bool(expected), bool(result),
+                                     '%s %s %s' % (action, target, creds))
+
+    def test_constant_rules(self):
+        self.assertEqual(policy._get_compiled_rule('empty').value, True)
+        self.assertEqual(policy._get_compiled_rule('deny').value, False)
+        self.assertEqual(policy._get_compiled_rule('and_false').value, False)
+
+    def test_memo_keys(self):
+        rule = policy._get_compiled_rule('negated')
+        self.assertEqual(rule.target_keys, ('user_id',))
+        self.assertEqual(rule.cred_keys, ('is_admin', 'user_id'))
+        self.assertTrue(rule.cacheable)
+
+    def test_missing_field_fails_referenced_rule_only(self):
+        creds = {'roles': ['admin'], 'project_id': 'p1'}
+        for action in ('owner_or_admin', 'not_owner'):
+            self.assertTrue(common_policy.check(action, {}, creds))
+            rule = policy._get_compiled_rule(action)
+            self.assertTrue(rule.check({}, creds))
+
+    def test_self_reference_not_memoized(self):
+        self.policy.set_rules({"loop": "role:a or rule:loop2",
+                               "loop2": "role:b and rule:loop"})
+        self.assertFalse(policy._get_compiled_rule('loop').cacheable)
+        rule = policy._get_compiled_rule('loop')
+        self.assertTrue(rule.check({}, {'roles': ['a']}))
+
 
 class DefaultPolicyTestCase(test.TestCase):
 
@@ -16,13 +16,19 @@
 
 """Unit tests for SQLAlchemy specific code."""
 
+import time
+
 from eventlet import db_pool
 try:
     import MySQLdb
 except ImportError:
     MySQLdb = None
+import sqlalchemy.exc
+import sqlalchemy.orm.query
 
 from nova import context
+from nova import db
+from nova.db.sqlalchemy import models
 from nova.db.sqlalchemy import session
 from nova import test
 
@@ -64,3 +70,99 @@ class DbPoolTestCase(test.TestCase):
         self.assertEqual(info['kwargs']['max_idle'], 11)
         self.assertEqual(info['kwargs']['min_size'], 21)
         self.assertEqual(info['kwargs']['max_size'], 42)
+
+
+class FakeDBAPIConnection(object):
+    class OperationalError(Exception):
+        pass
+
+    def __init__(self, error=None):
+        self.pings = 0
+        self.error = error
+
+    def cursor(self):
+        return self
+
+    def execute(self, sql):
+        self.pings += 1
+        if self.error:
+            raise self.OperationalError(self.error, 'gone away')
+
+
+class FakeConnectionRecord(object):
+    def __init__(self):
+        self.info = {}
+
+
+class PingListenerTestCase(test.TestCase):
+    def setUp(self):
+        super(PingListenerTestCase, self).setUp()
+        self.conn = FakeDBAPIConnection()
+        self.record = FakeConnectionRecord()
+
+    def test_new_connection_is_not_pinged(self):
+        session.ping_listener(self.conn, self.record, None)
+        self.assertEqual(self.conn.pings, 0)
+
+    def test_recently_used_connection_is_not_pinged(self):
+        session.last_used_listener(self.conn, self.record)
+        session.ping_listener(self.conn, self.record, None)
+        self.assertEqual(self.conn.pings, 0)
+
+    def test_idle_connection_is_pinged(self):
+        self.record.info['last_used'] = time.time() - 60
+        session.ping_listener(self.conn, self.record, None)
+        self.assertEqual(self.conn.pings, 1)
+
+    def test_ping_every_checkout(self):
+        self.flags(sql_ping_interval=0)
+        session.ping_listener(self.conn, self.record, None)
+        self.assertEqual(self.conn.pings, 1)
+
+    def test_gone_away(self):
+        conn = FakeDBAPIConnection(error=2006)
+        self.record.info['last_used'] = time.time() - 60
+        self.assertRaises(sqlalchemy.exc.DisconnectionError,
+                          session.ping_listener, conn, self.record, None)
+
+
+class QueryRetryTestCase(test.TestCase):
+    def setUp(self):
+        super(QueryRetryTestCase, self).setUp()
+        self.context = context.get_admin_context()
+        self.calls = 0
+        orig_iter = sqlalchemy.orm.query.Query.__iter__
+
+        def fake_iter(query):
+            self.calls += 1
+            if self.calls == 1:
+                raise sqlalchemy.exc.DBAPIError('select', {}, Exception(),
+                                                connection_invalidated=True)
+            return orig_iter(query)
+
+        self.stubs.Set(sqlalchemy.orm.query.Query, '__iter__', fake_iter)
+
+    def test_lost_connection_is_retried(self):
+        self.assertEqual(db.instance_get_all(self.context), [])
+        self.assertEqual(self.calls, 2)
+
+    def test_not_retried_in_transaction(self):
+        db_session = session.get_session()
+        with db_session.begin():
+            self.assertRaises(sqlalchemy.exc.DBAPIError,
+                              db_session.query(models.Instance).all)
+        self.assertEqual(self.calls, 1)
+
+
+class RegexpTestCase(test.TestCase):
+    def test_regexp_is_compiled_once(self):
+        session._REGEXP_CACHE.clear()
+        self.assertTrue(session._regexp('^serv', 'server-1'))
+        self.assertFalse(session._regexp('^serv', None))
+        self.assertEqual(session._REGEXP_CACHE.keys(), ['^serv'])
+
+    def test_regexp_cache_is_bounded(self):
+        for i in xrange(session._REGEXP_CACHE_SIZE + 1):
+            session._regexp('^%d$' % i, i)
+        self.assertTrue(len(session._REGEXP_CACHE) <=
+                        session._REGEXP_CACHE_SIZE)
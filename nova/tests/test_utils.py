@@ -19,14 +19,19 @@ import datetime
 import hashlib
 import os
 import os.path
+import shutil
+import socket
 import StringIO
 import tempfile
 
+import eventlet
 import mox
 
 import nova
 from nova import exception
+from nova.openstack.common.rootwrap import filters
 from nova.openstack.common import timeutils
+from nova import rootwrap_daemon
 from nova import test
 from nova import utils
 
@@ -149,6 +154,104 @@ grep foo
             os.unlink(tmpfilename2)
 
 
+class FakeRootwrapConfig(object):
+    exec_dirs = ['/bin', '/usr/bin']
+    use_syslog = False
+
+
+class FakeRootwrapDaemonClient(object):
+    def __init__(self, *results):
+        self.results = list(results)
+        self.calls = []
+
+    def execute(self, cmd, process_input=None):
+        self.calls.append((cmd, process_input))
+        result = self.results.pop(0)
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+
+class RootwrapDaemonTestCase(test.TestCase):
+
+    def setUp(self):
+        super(RootwrapDaemonTestCase, self).setUp()
+        self.tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmpdir)
+        self.path = os.path.join(self.tmpdir, 'rootwrap.sock')
+        listener = rootwrap_daemon.listen(self.path)
+        self.addCleanup(listener.close)
+        server = rootwrap_daemon.RootwrapServer(
+                FakeRootwrapConfig(), [filters.CommandFilter('cat', 'root')],
+                'secret')
+        self.addCleanup(eventlet.spawn(server.serve_forever, listener).kill)
+
+    def test_allowed_command(self):
+        client = rootwrap_daemon.RootwrapDaemonClient(self.path, 'secret')
+        data = 'foo\n\xff\x00bar'
+        self.assertEqual((0, data, ''), client.execute(['cat'], data))
+
+    def test_unauthorized_command(self):
+        client = rootwrap_daemon.RootwrapDaemonClient(self.path, 'secret')
+        returncode, stdout, stderr = client.execute(['rm', '-rf', '/'])
+        self.assertEqual(rootwrap_daemon.RC_UNAUTHORIZED, returncode)
+        self.assertTrue('Unauthorized command: rm -rf /' in stdout)
+
+    def test_wrong_authkey(self):
+        client = rootwrap_daemon.RootwrapDaemonClient(self.path, 'guess')
+        self.assertRaises(rootwrap_daemon.ProtocolError,
+                          client.execute, ['cat'], 'foo')
+
+    def test_reply_lost(self):
+        def fake_run(server, userargs, process_input=None):
+            raise socket.error('fake daemon crash')
+
+        self.stubs.Set(rootwrap_daemon.RootwrapServer, 'run', fake_run)
+        client = rootwrap_daemon.RootwrapDaemonClient(self.path, 'secret')
+        self.assertRaises(rootwrap_daemon.ReplyLost,
+                          client.execute, ['cat'], 'foo')
+
+    def _stub_daemon(self, *clients):
+        clients = list(clients)
+        self.stubs.Set(os, 'geteuid', lambda: 1000)
+        self.stubs.Set(utils, '_get_rootwrap_daemon', lambda: clients[0])
+        self.stubs.Set(utils, '_forget_rootwrap_daemon',
+                       lambda: clients.pop(0))
+        self.flags(use_rootwrap_daemon=True)
+
+    def test_execute_through_daemon(self):
+        client = FakeRootwrapDaemonClient((1, '', 'oops'), (0, 'out', 'err'))
+        self._stub_daemon(client)
+        result = utils.execute('cat', 'foo', run_as_root=True,
+                               process_input='in', attempts=2,
+                               delay_on_retry=False)
+        self.assertEqual(('out', 'err'), result)
+        self.assertEqual([(['cat', 'foo'], 'in')] * 2, client.calls)
+
+    def test_execute_through_daemon_failure(self):
+        self._stub_daemon(FakeRootwrapDaemonClient((1, 'out', 'err')))
+        self.assertRaises(exception.ProcessExecutionError,
+                          utils.execute, 'cat', run_as_root=True)
+
+    def test_execute_restarts_lost_daemon(self):
+        lost = FakeRootwrapDaemonClient(
+                rootwrap_daemon.ProtocolError('Connection closed'))
+        client = FakeRootwrapDaemonClient((0, 'out', ''))
+        self._stub_daemon(lost, client)
+        self.assertEqual(('out', ''), utils.execute('cat', run_as_root=True))
+        self.assertEqual([(['cat'], None)], client.calls)
+
+    def test_execute_does_not_resend_after_reply_lost(self):
+        lost = FakeRootwrapDaemonClient(
+                rootwrap_daemon.ReplyLost('Connection closed'))
+        client = FakeRootwrapDaemonClient((0, 'out', ''))
+        self._stub_daemon(lost, client)
+        self.assertRaises(exception.ProcessExecutionError,
+                          utils.execute, 'cat', run_as_root=True)
+        self.assertEqual([(['cat'], None)], lost.calls)
+        self.assertEqual([], client.calls)
+
+
 class GetFromPathTestCase(test.TestCase):
     def test_tolerates_nones(self):
         f = utils.get_from_path
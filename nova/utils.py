@@ -25,6 +25,7 @@ import errno
 import functools
 import hashlib
 import inspect
+import json
 import os
 import pyclbr
 import random
@@ -41,6 +42,7 @@ from xml.sax import saxutils
 from eventlet import event
 from eventlet.green import subprocess
 from eventlet import greenthread
+from eventlet import semaphore
 import netaddr
 
 from nova import exception
@@ -49,6 +51,7 @@ from nova.openstack.common import excutils
 from nova.openstack.common import importutils
 from nova.openstack.common import log as logging
 from nova.openstack.common import timeutils
+from nova import rootwrap_daemon
 
 monkey_patch_opts = [
     cfg.BoolOpt('monkey_patch',
@@ -76,6 +79,11 @@ utils_opts = [
                default="/etc/nova/rootwrap.conf",
                help='Path to the rootwrap configuration file to use for '
                     'running commands as root'),
+    cfg.BoolOpt('use_rootwrap_daemon',
+                default=False,
+                help='Run commands as root through a nova-rootwrap-daemon '
+                     'started once, instead of running sudo nova-rootwrap '
+                     'for every command'),
 ]
 CONF = cfg.CONF
 CONF.register_opts(monkey_patch_opts)
@@ -148,6 +156,69 @@ def _subprocess_setup():
     signal.signal(signal.SIGPIPE, signal.SIG_DFL)
 
 
+_ROOTWRAP_DAEMON = None
+_ROOTWRAP_DAEMON_LOCK = semaphore.Semaphore()
+
+
+def _get_rootwrap_daemon():
+    """Return the client of our nova-rootwrap-daemon, starting it if needed.
+
+    The daemon exits once its stdin is closed, i.e. along with this process.
+    """
+    global _ROOTWRAP_DAEMON
+    with _ROOTWRAP_DAEMON_LOCK:
+        if _ROOTWRAP_DAEMON is None:
+            cmd = ['sudo', 'nova-rootwrap-daemon', CONF.rootwrap_config]
+            LOG.info(_('Starting %s'), ' '.join(cmd))
+            _PIPE = subprocess.PIPE  # pylint: disable=E1101
+            obj = subprocess.Popen(cmd,
+                                   stdin=_PIPE,
+                                   stdout=_PIPE,
+                                   close_fds=True,
+                                   preexec_fn=_subprocess_setup)
+            line = obj.stdout.readline()
+            try:
+                info = json.loads(line)
+                client = rootwrap_daemon.RootwrapDaemonClient(
+                        info['path'], str(info['authkey']).decode('hex'))
+            except (ValueError, KeyError, TypeError):
+                obj.stdin.close()
+                obj.wait()
+                raise exception.NovaException(
+                        _('Could not start nova-rootwrap-daemon: %s') % line)
+            _ROOTWRAP_DAEMON = (obj, client)
+        return _ROOTWRAP_DAEMON[1]
+
+
+def _forget_rootwrap_daemon():
+    global _ROOTWRAP_DAEMON
+    with _ROOTWRAP_DAEMON_LOCK:
+        if _ROOTWRAP_DAEMON is not None:
+            obj = _ROOTWRAP_DAEMON[0]
+            _ROOTWRAP_DAEMON = None
+            obj.stdin.close()
+
+
+def _rootwrap_daemon_execute(cmd, process_input):
+    """Run cmd as root through the daemon, restarting it once if gone.
+
+    The command is only sent again when the daemon failed before taking the
+    whole request, once it has been sent it may have run already.
+    """
+    try:
+        return _get_rootwrap_daemon().execute(cmd, process_input)
+    except rootwrap_daemon.ReplyLost as exc:
+        _forget_rootwrap_daemon()
+        raise exception.ProcessExecutionError(
+                cmd=' '.join(cmd),
+                description=_('Lost the reply of nova-rootwrap-daemon: '
+                              '%s') % exc)
+    except (socket.error, rootwrap_daemon.ProtocolError) as exc:
+        LOG.warn(_('Lost nova-rootwrap-daemon (%s), restarting it'), exc)
+        _forget_rootwrap_daemon()
+        return _get_rootwrap_daemon().execute(cmd, process_input)
+
+
 def execute(*cmd, **kwargs):
     """Helper method to execute command with optional retry.
 
@@ -165,7 +236,9 @@ def execute(*cmd, **kwargs):
                                before retrying.
     :param attempts:           How many times to retry cmd.
     :param run_as_root:        True | False. Defaults to False. If set to True,
-                               the command is run with rootwrap.
+                               the command is run with rootwrap, through
+                               nova-rootwrap-daemon if use_rootwrap_daemon
+                               is set.
 
     :raises exception.NovaException: on receiving unknown arguments
     :raises exception.ProcessExecutionError:
@@ -190,38 +263,49 @@ def execute(*cmd, **kwargs):
         raise exception.NovaException(_('Got unknown keyword args '
                                         'to utils.execute: %r') % kwargs)
 
+    use_daemon = False
     if run_as_root and os.geteuid() != 0:
-        cmd = ['sudo', 'nova-rootwrap', CONF.rootwrap_config] + list(cmd)
+        if CONF.use_rootwrap_daemon and not shell:
+            use_daemon = True
+        else:
+            cmd = ['sudo', 'nova-rootwrap', CONF.rootwrap_config] + list(cmd)
 
     cmd = map(str, cmd)
 
     while attempts > 0:
         attempts -= 1
         try:
-            LOG.debug(_('Running cmd (subprocess): %s'), ' '.join(cmd))
-            _PIPE = subprocess.PIPE  # pylint: disable=E1101
-
-            if os.name == 'nt':
-                preexec_fn = None
-                close_fds = False
-            else:
-                preexec_fn = _subprocess_setup
-                close_fds = True
-
-            obj = subprocess.Popen(cmd,
-                                   stdin=_PIPE,
-                                   stdout=_PIPE,
-                                   stderr=_PIPE,
-                                   close_fds=close_fds,
-                                   preexec_fn=preexec_fn,
-                                   shell=shell)
-            result = None
-            if process_input is not None:
-                result = obj.communicate(process_input)
+            if use_daemon:
+                LOG.debug(_('Running cmd (rootwrap daemon): %s'),
+                          ' '.join(cmd))
+                _returncode, stdout, stderr = _rootwrap_daemon_execute(
+                        cmd, process_input)
+                result = (stdout, stderr)
             else:
-                result = obj.communicate()
-            obj.stdin.close()  # pylint: disable=E1101
-            _returncode = obj.returncode  # pylint: disable=E1101
+                LOG.debug(_('Running cmd (subprocess): %s'), ' '.join(cmd))
+                _PIPE = subprocess.PIPE  # pylint: disable=E1101
+
+                if os.name == 'nt':
+                    preexec_fn = None
+                    close_fds = False
+                else:
+                    preexec_fn = _subprocess_setup
+                    close_fds = True
+
+                obj = subprocess.Popen(cmd,
+                                       stdin=_PIPE,
+                                       stdout=_PIPE,
+                                       stderr=_PIPE,
+                                       close_fds=close_fds,
+                                       preexec_fn=preexec_fn,
+                                       shell=shell)
+                result = None
+                if process_input is not None:
+                    result = obj.communicate(process_input)
+                else:
+                    result = obj.communicate()
+                obj.stdin.close()  # pylint: disable=E1101
+                _returncode = obj.returncode  # pylint: disable=E1101
             LOG.debug(_('Result was %s') % _returncode)
             if not ignore_exit_code and _returncode not in check_exit_code:
                 (stdout, stderr) = result
@@ -50,7 +50,6 @@ import tempfile
 import uuid
 
 from eventlet import greenthread
-from eventlet import tpool
 from lxml import etree
 from xml.dom import minidom
 
@@ -69,6 +68,7 @@ from nova.openstack.common import importutils
 from nova.openstack.common import jsonutils
 from nova.openstack.common import log as logging
 from nova.openstack.common.notifier import api as notifier
+from nova.openstack.common import timeutils
 from nova import utils
 from nova import version
 from nova.virt import configdrive
@@ -79,6 +79,7 @@ from nova.virt.libvirt import config as vconfig
 from nova.virt.libvirt import firewall as libvirt_firewall
 from nova.virt.libvirt import imagebackend
 from nova.virt.libvirt import imagecache
+from nova.virt.libvirt import proxy
 from nova.virt.libvirt import utils as libvirt_utils
 from nova.virt import netutils
 
@@ -205,23 +206,6 @@ DEFAULT_FIREWALL_DRIVER = "%s.%s" % (
 MAX_CONSOLE_BYTES = 102400
 
 
-def patch_tpool_proxy():
-    """eventlet.tpool.Proxy doesn't work with old-style class in __str__()
-    or __repr__() calls. See bug #962840 for details.
-    We perform a monkey patch to replace those two instance methods.
-    """
-    def str_method(self):
-        return str(self._obj)
-
-    def repr_method(self):
-        return repr(self._obj)
-
-    tpool.Proxy.__str__ = str_method
-    tpool.Proxy.__repr__ = repr_method
-
-
-patch_tpool_proxy()
-
 VIR_DOMAIN_NOSTATE = 0
 VIR_DOMAIN_RUNNING = 1
 VIR_DOMAIN_BLOCKED = 2
@@ -284,6 +268,9 @@ class LibvirtDriver(driver.ComputeDriver):
             self.virtapi,
             get_connection=self._get_connection)
         self.vif_driver = importutils.import_object(CONF.libvirt_vif_driver)
+        self._disk_inventory = DiskInventory()
+        self._domain_xml = DomainXMLCache()
+        self._domain_stats = DomainStatsCollector(self._get_connection)
         self.volume_drivers = {}
         for driver_str in CONF.libvirt_volume_drivers:
             driver_type, _sep, driver = driver_str.partition('=')
@@ -353,7 +340,7 @@ class LibvirtDriver(driver.ComputeDriver):
                 self._wrapped_conn = self._connect(self.uri,
                                                self.read_only)
             else:
-                self._wrapped_conn = tpool.proxy_call(
+                self._wrapped_conn = proxy.proxy_call(
                     (libvirt.virDomain, libvirt.virConnect),
                     self._connect, self.uri, self.read_only)
 
@@ -477,6 +464,7 @@ class LibvirtDriver(driver.ComputeDriver):
             self.vif_driver.unplug(instance, (network, mapping))
 
     def _destroy(self, instance):
+        self._forget_domain(instance['name'])
         try:
             virt_dom = self._lookup_by_name(instance['name'])
         except exception.NotFound:
@@ -679,6 +667,8 @@ class LibvirtDriver(driver.ComputeDriver):
             if state == power_state.RUNNING:
                 flags |= libvirt.VIR_DOMAIN_AFFECT_LIVE
             virt_dom.attachDeviceFlags(conf.to_xml(), flags)
+            self._disk_inventory.invalidate(instance_name)
+            self._domain_xml.add_device(instance_name, conf.format_dom())
         except Exception, ex:
             if isinstance(ex, libvirt.libvirtError):
                 errcode = ex.get_error_code()
@@ -694,18 +684,28 @@ class LibvirtDriver(driver.ComputeDriver):
                                             mount_device)
 
     @staticmethod
-    def _get_disk_xml(xml, device):
-        """Returns the xml for the disk mounted at device."""
-        try:
-            doc = etree.fromstring(xml)
-        except Exception:
-            return None
+    def _get_disk_node(doc, device):
+        """Returns the element of the disk mounted at device."""
         ret = doc.findall('./devices/disk')
         for node in ret:
             for child in node.getchildren():
                 if child.tag == 'target':
                     if child.get('dev') == device:
-                        return etree.tostring(node)
+                        return node
+
+    def _get_domain_doc(self, instance_name, virt_dom=None):
+        """Returns the parsed xml of a domain.
+
+        The document is shared with later callers and must not be changed.
+        """
+        if virt_dom is None:
+            virt_dom = self._lookup_by_name(instance_name)
+        return self._domain_xml.get(instance_name, virt_dom)
+
+    def _forget_domain(self, instance_name):
+        """Drops what is cached about the devices of a domain."""
+        self._disk_inventory.invalidate(instance_name)
+        self._domain_xml.invalidate(instance_name)
 
     def _get_domain_xml(self, instance, network_info, block_device_info=None):
         try:
@@ -721,8 +721,12 @@ class LibvirtDriver(driver.ComputeDriver):
         mount_device = mountpoint.rpartition("/")[2]
         try:
             virt_dom = self._lookup_by_name(instance_name)
-            xml = self._get_disk_xml(virt_dom.XMLDesc(0), mount_device)
-            if not xml:
+            try:
+                doc = self._get_domain_doc(instance_name, virt_dom)
+                node = self._get_disk_node(doc, mount_device)
+            except etree.XMLSyntaxError:
+                node = None
+            if node is None:
                 raise exception.DiskNotFound(location=mount_device)
             else:
                 # NOTE(vish): We can always affect config because our
@@ -732,7 +736,9 @@ class LibvirtDriver(driver.ComputeDriver):
                 state = LIBVIRT_POWER_STATE[virt_dom.info()[0]]
                 if state == power_state.RUNNING:
                     flags |= libvirt.VIR_DOMAIN_AFFECT_LIVE
-                virt_dom.detachDeviceFlags(xml, flags)
+                virt_dom.detachDeviceFlags(etree.tostring(node), flags)
+                self._disk_inventory.invalidate(instance_name)
+                self._domain_xml.remove_device(instance_name, node)
         except libvirt.libvirtError as ex:
             # NOTE(vish): This is called to cleanup volumes after live
             #             migration, so we should still disconnect even if
@@ -996,6 +1002,7 @@ class LibvirtDriver(driver.ComputeDriver):
                            admin_pass=rescue_password)
         self._destroy(instance)
         self._create_domain(xml)
+        self._forget_domain(instance['name'])
 
     def unrescue(self, instance, network_info):
         """Reboot the VM which is being rescued back into primary images.
@@ -1006,6 +1013,7 @@ class LibvirtDriver(driver.ComputeDriver):
         virt_dom = self._lookup_by_name(instance['name'])
         self._destroy(instance)
         self._create_domain(xml, virt_dom)
+        self._forget_domain(instance['name'])
         libvirt_utils.file_delete(unrescue_xml_path)
         rescue_files = os.path.join(instance_dir, "*.rescue")
         for rescue_file in glob.iglob(rescue_files):
@@ -1922,6 +1930,8 @@ class LibvirtDriver(driver.ComputeDriver):
         if xml:
             domain = self._conn.defineXML(xml)
         domain.createWithFlags(launch_flags)
+        if instance:
+            self._forget_domain(instance['name'])
         self._enable_hairpin(domain.XMLDesc(0))
 
         # NOTE(uni): Now the container is running with its own private mount
@@ -1981,12 +1991,9 @@ class LibvirtDriver(driver.ComputeDriver):
 
         Returns a list of all block devices for this domain.
         """
-        domain = self._lookup_by_name(instance_name)
-        xml = domain.XMLDesc(0)
-
         try:
-            doc = etree.fromstring(xml)
-        except Exception:
+            doc = self._get_domain_doc(instance_name)
+        except etree.XMLSyntaxError:
             return []
 
         return filter(bool,
@@ -2073,30 +2080,8 @@ class LibvirtDriver(driver.ComputeDriver):
 
         """
 
-        total = 0
-        dom_ids = self.list_instance_ids()
-        for dom_id in dom_ids:
-            try:
-                dom = self._conn.lookupByID(dom_id)
-                vcpus = dom.vcpus()
-                if vcpus is None:
-                    # dom.vcpus is not implemented for lxc, but returning 0 for
-                    # a used count is hardly useful for something measuring
-                    # usage
-                    total += 1
-                else:
-                    total += len(vcpus[1])
-            except libvirt.libvirtError as err:
-                if err.get_error_code() == libvirt.VIR_ERR_NO_DOMAIN:
-                    LOG.debug(_("List of domains returned by libVirt: %s")
-                              % dom_ids)
-                    LOG.warn(_("libVirt can't find a domain with id: %s")
-                             % dom_id)
-                    continue
-                raise
-            # NOTE(gtt116): give change to do other task.
-            greenthread.sleep(0)
-        return total
+        return sum(stats['vcpus']
+                   for stats in self._domain_stats.get().itervalues())
 
     def get_memory_mb_used(self):
         """Get the free memory size(MB) of physical computer.
@@ -2114,9 +2099,9 @@ class LibvirtDriver(driver.ComputeDriver):
         idx3 = m.index('Cached:')
         if CONF.libvirt_type == 'xen':
             used = 0
-            for domain_id in self.list_instance_ids():
+            for domain_id, stats in self._domain_stats.get().iteritems():
                 # skip dom0
-                dom_mem = int(self._conn.lookupByID(domain_id).info()[2])
+                dom_mem = stats['memory_kb']
                 if domain_id != 0:
                     used += dom_mem
                 else:
@@ -2248,6 +2233,7 @@ class LibvirtDriver(driver.ComputeDriver):
 
         for instance_bdms in compute_host_bdms:
             instance = instance_bdms['instance']
+            domain = self._domain_stats.lookup(instance['name'])
 
             for bdm in instance_bdms['instance_bdms']:
                 vol_stats = []
@@ -2257,7 +2243,8 @@ class LibvirtDriver(driver.ComputeDriver):
 
                 LOG.debug(_("Trying to get stats for the volume %s"),
                             bdm['volume_id'])
-                vol_stats = self.block_stats(instance['name'], mountpoint)
+                vol_stats = self._block_stats(instance['name'], mountpoint,
+                                              domain)
 
                 if vol_stats:
                     rd_req, rd_bytes, wr_req, wr_bytes, flush_ops = vol_stats
@@ -2274,8 +2261,12 @@ class LibvirtDriver(driver.ComputeDriver):
         """
         Note that this function takes an instance name.
         """
+        return self._block_stats(instance_name, disk)
+
+    def _block_stats(self, instance_name, disk, domain=None):
         try:
-            domain = self._lookup_by_name(instance_name)
+            if domain is None:
+                domain = self._lookup_by_name(instance_name)
             return domain.blockStats(disk)
         except libvirt.libvirtError as e:
             errcode = e.get_error_code()
@@ -2805,42 +2796,39 @@ class LibvirtDriver(driver.ComputeDriver):
                   'disk_size':'83886080'},...]"
 
         """
-        disk_info = []
+        return jsonutils.dumps(self._get_instance_disk_info(instance_name))
 
-        virt_dom = self._lookup_by_name(instance_name)
-        xml = virt_dom.XMLDesc(0)
-        doc = etree.fromstring(xml)
-        disk_nodes = doc.findall('.//devices/disk')
-        path_nodes = doc.findall('.//devices/disk/source')
-        driver_nodes = doc.findall('.//devices/disk/driver')
-
-        for cnt, path_node in enumerate(path_nodes):
-            disk_type = disk_nodes[cnt].get('type')
-            path = path_node.get('file')
-
-            if disk_type != 'file':
-                LOG.debug(_('skipping %(path)s since it looks like volume') %
-                          locals())
-                continue
+    def _get_instance_disk_info(self, instance_name, inventory=None):
+        """Return the list of file backed disks of an instance.
 
-            # get the real disk size or
-            # raise a localized error if image is unavailable
-            dk_size = int(os.path.getsize(path))
+        With an inventory, the disks of the domain and the image details of
+        their files are taken from it when still known there.
+        """
+        def get_file_disks():
+            return _get_file_disks(self._get_domain_doc(instance_name))
 
-            disk_type = driver_nodes[cnt].get('type')
-            if disk_type == "qcow2":
-                backing_file = libvirt_utils.get_disk_backing_file(path)
-                virt_size = disk.get_disk_size(path)
+        if inventory is None:
+            disks = get_file_disks()
+        else:
+            disks = inventory.get_disks(instance_name, get_file_disks)
+
+        disk_info = []
+        for path, disk_type in disks:
+            if inventory is None:
+                # get the real disk size or
+                # raise a localized error if image is unavailable
+                dk_size = int(os.path.getsize(path))
+                backing_file, virt_size = _get_image_info(path, disk_type)
             else:
-                backing_file = ""
-                virt_size = 0
+                dk_size, backing_file, virt_size = inventory.get_sizes(
+                    path, disk_type)
 
             disk_info.append({'type': disk_type,
                               'path': path,
                               'virt_disk_size': virt_size,
                               'backing_file': backing_file,
                               'disk_size': dk_size})
-        return jsonutils.dumps(disk_info)
+        return disk_info
 
     def get_disk_available_least(self):
         """Return disk available least size.
@@ -2857,16 +2845,18 @@ class LibvirtDriver(driver.ComputeDriver):
 
         # Disk size that all instance uses : virtual_size - disk_size
         instances_name = self.list_instances()
+        self._disk_inventory.retain(instances_name)
         instances_sz = 0
         for i_name in instances_name:
             try:
-                disk_infos = jsonutils.loads(
-                        self.get_instance_disk_info(i_name))
+                disk_infos = self._get_instance_disk_info(
+                        i_name, inventory=self._disk_inventory)
                 for info in disk_infos:
                     i_vt_sz = int(info['virt_disk_size'])
                     i_dk_sz = int(info['disk_size'])
                     instances_sz += i_vt_sz - i_dk_sz
             except OSError as e:
+                self._disk_inventory.invalidate(i_name)
                 if e.errno == errno.ENOENT:
                     LOG.error(_("Getting disk size of %(i_name)s: %(e)s") %
                               locals())
@@ -3148,6 +3138,199 @@ class LibvirtDriver(driver.ComputeDriver):
         return os.access(instance_path, os.W_OK)
 
 
+def _get_file_disks(doc):
+    """Return (path, driver type) of the file backed disks of a domain."""
+    disks = []
+    disk_nodes = doc.findall('.//devices/disk')
+    path_nodes = doc.findall('.//devices/disk/source')
+    driver_nodes = doc.findall('.//devices/disk/driver')
+
+    for cnt, path_node in enumerate(path_nodes):
+        disk_type = disk_nodes[cnt].get('type')
+        path = path_node.get('file')
+
+        if disk_type != 'file':
+            LOG.debug(_('skipping %(path)s since it looks like volume') %
+                      locals())
+            continue
+
+        disks.append((path, driver_nodes[cnt].get('type')))
+    return disks
+
+
+def _get_image_info(path, disk_type):
+    """Return the backing file and virtual size of a disk image."""
+    if disk_type == "qcow2":
+        return (libvirt_utils.get_disk_backing_file(path),
+                disk.get_disk_size(path))
+    return "", 0
+
+
+class DiskInventory(object):
+    """Cache of the file backed disks of domains, for the resource audit.
+
+    The disks of a domain are parsed from its xml once and forgotten
+    whenever the driver creates or destroys the domain or changes its
+    devices. The backing file and virtual size of a disk are kept as long
+    as its file keeps the same inode; only its allocated size is read again
+    each time, which is a single stat call. File mtimes are not used as
+    running guests write to their disks all the time.
+    """
+
+    def __init__(self):
+        self._disks = {}
+        self._images = {}
+
+    def invalidate(self, instance_name):
+        for path, _disk_type in self._disks.pop(instance_name, []):
+            self._images.pop(path, None)
+
+    def retain(self, instance_names):
+        """Forget the domains that are not among instance_names."""
+        for instance_name in set(self._disks) - set(instance_names):
+            self.invalidate(instance_name)
+
+    def get_disks(self, instance_name, get_file_disks):
+        disks = self._disks.get(instance_name)
+        if disks is None:
+            disks = self._disks[instance_name] = get_file_disks()
+        return disks
+
+    def get_sizes(self, path, disk_type):
+        """Return the allocated size, backing file and virtual size."""
+        stat = os.stat(path)
+        key = (stat.st_dev, stat.st_ino, disk_type)
+        cached = self._images.get(path)
+        if cached is None or cached[0] != key:
+            cached = self._images[path] = (key,
+                                           _get_image_info(path, disk_type))
+        backing_file, virt_size = cached[1]
+        return stat.st_size, backing_file, virt_size
+
+
+class DomainXMLCache(object):
+    """Parsed xml of domains, kept until their devices change.
+
+    A document is kept along with the id its domain had when it was read.
+    Domains get a new id every time they are started, so a domain restarted
+    behind the back of the driver has its xml read again. Devices attached
+    or detached through the driver are added to or removed from the cached
+    document instead of reading the whole xml again.
+    """
+
+    def __init__(self):
+        self._docs = {}
+
+    def get(self, instance_name, domain):
+        domain_id = domain.ID()
+        cached = self._docs.get(instance_name)
+        if cached is not None and cached[0] == domain_id:
+            return cached[1]
+        doc = etree.fromstring(domain.XMLDesc(0))
+        self._docs[instance_name] = (domain_id, doc)
+        return doc
+
+    def invalidate(self, instance_name):
+        self._docs.pop(instance_name, None)
+
+    def _devices(self, instance_name):
+        cached = self._docs.get(instance_name)
+        if cached is not None:
+            return cached[1].find('./devices')
+
+    def add_device(self, instance_name, element):
+        devices = self._devices(instance_name)
+        if devices is None:
+            self.invalidate(instance_name)
+        else:
+            devices.append(element)
+
+    def remove_device(self, instance_name, element):
+        devices = self._devices(instance_name)
+        if devices is None or element.getparent() is not devices:
+            self.invalidate(instance_name)
+        else:
+            devices.remove(element)
+
+
+class DomainStatsCollector(object):
+    """Statistics of the running domains, gathered in a single pass.
+
+    The vcpu and memory figures of all running domains are read with one
+    info() call per domain and kept for max_age seconds, so that the
+    driver methods called by one periodic task share the same pass. Domain
+    handles are kept across passes for as long as the domain keeps
+    running, which saves a lookup per domain and per pass.
+    """
+
+    def __init__(self, get_connection, max_age=2):
+        self._get_connection = get_connection
+        self.max_age = max_age
+        self._handles = {}
+        self._names = {}
+        self._stats = {}
+        self._collected_at = None
+
+    def _info(self, conn, domain_id):
+        domain = self._handles.get(domain_id)
+        if domain is not None:
+            try:
+                return domain, domain.info()
+            except libvirt.libvirtError as err:
+                if err.get_error_code() != libvirt.VIR_ERR_NO_DOMAIN:
+                    raise
+                # NOTE: The handle went stale, look the id up again.
+        domain = conn.lookupByID(domain_id)
+        return domain, domain.info()
+
+    def collect(self):
+        """Read the statistics of all running domains."""
+        conn = self._get_connection()
+        domain_ids = conn.listDomainsID() if conn.numOfDomains() else []
+        handles = {}
+        names = {}
+        stats = {}
+        for domain_id in domain_ids:
+            try:
+                domain, info = self._info(conn, domain_id)
+            except libvirt.libvirtError as err:
+                if err.get_error_code() == libvirt.VIR_ERR_NO_DOMAIN:
+                    LOG.debug(_("List of domains returned by libVirt: %s")
+                              % domain_ids)
+                    LOG.warn(_("libVirt can't find a domain with id: %s")
+                             % domain_id)
+                    continue
+                raise
+            name = domain.name()
+            handles[domain_id] = domain
+            names[name] = domain
+            stats[domain_id] = {'name': name,
+                                'memory_kb': int(info[2]),
+                                'vcpus': int(info[3])}
+            # NOTE(gtt116): give change to do other task.
+            greenthread.sleep(0)
+        self._handles = handles
+        self._names = names
+        self._stats = stats
+        self._collected_at = timeutils.utcnow_ts()
+        return stats
+
+    def get(self):
+        """Return the statistics of the last pass, if recent enough.
+
+        :returns: a dict of {'name', 'memory_kb', 'vcpus'} by domain id.
+        """
+        if (self._collected_at is None or
+            timeutils.utcnow_ts() - self._collected_at >= self.max_age):
+            return self.collect()
+        return self._stats
+
+    def lookup(self, instance_name):
+        """Return the handle of a running domain, or None."""
+        self.get()
+        return self._names.get(instance_name)
+
+
 class HostState(object):
     """Manages information about the compute node through libvirt."""
     def __init__(self, virtapi, read_only):
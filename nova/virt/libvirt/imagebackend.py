@@ -23,6 +23,7 @@ from nova.openstack.common import cfg
 from nova.openstack.common import excutils
 from nova.openstack.common import fileutils
 from nova.openstack.common import lockutils
+from nova.openstack.common import log as logging
 from nova import utils
 from nova.virt.disk import api as disk
 from nova.virt.libvirt import config as vconfig
@@ -43,11 +44,18 @@ __imagebackend_opts = [
             default=False,
             help='Create sparse logical volumes (with virtualsize)'
                  ' if this flag is set to True.'),
+    cfg.BoolOpt('libvirt_images_reflink',
+            default=True,
+            help='Create raw images as reflink clones of their base image'
+                 ' where the filesystem supports it, e.g. btrfs. Otherwise,'
+                 ' or if this flag is False, they are copied skipping holes'
+                 ' and runs of zeros.'),
         ]
 
 CONF = cfg.CONF
 CONF.register_opts(__imagebackend_opts)
 CONF.import_opt('base_dir_name', 'nova.virt.libvirt.imagecache')
+LOG = logging.getLogger(__name__)
 
 
 class Image(object):
@@ -150,7 +158,10 @@ class Raw(Image):
         @lockutils.synchronized(base, 'nova-', external=True,
                                 lock_path=self.lock_path)
         def copy_raw_image(base, target, size):
-            libvirt_utils.copy_image(base, target)
+            copied = libvirt_utils.clone_image(
+                base, target, reflink=CONF.libvirt_images_reflink)
+            LOG.debug(_('Created %(target)s from %(base)s, writing %(copied)d'
+                        ' bytes') % locals())
             if size:
                 disk.extend(target, size)
 
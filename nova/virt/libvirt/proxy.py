@@ -0,0 +1,289 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2013 OpenStack LLC.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Runs libvirt calls in native threads, off the eventlet hub.
+
+libvirt calls block in C until libvirtd answers. The proxies handed out
+here run every call of the wrapped object in a native thread. Read-only
+queries and calls that change domains or the host each have their own
+threads, so that a query never waits for a native thread busy with a slow
+call, and read-only queries time out. Calls that take minutes, like
+migrations and saves, run in the eventlet thread pool instead of taking
+one of the bounded call threads.
+"""
+
+import errno
+import fcntl
+import os
+import sys
+import time
+
+import eventlet
+from eventlet import event
+from eventlet import greenthread
+from eventlet import hubs
+from eventlet import patcher
+from eventlet import semaphore
+from eventlet import tpool
+
+from nova import exception
+from nova.openstack.common import cfg
+from nova.openstack.common import log as logging
+
+LOG = logging.getLogger(__name__)
+
+libvirt_proxy_opts = [
+    cfg.IntOpt('libvirt_max_concurrent_queries',
+               default=8,
+               help='Maximum number of read-only libvirt calls run at the '
+                    'same time when libvirt_nonblocking is set'),
+    cfg.IntOpt('libvirt_max_concurrent_calls',
+               default=4,
+               help='Maximum number of libvirt calls that change domains '
+                    'or the host run at the same time when '
+                    'libvirt_nonblocking is set, not counting migrations '
+                    'and saves'),
+    cfg.IntOpt('libvirt_query_timeout',
+               default=60,
+               help='Number of seconds to wait for a read-only libvirt '
+                    'call, 0 to wait forever. Calls that change domains '
+                    'or the host are always waited for'),
+    ]
+
+CONF = cfg.CONF
+CONF.register_opts(libvirt_proxy_opts)
+
+# NOTE: Calls that only read from libvirtd. Everything else is assumed to
+# change something, is never timed out and does not hold up queries.
+QUERY_METHODS = frozenset([
+    # virConnect
+    'compareCPU', 'getCapabilities', 'getHostname', 'getInfo',
+    'getLibVersion', 'getType', 'getVersion', 'listDefinedDomains',
+    'listDomainsID', 'lookupByID', 'lookupByName', 'numOfDomains',
+    'nwfilterLookupByName',
+    # virDomain
+    'ID', 'UUIDString', 'XMLDesc', 'blockInfo', 'blockJobInfo',
+    'blockStats', 'hasManagedSaveImage', 'info', 'interfaceStats',
+    'maxMemory', 'memoryStats', 'name', 'vcpus',
+])
+
+# NOTE: Calls that may take minutes. They are not bounded, so that a few
+# live migrations cannot hold up every other call that changes domains.
+LONG_RUNNING_METHODS = frozenset([
+    'coreDump', 'managedSave', 'migrate', 'migrate2', 'migrateToURI',
+    'migrateToURI2', 'restore', 'restoreFlags', 'save', 'saveFlags',
+])
+
+_threading = patcher.original('threading')
+_queue = patcher.original('Queue')
+
+
+class NativeThreadPool(object):
+    """A fixed number of native threads running calls for greenthreads.
+
+    Unlike the eventlet thread pool, which picks the native thread of a
+    call from the calling greenthread, a call runs on the first idle
+    thread of the pool. Threads are started on the first call.
+    """
+
+    def __init__(self, size):
+        self.size = size
+        self._requests = _queue.Queue()
+        self._responses = _queue.Queue()
+        self._started = False
+
+    def _start(self):
+        self._rpipe, self._wpipe = os.pipe()
+        flags = fcntl.fcntl(self._rpipe, fcntl.F_GETFL)
+        fcntl.fcntl(self._rpipe, fcntl.F_SETFL, flags | os.O_NONBLOCK)
+        for i in xrange(self.size):
+            thread = _threading.Thread(target=self._work)
+            thread.daemon = True
+            thread.start()
+        greenthread.spawn_n(self._dispatch)
+        self._started = True
+
+    def _work(self):
+        while True:
+            done, func, args, kwargs = self._requests.get()
+            try:
+                result = (None, func(*args, **kwargs))
+            except BaseException:
+                result = (sys.exc_info(), None)
+            self._responses.put((done, result))
+            os.write(self._wpipe, ' ')
+
+    def _dispatch(self):
+        # NOTE: A response is queued before its byte is written, so every
+        # response is found after the byte that announces it is read.
+        while True:
+            hubs.trampoline(self._rpipe, read=True)
+            try:
+                os.read(self._rpipe, 512)
+            except OSError as e:
+                if e.errno != errno.EAGAIN:
+                    raise
+            while True:
+                try:
+                    done, result = self._responses.get(block=False)
+                except _queue.Empty:
+                    break
+                done.send(result)
+
+    def execute(self, func, *args, **kwargs):
+        if not self._started:
+            self._start()
+        done = event.Event()
+        self._requests.put((done, func, args, kwargs))
+        exc_info, result = done.wait()
+        if exc_info:
+            raise exc_info[0], exc_info[1], exc_info[2]
+        return result
+
+
+class CallPool(object):
+    """Bounded execution of libvirt calls in native threads."""
+
+    def __init__(self, max_queries, max_calls, query_timeout):
+        self._query_slots = semaphore.Semaphore(max_queries)
+        self._call_slots = semaphore.Semaphore(max_calls)
+        self._query_threads = NativeThreadPool(max_queries)
+        self._call_threads = NativeThreadPool(max_calls)
+        self.query_timeout = query_timeout
+        self.metrics = {}
+
+    def _record(self, method, key, elapsed=None):
+        metrics = self.metrics.get(method)
+        if metrics is None:
+            metrics = self.metrics[method] = {'calls': 0, 'errors': 0,
+                                              'timeouts': 0, 'time': 0.0,
+                                              'max_time': 0.0}
+        metrics[key] += 1
+        if elapsed is not None:
+            metrics['time'] += elapsed
+            metrics['max_time'] = max(metrics['max_time'], elapsed)
+
+    def _run(self, slots, threads, method, func, args, kwargs):
+        # NOTE: Failures are handed back rather than raised, eventlet would
+        # log them as unhandled when raised by a spawned greenthread.
+        start = time.time()
+        try:
+            return None, threads.execute(func, *args, **kwargs)
+        except Exception:
+            self._record(method, 'errors')
+            return sys.exc_info(), None
+        finally:
+            if slots is not None:
+                slots.release()
+            self._record(method, 'calls', time.time() - start)
+
+    def execute(self, method, func, *args, **kwargs):
+        """Run func in a native thread and wait for its result.
+
+        Read-only calls give up with HypervisorCallTimeout after
+        query_timeout seconds, including the time spent waiting for a free
+        slot. The native thread cannot be interrupted; the call keeps its
+        slot until libvirtd eventually answers.
+        """
+        if method in QUERY_METHODS:
+            exc_info, result = self._query(method, func, args, kwargs)
+        elif method in LONG_RUNNING_METHODS:
+            exc_info, result = self._run(None, tpool, method, func, args,
+                                         kwargs)
+        else:
+            self._call_slots.acquire()
+            exc_info, result = self._run(self._call_slots, self._call_threads,
+                                         method, func, args, kwargs)
+        if exc_info:
+            raise exc_info[0], exc_info[1], exc_info[2]
+        return result
+
+    def _query(self, method, func, args, kwargs):
+        timeout = eventlet.Timeout(self.query_timeout or None)
+        try:
+            self._query_slots.acquire()
+            call = greenthread.spawn(self._run, self._query_slots,
+                                     self._query_threads, method, func, args,
+                                     kwargs)
+            return call.wait()
+        except eventlet.Timeout as t:
+            if t is not timeout:
+                raise
+            self._record(method, 'timeouts')
+            LOG.warn(_("libvirt call %(method)s did not return within "
+                       "%(seconds)s seconds") %
+                     {'method': method, 'seconds': self.query_timeout})
+            raise exception.HypervisorCallTimeout(method=method,
+                                                  timeout=self.query_timeout)
+        finally:
+            timeout.cancel()
+
+
+class Proxy(object):
+    """Runs the method calls of a libvirt object through a CallPool.
+
+    Results that are instances of the autowrap classes are wrapped in turn,
+    so that e.g. the domains looked up through a proxied connection are
+    proxied as well.
+    """
+
+    def __init__(self, obj, pool, autowrap=()):
+        self._obj = obj
+        self._pool = pool
+        self._autowrap = autowrap
+
+    def __getattr__(self, name):
+        attr = getattr(self._obj, name)
+        if not callable(attr):
+            return attr
+
+        def call(*args, **kwargs):
+            return wrap(self._pool, self._autowrap,
+                        self._pool.execute(name, attr, *args, **kwargs))
+        return call
+
+    def __str__(self):
+        return str(self._obj)
+
+    def __repr__(self):
+        return repr(self._obj)
+
+
+def wrap(pool, autowrap, obj):
+    if isinstance(obj, autowrap):
+        return Proxy(obj, pool, autowrap)
+    return obj
+
+
+_POOL = None
+
+
+def get_pool():
+    """Return the CallPool shared by all libvirt connections."""
+    global _POOL
+    if _POOL is None:
+        _POOL = CallPool(CONF.libvirt_max_concurrent_queries,
+                         CONF.libvirt_max_concurrent_calls,
+                         CONF.libvirt_query_timeout)
+    return _POOL
+
+
+def proxy_call(autowrap, func, *args, **kwargs):
+    """Call func in the shared pool, proxying an autowrap result."""
+    pool = get_pool()
+    return wrap(pool, autowrap,
+                pool.execute(func.__name__, func, *args, **kwargs))
@@ -19,6 +19,7 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import errno
 import os
 
 from lxml import etree
@@ -336,6 +337,48 @@ def copy_image(src, dest, host=None):
             execute('rsync', '--sparse', '--compress', src, dest)
 
 
+# NOTE: (source device, destination device) pairs reflinks are not
+# supported between.
+_NO_REFLINK_DEVICES = set()
+
+# NOTE: What cp reports when the filesystems can't share data, on older
+# kernels the clone ioctl is not known at all.
+_NO_REFLINK_ERRORS = [os.strerror(errno.EOPNOTSUPP),
+                      os.strerror(errno.ENOTTY),
+                      os.strerror(errno.EXDEV)]
+
+
+def clone_image(src, dest, reflink=True):
+    """Create a local copy of a disk image, writing as little as possible
+
+    A reflink clone, which shares all data with src, is tried first. On
+    filesystems without reflinks the image is copied, leaving holes for
+    the holes and runs of zeros of src.
+
+    :param src: Source image
+    :param dest: Destination path
+    :param reflink: Whether to try a reflink clone
+    :returns: Number of bytes written to dest
+    """
+    devices = (os.stat(src).st_dev,
+               os.stat(os.path.dirname(os.path.abspath(dest))).st_dev)
+    if reflink and devices not in _NO_REFLINK_DEVICES:
+        try:
+            execute('cp', '--reflink=always', src, dest)
+            return 0
+        except exception.ProcessExecutionError as exc:
+            LOG.debug(_('Could not clone %(src)s with a reflink, copying it: '
+                        '%(exc)s') % locals())
+            if any(error in (exc.stderr or '')
+                   for error in _NO_REFLINK_ERRORS):
+                _NO_REFLINK_DEVICES.add(devices)
+
+    # NOTE: cp looks for the holes of src itself, --sparse=always also
+    # punches holes in dest for the zeros it reads.
+    execute('cp', '--sparse=always', src, dest)
+    return os.stat(dest).st_blocks * 512
+
+
 def write_to_file(path, contents, umask=None):
     """Write the given contents to a file
 
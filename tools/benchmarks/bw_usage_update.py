@@ -0,0 +1,163 @@
+#!/usr/bin/env python
+
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2013 OpenStack LLC.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Time writing the bandwidth usage of a compute host polled by
+_poll_bandwidth_usage.
+
+The usage of every (instance, mac) pair of a host is written to a sqlite
+database, once with a bw_usage_update call per pair and once with a single
+bw_usage_update_bulk call, both for the first poll of an audit period,
+which creates the rows, and for the following polls, which update them.
+To model the network between nova and a MySQL server, every round trip is
+charged --latency milliseconds.
+
+Run like:
+
+    ./tools/benchmarks/bw_usage_update.py --instances 500 --macs 2
+"""
+
+import datetime
+import optparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+import sqlalchemy
+
+POSSIBLE_TOPDIR = os.path.normpath(os.path.join(os.path.abspath(sys.argv[0]),
+                                   os.pardir,
+                                   os.pardir,
+                                   os.pardir))
+if os.path.exists(os.path.join(POSSIBLE_TOPDIR, 'nova', '__init__.py')):
+    sys.path.insert(0, POSSIBLE_TOPDIR)
+
+from nova import context
+from nova.db.sqlalchemy import api as db_api
+from nova.db.sqlalchemy import models
+from nova.db.sqlalchemy import session
+
+
+ROUND_TRIPS = [0]
+LATENCY = [0.0]
+
+# NOTE: The index is created by the migrations, not by the models.
+_TABLE = models.BandwidthUsage.__table__
+sqlalchemy.Index('bw_usage_cache_uuid_start_period_idx',
+                 _TABLE.c.uuid, _TABLE.c.start_period)
+
+
+def statement_listener(conn, cursor, statement, parameters, context,
+                       executemany):
+    ROUND_TRIPS[0] += 1
+    if LATENCY[0]:
+        time.sleep(LATENCY[0])
+
+
+def make_engine(path):
+    engine = sqlalchemy.create_engine('sqlite:///%s' % path)
+    models.BASE.metadata.create_all(engine)
+    sqlalchemy.event.listen(engine, 'before_cursor_execute',
+                            statement_listener)
+    return engine
+
+
+def build_usages(instances, macs, poll):
+    usages = []
+    for i in xrange(instances):
+        for j in xrange(macs):
+            usages.append(dict(uuid='server-uuid-%d' % i,
+                               mac='fa:16:3e:%02x:%02x:%02x' % (
+                                   i / 256, i % 256, j),
+                               bw_in=poll * 1000, bw_out=poll * 2000,
+                               last_ctr_in=poll * 1000 + i,
+                               last_ctr_out=poll * 2000 + i))
+    return usages
+
+
+def update_each(ctxt, start_period, usages, refreshed):
+    for usage in usages:
+        db_api.bw_usage_update(ctxt, usage['uuid'], usage['mac'],
+                               start_period, usage['bw_in'],
+                               usage['bw_out'], usage['last_ctr_in'],
+                               usage['last_ctr_out'],
+                               last_refreshed=refreshed)
+
+
+def update_bulk(ctxt, start_period, usages, refreshed):
+    db_api.bw_usage_update_bulk(ctxt, start_period, usages,
+                                last_refreshed=refreshed)
+
+
+def timeit(func, ctxt, start_periods, usages, repeat):
+    best = None
+    for i in xrange(repeat):
+        ROUND_TRIPS[0] = 0
+        start = time.time()
+        func(ctxt, start_periods[i], usages, datetime.datetime.utcnow())
+        elapsed = time.time() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return best, ROUND_TRIPS[0]
+
+
+def main():
+    parser = optparse.OptionParser()
+    parser.add_option('--instances', type='int', default=500,
+                      help='number of instances on the host')
+    parser.add_option('--macs', type='int', default=2,
+                      help='number of network interfaces per instance')
+    parser.add_option('--latency', type='float', default=0.2,
+                      help='milliseconds charged for every round trip')
+    parser.add_option('--repeat', type='int', default=5,
+                      help='number of timed runs, the best one is reported')
+    options, args = parser.parse_args()
+    LATENCY[0] = options.latency / 1000
+
+    tmpdir = tempfile.mkdtemp()
+    try:
+        ctxt = context.get_admin_context()
+        usages = build_usages(options.instances, options.macs, 1)
+        print '%d instances with %d macs, %.2f ms per round trip, ' \
+              'best of %d runs' % (options.instances, options.macs,
+                                   options.latency, options.repeat)
+        for name, func in (('each', update_each), ('bulk', update_bulk)):
+            engine = make_engine(os.path.join(tmpdir, '%s.sqlite' % name))
+            session._MAKER = session.get_maker(engine)
+            # NOTE: Every run of the first poll writes a new audit period,
+            # so that all of its rows are created.
+            periods = [datetime.datetime(2013, 1, 1 + i)
+                       for i in xrange(options.repeat)]
+            first, first_trips = timeit(func, ctxt, periods, usages,
+                                        options.repeat)
+            periods = [periods[0]] * options.repeat
+            later, later_trips = timeit(func, ctxt, periods, usages,
+                                        options.repeat)
+            engine.dispose()
+            print '%-5s first poll %8.1f ms %5d round trips  ' \
+                  'later polls %8.1f ms %5d round trips' % (
+                      name, first * 1000, first_trips,
+                      later * 1000, later_trips)
+    finally:
+        shutil.rmtree(tmpdir)
+
+
+if __name__ == '__main__':
+    main()
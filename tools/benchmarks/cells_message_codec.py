@@ -0,0 +1,173 @@
+#!/usr/bin/env python
+
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2013 OpenStack LLC.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Time the encoding and decoding of instance_update_at_top cell messages.
+
+The messages are built the way a child cell sends them, with an instance
+that has system metadata, metadata, security groups and a network info
+cache, and each is encoded and decoded as plain JSON and compressed.
+
+Run like:
+
+    ./tools/benchmarks/cells_message_codec.py --messages 200 --repeat 10
+"""
+
+import datetime
+import optparse
+import os
+import sys
+import time
+
+POSSIBLE_TOPDIR = os.path.normpath(os.path.join(os.path.abspath(sys.argv[0]),
+                                   os.pardir,
+                                   os.pardir,
+                                   os.pardir))
+if os.path.exists(os.path.join(POSSIBLE_TOPDIR, 'nova', '__init__.py')):
+    sys.path.insert(0, POSSIBLE_TOPDIR)
+
+from nova.cells import codec as cells_codec
+from nova import context
+from nova.openstack.common import cfg
+from nova.openstack.common import jsonutils
+from nova.openstack.common import uuidutils
+
+CONF = cfg.CONF
+
+
+def build_instance(i):
+    now = datetime.datetime(2013, 2, 1, 12, 0, 0)
+    uuid = uuidutils.generate_uuid()
+    network_info = [{'id': uuidutils.generate_uuid(),
+                     'address': 'fa:16:3e:00:%02x:%02x' % (i / 256, i % 256),
+                     'network': {'id': uuidutils.generate_uuid(),
+                                 'bridge': 'br100',
+                                 'label': 'private',
+                                 'subnets': [{'cidr': '10.0.0.0/16',
+                                              'gateway': {'address':
+                                                          '10.0.0.1'},
+                                              'dns': [{'address':
+                                                       '8.8.8.8'}],
+                                              'ips': [{'address': '10.0.%d.%d'
+                                                       % (i / 256, i % 256),
+                                                       'type': 'fixed',
+                                                       'floating_ips': []}],
+                                              'routes': []}]}}]
+    sys_meta = {'instance_type_id': '2', 'instance_type_name': 'm1.small',
+                'instance_type_memory_mb': '2048',
+                'instance_type_vcpus': '1', 'instance_type_root_gb': '20',
+                'instance_type_ephemeral_gb': '0',
+                'instance_type_flavorid': '2', 'instance_type_swap': '0',
+                'instance_type_rxtx_factor': '1.0',
+                'instance_type_vcpu_weight': None,
+                'image_kernel_id': uuidutils.generate_uuid(),
+                'image_ramdisk_id': uuidutils.generate_uuid(),
+                'image_base_image_ref': uuidutils.generate_uuid()}
+    return {'id': i, 'uuid': uuid, 'created_at': now, 'updated_at': now,
+            'deleted_at': None, 'deleted': False,
+            'user_id': 'fake-user', 'project_id': 'fake-project',
+            'image_ref': uuidutils.generate_uuid(),
+            'kernel_id': '', 'ramdisk_id': '',
+            'hostname': 'server-%d' % i, 'host': 'compute%d' % (i % 50),
+            'node': 'compute%d.example.com' % (i % 50),
+            'launch_index': 0, 'key_name': 'default',
+            'key_data': 'ssh-rsa ' + 'A' * 372 + ' fake@example.com',
+            'power_state': 1, 'vm_state': 'active', 'task_state': None,
+            'memory_mb': 2048, 'vcpus': 1, 'root_gb': 20, 'ephemeral_gb': 0,
+            'instance_type_id': 2, 'user_data': None,
+            'reservation_id': 'r-%08x' % i, 'scheduled_at': now,
+            'launched_at': now, 'terminated_at': None,
+            'availability_zone': 'nova',
+            'display_name': 'server-%d' % i, 'display_description': None,
+            'launched_on': 'compute%d' % (i % 50), 'locked': False,
+            'os_type': 'linux', 'architecture': 'x86_64',
+            'vm_mode': None, 'root_device_name': '/dev/vda',
+            'default_ephemeral_device': None, 'default_swap_device': None,
+            'config_drive': '', 'access_ip_v4': None, 'access_ip_v6': None,
+            'auto_disk_config': False, 'progress': 0,
+            'shutdown_terminate': False, 'disable_terminate': False,
+            'cell_name': 'api-cell!child-cell1',
+            'metadata': [{'key': 'role', 'value': 'web'}],
+            'system_metadata': [{'key': key, 'value': value}
+                                for key, value in sys_meta.iteritems()],
+            'security_groups': [{'id': 1, 'name': 'default',
+                                 'description': 'default',
+                                 'user_id': 'fake-user',
+                                 'project_id': 'fake-project'}],
+            'info_cache': {'instance_uuid': uuid,
+                           'network_info': jsonutils.dumps(network_info)}}
+
+
+def build_messages(count):
+    ctxt = context.get_admin_context().to_dict()
+    messages = []
+    for i in xrange(count):
+        messages.append({'message_type': 'broadcast', 'ctxt': ctxt,
+                         'method_name': 'instance_update_at_top',
+                         'method_kwargs': {'instance': jsonutils.to_primitive(
+                                               build_instance(i))},
+                         'direction': 'up', 'need_response': False,
+                         'fanout': False,
+                         'uuid': uuidutils.generate_uuid(),
+                         'routing_path': 'api-cell!child-cell1',
+                         'hop_count': 1, 'max_hop_count': 10,
+                         'run_locally': False})
+    return messages
+
+
+def timeit(func, args, repeat):
+    best = None
+    for i in xrange(repeat):
+        start = time.time()
+        result = [func(arg) for arg in args]
+        elapsed = time.time() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return best, result
+
+
+def main():
+    parser = optparse.OptionParser()
+    parser.add_option('--messages', type='int', default=200,
+                      help='number of instance update messages')
+    parser.add_option('--compress-threshold', type='int', default=1024,
+                      help='compress messages larger than this many bytes')
+    parser.add_option('--repeat', type='int', default=10,
+                      help='number of timed runs, the best one is reported')
+    options, args = parser.parse_args()
+
+    CONF([], project='nova')
+    messages = build_messages(options.messages)
+    print '%d messages, best of %d runs' % (len(messages), options.repeat)
+    CONF.set_override('message_compress_threshold',
+                      options.compress_threshold, group='cells')
+    for compress in (False, True):
+        CONF.set_override('compress_messages', compress, group='cells')
+        encode_time, encoded = timeit(cells_codec.encode, messages,
+                                      options.repeat)
+        decode_time, decoded = timeit(cells_codec.decode, encoded,
+                                      options.repeat)
+        size = sum(len(e) for e in encoded) / len(encoded)
+        print '%-10s %6d bytes  encode %6.1f us  decode %6.1f us' % (
+            compress and 'compressed' or 'plain', size,
+            encode_time * 1000000 / len(messages),
+            decode_time * 1000000 / len(messages))
+
+
+if __name__ == '__main__':
+    main()
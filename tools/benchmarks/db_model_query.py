@@ -0,0 +1,207 @@
+#!/usr/bin/env python
+
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2013 OpenStack LLC.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Time the per query overhead of the DB layer connection listeners.
+
+Many small model_query calls are run against a pooled sqlite database,
+once with the listeners create_engine used to install for MySQL (a ping
+on every pool checkout) and sqlite (a REGEXP that compiles its pattern
+for every row), and once with the current ones.  To model the network
+between nova and a MySQL server, every round trip, pings included, is
+charged --latency milliseconds.
+
+Run like:
+
+    ./tools/benchmarks/db_model_query.py --queries 2000 --latency 0.2
+"""
+
+import optparse
+import os
+import re
+import shutil
+import sys
+import tempfile
+import time
+
+import sqlalchemy
+from sqlalchemy import pool
+
+POSSIBLE_TOPDIR = os.path.normpath(os.path.join(os.path.abspath(sys.argv[0]),
+                                   os.pardir,
+                                   os.pardir,
+                                   os.pardir))
+if os.path.exists(os.path.join(POSSIBLE_TOPDIR, 'nova', '__init__.py')):
+    sys.path.insert(0, POSSIBLE_TOPDIR)
+
+from nova import context
+from nova import db
+from nova.db.sqlalchemy import api as db_api
+from nova.db.sqlalchemy import models
+from nova.db.sqlalchemy import session
+
+
+ROUND_TRIPS = [0]
+LATENCY = [0.0]
+
+
+def round_trip():
+    ROUND_TRIPS[0] += 1
+    if LATENCY[0]:
+        time.sleep(LATENCY[0])
+
+
+class PingedConnection(object):
+    """Charges a round trip for the pings sent through a DBAPI connection."""
+
+    def __init__(self, dbapi_conn):
+        self.dbapi_conn = dbapi_conn
+
+    def cursor(self):
+        round_trip()
+        return self.dbapi_conn.cursor()
+
+    def __getattr__(self, name):
+        return getattr(self.dbapi_conn, name)
+
+
+def pinged(listener):
+    def wrapper(dbapi_conn, connection_rec, connection_proxy):
+        listener(PingedConnection(dbapi_conn), connection_rec,
+                 connection_proxy)
+    return wrapper
+
+
+def statement_listener(conn, cursor, statement, parameters, context,
+                       executemany):
+    round_trip()
+
+
+def legacy_ping_listener(dbapi_conn, connection_rec, connection_proxy):
+    dbapi_conn.cursor().execute('select 1')
+
+
+def legacy_regexp_listener(dbapi_con, con_record):
+    def regexp(expr, item):
+        reg = re.compile(expr)
+        return reg.search(unicode(item)) is not None
+    dbapi_con.create_function('regexp', 2, regexp)
+
+
+LISTENERS = {
+    'legacy': [('connect', legacy_regexp_listener),
+               ('checkout', pinged(legacy_ping_listener))],
+    'current': [('connect', session.add_regexp_listener),
+                ('checkin', session.last_used_listener),
+                ('checkout', pinged(session.ping_listener))],
+}
+
+
+def make_engine(path, mode):
+    engine = sqlalchemy.create_engine('sqlite:///%s' % path,
+                                      poolclass=pool.QueuePool)
+    for event, listener in LISTENERS[mode]:
+        sqlalchemy.event.listen(engine, event, listener)
+    sqlalchemy.event.listen(engine, 'before_cursor_execute',
+                            statement_listener)
+    return engine
+
+
+def populate(path, servers):
+    engine = sqlalchemy.create_engine('sqlite:///%s' % path)
+    models.BASE.metadata.create_all(engine)
+    db_session = session.get_maker(engine)()
+    with db_session.begin():
+        for i in xrange(servers):
+            instance = models.Instance()
+            instance.update({'uuid': 'server-uuid-%d' % i,
+                             'display_name': 'server-%d' % i,
+                             'project_id': 'project'})
+            db_session.add(instance)
+    engine.dispose()
+
+
+def small_queries(ctxt, count, servers):
+    for i in xrange(count):
+        db_api.model_query(ctxt, models.Instance).\
+                filter_by(uuid='server-uuid-%d' % (i % servers)).\
+                first()
+
+
+def regexp_queries(ctxt, count, servers):
+    # NOTE: The pattern is evaluated for every row but matches only one,
+    # so loading the results does not hide the cost of REGEXP.
+    for i in xrange(count):
+        db.instance_get_all_by_filters(ctxt, {'display_name': '^server-0$'})
+
+
+def timeit(func, ctxt, count, servers, repeat):
+    best = None
+    for i in xrange(repeat):
+        ROUND_TRIPS[0] = 0
+        start = time.time()
+        func(ctxt, count, servers)
+        elapsed = time.time() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return best, float(ROUND_TRIPS[0]) / count
+
+
+def main():
+    parser = optparse.OptionParser()
+    parser.add_option('--queries', type='int', default=2000,
+                      help='number of small queries per run')
+    parser.add_option('--servers', type='int', default=1000,
+                      help='number of instances in the database')
+    parser.add_option('--latency', type='float', default=0.2,
+                      help='milliseconds charged for every round trip')
+    parser.add_option('--repeat', type='int', default=5,
+                      help='number of timed runs, the best one is reported')
+    options, args = parser.parse_args()
+    LATENCY[0] = options.latency / 1000
+
+    tmpdir = tempfile.mkdtemp()
+    try:
+        path = os.path.join(tmpdir, 'nova.sqlite')
+        populate(path, options.servers)
+        ctxt = context.get_admin_context()
+        regexp_count = max(options.queries / 100, 1)
+
+        print '%d small queries and %d REGEXP queries over %d servers, ' \
+              '%.2f ms per round trip, best of %d runs' % (
+                  options.queries, regexp_count, options.servers,
+                  options.latency, options.repeat)
+        for mode in ('legacy', 'current'):
+            engine = make_engine(path, mode)
+            session._MAKER = session.get_maker(engine)
+            small, trips = timeit(small_queries, ctxt, options.queries,
+                                  options.servers, options.repeat)
+            regexp, _trips = timeit(regexp_queries, ctxt, regexp_count,
+                                    options.servers, options.repeat)
+            engine.dispose()
+            print '%-8s %8.1f us/query %5.2f round trips/query ' \
+                  '%8.2f ms/REGEXP query' % (
+                      mode, small * 1000000 / options.queries, trips,
+                      regexp * 1000 / regexp_count)
+    finally:
+        session._MAKER = None
+        shutil.rmtree(tmpdir)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,121 @@
+#!/usr/bin/env python
+
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2013 OpenStack LLC.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Time the policy checks of a GET /servers/detail request.
+
+Every server of the page is checked against the compute get rule and the
+authorizer of every extension that extends servers, using the policy file
+shipped in etc/nova.  The same checks are timed through the common policy
+engine directly, re-reading the policy file mtime and serializing the
+context on every call as nova.policy.enforce used to do.
+
+Run like:
+
+    ./tools/benchmarks/policy_enforce.py --servers 1000 --repeat 10
+"""
+
+import optparse
+import os
+import sys
+import time
+
+POSSIBLE_TOPDIR = os.path.normpath(os.path.join(os.path.abspath(sys.argv[0]),
+                                   os.pardir,
+                                   os.pardir,
+                                   os.pardir))
+if os.path.exists(os.path.join(POSSIBLE_TOPDIR, 'nova', '__init__.py')):
+    sys.path.insert(0, POSSIBLE_TOPDIR)
+
+from nova import context
+from nova import exception
+from nova.openstack.common import cfg
+from nova.openstack.common import policy as common_policy
+from nova import policy
+from nova import utils
+
+CONF = cfg.CONF
+
+ACTIONS = [
+    'compute:get',
+    'compute_extension:config_drive',
+    'compute_extension:disk_config',
+    'compute_extension:extended_server_attributes',
+    'compute_extension:extended_status',
+    'compute_extension:hide_server_addresses',
+    'compute_extension:keypairs',
+    'compute_extension:security_groups',
+]
+
+
+def legacy_enforce(ctxt, action, target):
+    utils.read_cached_file(policy._POLICY_PATH, policy._POLICY_CACHE,
+                           reload_func=policy._set_rules)
+    credentials = ctxt.to_dict()
+    return common_policy.check(action, target, credentials,
+                               exc=exception.PolicyNotAuthorized,
+                               action=action)
+
+
+def run(enforce, count):
+    # A new context per run, as every API request gets its own.
+    ctxt = context.RequestContext('user', 'project', roles=['member'])
+    for i in xrange(count):
+        target = {'project_id': 'project', 'user_id': 'user',
+                  'uuid': 'server-%d' % i}
+        for action in ACTIONS:
+            # Soft authorization, as done by soft_extension_authorizer
+            try:
+                enforce(ctxt, action, target)
+            except exception.NotAuthorized:
+                pass
+
+
+def timeit(enforce, count, repeat):
+    best = None
+    for i in xrange(repeat):
+        start = time.time()
+        run(enforce, count)
+        elapsed = time.time() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return best
+
+
+def main():
+    parser = optparse.OptionParser()
+    parser.add_option('--servers', type='int', default=1000,
+                      help='number of servers in the response')
+    parser.add_option('--repeat', type='int', default=10,
+                      help='number of timed runs, the best one is reported')
+    options, args = parser.parse_args()
+
+    CONF.set_override('policy_file', os.path.join(POSSIBLE_TOPDIR, 'etc',
+                                                  'nova', 'policy.json'))
+    policy.init()
+
+    print '%d servers, %d checks each, best of %d runs' % (
+        options.servers, len(ACTIONS), options.repeat)
+    for name, enforce in (('legacy', legacy_enforce),
+                          ('enforce', policy.enforce)):
+        elapsed = timeit(enforce, options.servers, options.repeat)
+        print '%-8s %8.2f ms' % (name, elapsed * 1000)
+
+
+if __name__ == '__main__':
+    main()
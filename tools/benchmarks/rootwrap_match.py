@@ -0,0 +1,121 @@
+#!/usr/bin/env python
+
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2013 OpenStack LLC.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Time rootwrap filter matching against the filters shipped in etc/nova.
+
+One command is built for every shipped filter, plus commands no filter
+allows, and each is matched through the plain list of loaded filters as
+nova-rootwrap does, and through the FilterIndex of nova-rootwrap-daemon.
+--copies loads the filter files several times over, to model sites that
+ship more filters.
+
+Run like:
+
+    ./tools/benchmarks/rootwrap_match.py --copies 4 --repeat 10
+"""
+
+import optparse
+import os
+import sys
+import time
+
+POSSIBLE_TOPDIR = os.path.normpath(os.path.join(os.path.abspath(sys.argv[0]),
+                                   os.pardir,
+                                   os.pardir,
+                                   os.pardir))
+if os.path.exists(os.path.join(POSSIBLE_TOPDIR, 'nova', '__init__.py')):
+    sys.path.insert(0, POSSIBLE_TOPDIR)
+
+from nova.openstack.common.rootwrap import filters
+from nova.openstack.common.rootwrap import wrapper
+from nova import rootwrap_daemon
+
+
+FILTERS_PATH = os.path.join(POSSIBLE_TOPDIR, 'etc', 'nova', 'rootwrap.d')
+EXEC_DIRS = ['/sbin', '/usr/sbin', '/bin', '/usr/bin']
+
+
+def build_commands(filterlist):
+    commands = []
+    for f in filterlist:
+        if isinstance(f, filters.DnsmasqFilter):
+            commands.append(['env', '%s=/etc/nova/nova.conf' %
+                             f.CONFIG_FILE_ARG, 'NETWORK_ID=1', 'dnsmasq',
+                             '--strict-order'])
+        elif isinstance(f, filters.KillFilter):
+            commands.append(['kill', '-9', str(os.getpid())])
+        elif isinstance(f, filters.ReadFileFilter):
+            commands.append(['cat', f.file_path])
+        else:
+            commands.append([os.path.basename(f.exec_path), 'arg'])
+    commands.extend([['rm', '-rf', '/'], ['sh', '-c', 'true'],
+                     ['python', '-c', 'pass']])
+    return commands
+
+
+def match_all(get_filters, commands):
+    matched = 0
+    for userargs in commands:
+        try:
+            wrapper.match_filter(get_filters(userargs), userargs,
+                                 exec_dirs=EXEC_DIRS)
+            matched += 1
+        except (wrapper.NoFilterMatched, wrapper.FilterMatchNotExecutable):
+            pass
+    return matched
+
+
+def timeit(get_filters, commands, repeat):
+    best = None
+    for i in xrange(repeat):
+        start = time.time()
+        matched = match_all(get_filters, commands)
+        elapsed = time.time() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return best, matched
+
+
+def main():
+    parser = optparse.OptionParser()
+    parser.add_option('--copies', type='int', default=1,
+                      help='number of times the filter files are loaded')
+    parser.add_option('--repeat', type='int', default=10,
+                      help='number of timed runs, the best one is reported')
+    options, args = parser.parse_args()
+
+    filterlist = wrapper.load_filters([FILTERS_PATH] * options.copies)
+    commands = build_commands(wrapper.load_filters([FILTERS_PATH]))
+
+    start = time.time()
+    index = rootwrap_daemon.FilterIndex(filterlist)
+    build = time.time() - start
+
+    print '%d filters, %d commands, best of %d runs' % (
+        len(filterlist), len(commands), options.repeat)
+    print 'index built in %.1f us' % (build * 1000000)
+    for mode, candidates in (('list', lambda userargs: filterlist),
+                             ('index', index.get_filters)):
+        elapsed, matched = timeit(candidates, commands, options.repeat)
+        print '%-6s %8.1f us/command %d matched' % (
+            mode, elapsed * 1000000 / len(commands), matched)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,128 @@
+#!/usr/bin/env python
+
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2013 OpenStack LLC.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Time the serialization of a GET /servers/detail response body.
+
+The server entries are copies of the all_extensions api sample, so the XML
+template carries the usual extension slave templates. Both content types
+are rendered the way the wsgi layer does it:
+
+    xml          compiled template (cached between requests)
+    xml-nocache  template recompiled for every request
+    json         JSONDictSerializer.serialize
+
+Run like:
+
+    ./tools/benchmarks/servers_detail.py --servers 1000 --repeat 10
+"""
+
+import json
+import optparse
+import os
+import sys
+import time
+
+POSSIBLE_TOPDIR = os.path.normpath(os.path.join(os.path.abspath(sys.argv[0]),
+                                   os.pardir,
+                                   os.pardir,
+                                   os.pardir))
+if os.path.exists(os.path.join(POSSIBLE_TOPDIR, 'nova', '__init__.py')):
+    sys.path.insert(0, POSSIBLE_TOPDIR)
+
+from nova.api.openstack.compute.contrib import config_drive
+from nova.api.openstack.compute.contrib import disk_config
+from nova.api.openstack.compute.contrib import extended_server_attributes
+from nova.api.openstack.compute.contrib import extended_status
+from nova.api.openstack.compute import servers
+from nova.api.openstack import wsgi
+from nova.api.openstack import xmlutil
+
+
+SAMPLE = os.path.join(POSSIBLE_TOPDIR, 'doc', 'api_samples',
+                      'all_extensions', 'servers-details-resp.json')
+
+
+def make_body(count):
+    with open(SAMPLE) as f:
+        server = json.load(f)['servers'][0]
+    body = []
+    for i in xrange(count):
+        entry = json.loads(json.dumps(server))
+        entry['id'] = '00000000-0000-0000-0000-%012d' % i
+        entry['name'] = 'server-%d' % i
+        body.append(entry)
+    return {'servers': body}
+
+
+def make_template():
+    template = servers.ServersTemplate()
+    for slave in (extended_status.ExtendedStatusesTemplate,
+                  extended_server_attributes.ExtendedServerAttributesTemplate,
+                  disk_config.ServersDiskConfigTemplate,
+                  config_drive.ServersConfigDriveTemplate):
+        template.attach(slave())
+    return template
+
+
+def xml(template, body):
+    return template.serialize(body)
+
+
+def xml_nocache(template, body):
+    xmlutil._compiled_cache.clear()
+    return template.serialize(body)
+
+
+def json_body(serializer, body):
+    return serializer.serialize(body)
+
+
+def timeit(func, arg, body, repeat):
+    best = None
+    for i in xrange(repeat):
+        start = time.time()
+        func(arg, body)
+        elapsed = time.time() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return best
+
+
+def main():
+    parser = optparse.OptionParser()
+    parser.add_option('--servers', type='int', default=1000,
+                      help='number of servers in the response')
+    parser.add_option('--repeat', type='int', default=10,
+                      help='number of timed runs, the best one is reported')
+    options, args = parser.parse_args()
+
+    body = make_body(options.servers)
+    template = make_template()
+    serializer = wsgi.JSONDictSerializer()
+
+    print '%d servers, best of %d runs' % (options.servers, options.repeat)
+    for name, func, arg in (('xml', xml, template),
+                            ('xml-nocache', xml_nocache, template),
+                            ('json', json_body, serializer)):
+        elapsed = timeit(func, arg, body, options.repeat)
+        print '%-12s %8.2f ms' % (name, elapsed * 1000)
+
+
+if __name__ == '__main__':
+    main()